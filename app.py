@@ -1,8 +1,14 @@
+import os
+import time
+import uuid
 import streamlit as st
-from dalle_image_generator import DalleImageGenerator
-from qr_code_generator import generate_qr_code
-import pyperclip
-from webcam_analyzer import WebcamAnalyzer
+from service_registry import get_webcam_analyzer, get_job_queue, get_gallery, get_image_generator, start_warmup
+from job_queue import QueueFullError, QUEUED, RUNNING, DONE, FAILED
+from models_config import load_settings
+from result_cache import ROUND_ROBIN, normalize_description
+from qr_code_generator import get_qr_settings
+from telemetry import set_request_id, increment
+from webcam_analyzer import features_look_complete
 
 st.set_page_config(
     page_title="Minecraft-style Character Generator",
@@ -10,15 +16,37 @@ st.set_page_config(
     layout="centered"
 )
 
+# The page's own settings below may come from .env, loaded once per process
+load_settings()
+
+# Seconds between status polls while a generation job is in flight
+JOB_POLL_INTERVAL = 0.5
+
+# Most candidates a guest can ask for in one generation
+MAX_CANDIDATES = int(os.getenv("MAX_CANDIDATES", 4))
+
+# Show the detected features as the vision model streams them
+VISION_STREAMING = os.getenv("VISION_STREAMING", "false").lower() == "true"
+
+# Queue the generation as soon as the streamed features look complete
+SPECULATIVE_GENERATION = os.getenv("SPECULATIVE_GENERATION", "false").lower() == "true"
+SPECULATIVE_TOKEN_BUDGET = int(os.getenv("SPECULATIVE_TOKEN_BUDGET", 180))
+
+# Thumbnails per row in the gallery
+GALLERY_COLUMNS = 4
+
+# Links are signed again this many seconds before they expire
+LINK_REFRESH_MARGIN = 300
+
 def main():
     st.title("⛏️ Minecraft Character Generator")
     st.write("Enter a description or use your webcam to generate a Minecraft-style character!")
     
-    # Initialize the image generator
-    image_generator = DalleImageGenerator()
+    # Get the shared generation job queue (built once per process)
+    job_queue = get_job_queue()
     
-    # Initialize the webcam analyzer
-    webcam_analyzer = WebcamAnalyzer()
+    # Get the shared webcam analyzer (built once per process)
+    webcam_analyzer = get_webcam_analyzer()
     
     # Store the last used description in session state
     if 'last_description' not in st.session_state:
@@ -39,13 +67,33 @@ def main():
     # Track if generation is in progress
     if 'generating' not in st.session_state:
         st.session_state.generating = False
+    
+    # Track the generation job being polled
+    if 'job_id' not in st.session_state:
+        st.session_state.job_id = None
+    
+    # Key of the session's gallery and vision cache entries, both live in process-wide stores
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    
+    # Track the gallery character shown in full
+    if 'selected' not in st.session_state:
+        st.session_state.selected = None
+    
+    # Let the guest ask for several candidates at once
+    if MAX_CANDIDATES > 1:
+        st.sidebar.slider("Candidates per generation", 1, MAX_CANDIDATES,
+                          value=min(int(os.getenv("CANDIDATES", 1)), MAX_CANDIDATES),
+                          key="candidates")
+    else:
+        st.session_state.candidates = 1
         
     # Handle regeneration from previous run
     if st.session_state.regenerate and st.session_state.last_description:
         st.session_state.regenerate = False
-        st.session_state.generating = True
-        generate_minecraft_image(st.session_state.last_description, image_generator)
-        st.session_state.generating = False
+        set_request_id()
+        # Ask for a different variant than the one already shown
+        submit_generation(st.session_state.last_description, job_queue, cache_policy=ROUND_ROBIN)
     
     # Process webcam image if it exists in session state
     if st.session_state.webcam_image is not None:
@@ -53,34 +101,35 @@ def main():
             # Get image bytes from session state
             image_bytes = st.session_state.webcam_image.getvalue()
             
+            # Trace the analysis and the generation it starts under one request ID
+            set_request_id()
+            
             # Set generating flag to true
             st.session_state.generating = True
             
             # Create a placeholder for features
             features_placeholder = st.empty()
             
-            # Show analyzing spinner
-            with st.spinner("Analyzing facial features..."):
-                # Analyze the image
-                features = webcam_analyzer.analyze_face(image_bytes)
-                
-                # Display features (will be removed later)
-                features_placeholder.success(f"Detected features: {features}")
+            if VISION_STREAMING:
+                # Show the features as they arrive, the generation is queued along the way
+                features = stream_features(webcam_analyzer, image_bytes, features_placeholder, job_queue)
+            else:
+                # Show analyzing spinner
+                with st.spinner("Analyzing facial features..."):
+                    # Analyze the image
+                    features = webcam_analyzer.analyze_face(image_bytes, session_id=st.session_state.session_id)
                 
-                # Use the features as the description
-                st.session_state.last_description = features
-                
-                # Log the features to console as well
-                print(f"Detected features: {features}")
+                # Queue the Minecraft character generation
+                submit_generation(features, job_queue)
             
-            # Generate the Minecraft character
-            generate_minecraft_image(features, image_generator)
+            # Display features (will be removed later)
+            features_placeholder.success(f"Detected features: {features}")
             
-            # Clear the features message after generation is complete
-            features_placeholder.empty()
+            # Use the features as the description
+            st.session_state.last_description = features
             
-            # Reset generating flag
-            st.session_state.generating = False
+            # Log the features to console as well
+            print(f"Detected features: {features}")
             
             # Clear the webcam image from session state
             st.session_state.webcam_image = None
@@ -92,6 +141,13 @@ def main():
             st.session_state.webcam_mode = False
             st.session_state.generating = False
     
+    # Show the status of the current generation job
+    polling = render_job(job_queue)
+    
+    # Show the latest or chosen character once no job is in flight
+    if st.session_state.job_id is None and st.session_state.selected is not None:
+        show_selected()
+    
     # Show webcam capture if in webcam mode
     if st.session_state.webcam_mode:
         webcam_image = st.camera_input("Take a picture")
@@ -116,6 +172,7 @@ def main():
         if description:
             # Copy the description to clipboard
             try:
+                import pyperclip
                 pyperclip.copy(description)
             except Exception as e:
                 print(f"Could not copy to clipboard: {str(e)}")
@@ -123,14 +180,10 @@ def main():
             # Store the description in session state
             st.session_state.last_description = description
             
-            # Set generating flag
-            st.session_state.generating = True
-            
-            # Generate image
-            generate_minecraft_image(description, image_generator)
-            
-            # Reset generating flag
-            st.session_state.generating = False
+            # Queue the generation and rerun to start polling
+            set_request_id()
+            if submit_generation(description, job_queue):
+                st.rerun()
 
     # Control buttons section
     st.text(" ")
@@ -157,31 +210,223 @@ def main():
             # Set webcam mode and trigger rerun
             st.session_state.webcam_mode = True
             st.rerun()
+    
+    # Earlier characters of this session
+    show_gallery()
+    
+    # Once the page is out, import the SDKs, connect and start the warm pool, sweeper
+    # and metrics exporter in the background (only the first run of the process does it)
+    start_warmup()
+    
+    # Keep polling while a job is in flight
+    if polling:
+        time.sleep(JOB_POLL_INTERVAL)
+        st.rerun()
 
-def generate_minecraft_image(description, image_generator):
-    with st.spinner(f"Generating your character..."):
-        try:
-            # Generate the image with frame included
-            result = image_generator.generate_minecraft_image(description)
+def submit_generation(description, job_queue, **options):
+    """Queue a generation job for the current session. Returns True if it was accepted."""
+    if st.session_state.candidates > 1:
+        options["candidates"] = st.session_state.candidates
+    
+    try:
+        job = job_queue.submit(description, **options)
+    except QueueFullError as e:
+        st.warning(f"⏳ {str(e)}")
+        st.session_state.generating = False
+        return False
+
+    # The session follows one job at a time, drop the one this replaces (e.g. candidates never picked)
+    previous_job_id = st.session_state.job_id
+    if previous_job_id is not None:
+        job_queue.cancel(previous_job_id)
+        job_queue.release(previous_job_id)
+
+    st.session_state.job_id = job.job_id
+    st.session_state.generating = True
+    return True
+
+def stream_features(webcam_analyzer, image_bytes, features_placeholder, job_queue):
+    """
+    Render the features in the placeholder as the vision model streams them, then queue the generation.
+    
+    With SPECULATIVE_GENERATION the job is queued as soon as the features look complete, and
+    replaced if the rest of the stream still changes them. Returns the final features.
+    """
+    text = ""
+    pieces = 0
+    speculative = None
+    speculative_job_id = None
+    
+    try:
+        for piece in webcam_analyzer.analyze_face_stream(image_bytes, session_id=st.session_state.session_id):
+            text += piece
+            pieces += 1
+            features_placeholder.info(f"Detecting features: {text}▌")
             
-            # Create two columns for displaying images side by side
+            if SPECULATIVE_GENERATION and speculative is None and features_look_complete(text, pieces, SPECULATIVE_TOKEN_BUDGET):
+                speculative = text.strip()
+                if submit_generation(speculative, job_queue):
+                    speculative_job_id = st.session_state.job_id
+    except Exception:
+        # Do not keep generating from an analysis that failed
+        if speculative_job_id is not None:
+            job_queue.cancel(speculative_job_id)
+            job_queue.release(speculative_job_id)
+            st.session_state.job_id = None
+        raise
+    
+    features = text.strip()
+    if speculative is None:
+        submit_generation(features, job_queue)
+    elif speculative_job_id is not None:
+        if normalize_description(speculative) == normalize_description(features):
+            increment("speculation_hits")
+        else:
+            # The features changed after the job was queued, generate from the final ones
+            increment("speculation_misses")
+            job_queue.cancel(speculative_job_id)
+            job_queue.release(speculative_job_id)
+            submit_generation(features, job_queue)
+    
+    return features
+
+def render_job(job_queue):
+    """Show the status of the session's job, and add its result to the gallery once it has finished. Returns True while it should be polled."""
+    job_id = st.session_state.job_id
+    if job_id is None:
+        return False
+    
+    job = job_queue.get_job(job_id)
+    
+    if job is None:
+        # The job expired before it was polled
+        st.session_state.job_id = None
+        st.session_state.generating = False
+    elif job.status == QUEUED:
+        st.info(f"⏳ Waiting in line... (position {job_queue.queue_position(job_id)})")
+    elif job.status == FAILED:
+        st.session_state.job_id = None
+        st.session_state.generating = False
+        job_queue.release(job_id)
+        st.error(f"Error generating image: {job.error}")
+    elif "candidates" in job.options:
+        show_candidates(job, job_queue)
+    elif job.status == RUNNING:
+        st.info("⛏️ Generating your character...")
+        
+        # Show the unframed image as soon as it has been downloaded
+        downloaded = job.partial.get("image_downloaded")
+        if downloaded is not None:
             col1, col2 = st.columns(2)
-            
             with col1:
-                # Display image directly from bytes without caption
-                st.image(result["image_bytes"], use_container_width=True)
-                st.markdown(f"<div style='text-align: center;'>Generated Character</div>", unsafe_allow_html=True)
-            
-            # Generate QR code for the blob URL
-            qr_bytes = generate_qr_code(result["blob_url"])
-            
-            with col2:
-                # Display QR code directly from bytes without caption
-                st.image(qr_bytes, use_container_width=True)
-                st.markdown(f"<div style='text-align: center;'>Scan QR Code or use this <a href='{result['blob_url']}' target='_blank'>direct link</a></div>", unsafe_allow_html=True)
-            
-        except Exception as e:
-            st.error(f"Error generating image: {str(e)}")
+                st.image(downloaded["image_bytes"], use_container_width=True)
+    elif job.status == DONE:
+        st.session_state.job_id = None
+        st.session_state.generating = False
+        add_to_gallery(job.result, job.description)
+        # The gallery has what it needs, drop the job's images
+        job_queue.release(job_id)
+    
+    return job is not None and not job.is_finished()
+
+def show_candidates(job, job_queue):
+    """Show every candidate ready so far, each with a button to pick it."""
+    # Stage payloads are dropped when the job finishes, its result then holds every candidate
+    candidates = list(job.result["candidates"] if job.status == DONE else job.partial.get("candidates", []))
+    
+    if job.status == RUNNING:
+        st.info(f"⛏️ Generating your characters... ({len(candidates)}/{job.options['candidates']} ready, pick one anytime)")
+    else:
+        # Every candidate is in, let the guest start something else while choosing
+        st.session_state.generating = False
+        st.info("⛏️ Pick your favorite character!")
+    
+    if candidates:
+        columns = st.columns(len(candidates))
+        for column, candidate in zip(columns, candidates):
+            with column:
+                st.image(candidate["image_bytes"], use_container_width=True)
+                st.button("✅ Pick", key=f"pick_{job.job_id}_{candidate['filename']}",
+                          use_container_width=True,
+                          on_click=pick_candidate, args=(job.job_id, candidate, job.description, job_queue))
+
+def pick_candidate(job_id, candidate, description, job_queue):
+    # Stop the candidates still being generated and show the chosen one
+    job_queue.cancel(job_id)
+    add_to_gallery(candidate, description)
+    job_queue.release(job_id)
+    st.session_state.job_id = None
+    st.session_state.generating = False
+
+def add_to_gallery(result, description):
+    """Add a finished character to the session's gallery and select it."""
+    link_expires_at = time.time() + get_image_generator().sas_expiry_hours * 3600 - LINK_REFRESH_MARGIN
+    get_gallery().add(st.session_state.session_id, result, description, link_expires_at)
+    st.session_state.selected = result["filename"]
+
+def select_entry(filename):
+    st.session_state.selected = filename
+
+def show_selected():
+    """Show the selected gallery character, loading its image from storage if it is no longer cached."""
+    gallery = get_gallery()
+    entry = gallery.get(st.session_state.session_id, st.session_state.selected)
+    if entry is None:
+        # Evicted to keep the gallery within its memory caps
+        st.session_state.selected = None
+        return
+    
+    generator = get_image_generator()
+    filename = entry["filename"]
+    
+    # Sign a new link for characters older than the link lifetime
+    if entry["link_expires_at"] < time.time():
+        link = generator.build_link(filename)
+        entry["blob_url"], entry["qr_bytes"] = link["blob_url"], link["qr_bytes"]
+        gallery.update_link(st.session_state.session_id, filename, link["blob_url"], link["qr_bytes"],
+                            time.time() + generator.sas_expiry_hours * 3600 - LINK_REFRESH_MARGIN)
+    
+    try:
+        image_bytes = gallery.load_image(filename, lambda: generator.load_display_image(filename))
+    except Exception as e:
+        st.error(f"Could not load this character: {str(e)}")
+        return
+    
+    show_result({"image_bytes": image_bytes, "qr_bytes": entry["qr_bytes"], "blob_url": entry["blob_url"]})
+
+def show_gallery():
+    """Show the session's characters as thumbnails, each with a button to show it in full."""
+    entries = get_gallery().entries(st.session_state.session_id)
+    if len(entries) < 2:
+        return
+    
+    st.subheader("🖼️ Your characters")
+    columns = st.columns(GALLERY_COLUMNS)
+    for index, entry in enumerate(entries):
+        with columns[index % GALLERY_COLUMNS]:
+            if entry["thumbnail_bytes"]:
+                st.image(entry["thumbnail_bytes"], use_container_width=True)
+            else:
+                st.caption(entry["description"])
+            st.button("👁️ Show", key=f"show_{entry['filename']}",
+                      use_container_width=True,
+                      disabled=st.session_state.generating or entry["filename"] == st.session_state.selected,
+                      on_click=select_entry, args=(entry["filename"],))
+
+def show_result(result):
+    # Create two columns for displaying images side by side
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        # Display image directly from bytes without caption
+        st.image(result["image_bytes"], use_container_width=True)
+        st.markdown(f"<div style='text-align: center;'>Generated Character</div>", unsafe_allow_html=True)
+    
+    with col2:
+        # Display QR code directly from bytes without caption, SVG codes are passed as markup
+        qr_image = result["qr_bytes"].decode("utf-8") if get_qr_settings()["format"] == "svg" else result["qr_bytes"]
+        st.image(qr_image, use_container_width=True)
+        st.markdown(f"<div style='text-align: center;'>Scan QR Code or use this <a href='{result['blob_url']}' target='_blank'>direct link</a></div>", unsafe_allow_html=True)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,205 @@
+"""
+Lifecycle management for uploaded images.
+Every upload is recorded in a local SQLite index with its size, prompt hash and SAS expiry;
+the sweeper deletes blobs whose links expired more than a grace period ago, in batches.
+Pinned uploads (batch packs, whose manifests keep pointing at them) are never swept.
+
+Usage:
+    python artifact_index.py report
+    python artifact_index.py sweep [--dry-run]
+"""
+import argparse
+import sqlite3
+import threading
+import time
+
+# Most blobs removed per delete call (the Azure batch API limit)
+DELETE_BATCH_SIZE = 256
+
+class ArtifactIndex:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    blob_name TEXT PRIMARY KEY,
+                    container TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    size INTEGER NOT NULL,
+                    prompt_hash TEXT,
+                    sas_expires_at REAL NOT NULL,
+                    deleted_at REAL,
+                    pinned INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            # Indexes created before pinning existed
+            columns = [row[1] for row in self._connection.execute("PRAGMA table_info(artifacts)")]
+            if "pinned" not in columns:
+                self._connection.execute("ALTER TABLE artifacts ADD COLUMN pinned INTEGER NOT NULL DEFAULT 0")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS artifacts_expiry ON artifacts (deleted_at, sas_expires_at)"
+            )
+
+    def record(self, blob_name, container, size, prompt_hash, sas_expires_at, pinned=False):
+        """Record a newly uploaded blob; pinned blobs are never returned by expired()."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?, NULL, ?)",
+                (blob_name, container, time.time(), size, prompt_hash, sas_expires_at, int(pinned))
+            )
+
+    def extend_expiry(self, blob_name, sas_expires_at, pinned=False):
+        """Push back a blob's expiry after a new link was signed for it, and pin it if asked (never unpins)."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE artifacts SET sas_expires_at = MAX(sas_expires_at, ?), pinned = MAX(pinned, ?) WHERE blob_name = ?",
+                (sas_expires_at, int(pinned), blob_name)
+            )
+
+    def expired(self, container, grace_seconds=0, limit=None):
+        """Return the names of live, unpinned blobs whose links expired more than grace_seconds ago."""
+        query = (
+            "SELECT blob_name FROM artifacts WHERE container = ? AND deleted_at IS NULL AND pinned = 0"
+            " AND sas_expires_at < ? ORDER BY sas_expires_at"
+        )
+        params = [container, time.time() - grace_seconds]
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        with self._lock:
+            return [row[0] for row in self._connection.execute(query, params)]
+
+    def mark_deleted(self, blob_names):
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "UPDATE artifacts SET deleted_at = ? WHERE blob_name = ?",
+                [(time.time(), name) for name in blob_names]
+            )
+
+    def usage_report(self, container=None):
+        """
+        Summarize storage usage.
+
+        Returns:
+            dict: live/deleted counts and bytes, bytes added in the last day and week, and the average daily growth
+        """
+        where = "WHERE container = ?" if container else ""
+        params = [container] if container else []
+        now = time.time()
+
+        with self._lock:
+            row = self._connection.execute(f"""
+                SELECT
+                    COUNT(CASE WHEN deleted_at IS NULL THEN 1 END),
+                    COALESCE(SUM(CASE WHEN deleted_at IS NULL THEN size END), 0),
+                    COUNT(deleted_at),
+                    COALESCE(SUM(CASE WHEN deleted_at IS NOT NULL THEN size END), 0),
+                    COALESCE(SUM(CASE WHEN created_at >= ? THEN size END), 0),
+                    COALESCE(SUM(CASE WHEN created_at >= ? THEN size END), 0),
+                    MIN(created_at)
+                FROM artifacts {where}
+            """, [now - 86400, now - 7 * 86400] + params).fetchone()
+
+        live_count, live_bytes, deleted_count, deleted_bytes, last_day_bytes, last_week_bytes, first_created = row
+        days = max((now - first_created) / 86400, 1.0) if first_created else 1.0
+
+        return {
+            "live_count": live_count,
+            "live_bytes": live_bytes,
+            "deleted_count": deleted_count,
+            "deleted_bytes": deleted_bytes,
+            "last_day_bytes": last_day_bytes,
+            "last_week_bytes": last_week_bytes,
+            "average_daily_bytes": (live_bytes + deleted_bytes) / days
+        }
+
+def sweep(index, storage, grace_seconds=0, batch_size=DELETE_BATCH_SIZE, dry_run=False):
+    """
+    Delete blobs whose links expired more than grace_seconds ago.
+
+    Args:
+        index (ArtifactIndex): The artifact index
+        storage (StorageBackend): Storage holding the blobs
+        grace_seconds (float): Extra time kept after a link expires
+        batch_size (int): Blobs deleted per call
+        dry_run (bool): Only report what would be deleted
+
+    Returns:
+        int: Number of blobs deleted (or that would be deleted), failed batches excluded
+    """
+    expired = index.expired(storage.container_name, grace_seconds)
+    if dry_run:
+        return len(expired)
+
+    deleted = 0
+    for start in range(0, len(expired), batch_size):
+        batch = expired[start:start + batch_size]
+        # A failed batch stays live in the index and is retried by the next sweep
+        try:
+            storage.delete_blobs(batch)
+        except Exception as e:
+            print(f"Failed to delete {len(batch)} expired blobs from {storage.container_name}: {e}")
+            continue
+        index.mark_deleted(batch)
+        deleted += len(batch)
+
+    if deleted:
+        print(f"Swept {deleted} expired blobs from {storage.container_name}")
+    return deleted
+
+class ArtifactSweeper:
+    """Runs sweep() periodically in a background thread."""
+    def __init__(self, index, storage, interval_seconds=3600, grace_seconds=24 * 3600):
+        self.index = index
+        self.storage = storage
+        self.interval_seconds = interval_seconds
+        self.grace_seconds = grace_seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="artifact-sweeper", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                sweep(self.index, self.storage, self.grace_seconds)
+            except Exception as e:
+                print(f"Artifact sweep failed: {e}")
+
+def _format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.1f} {unit}"
+        size /= 1024
+
+def main():
+    parser = argparse.ArgumentParser(description="Report on and clean up uploaded images")
+    parser.add_argument("command", choices=["report", "sweep"])
+    parser.add_argument("--container", default="minecraft")
+    parser.add_argument("--dry-run", action="store_true", help="Only count the blobs that would be deleted")
+    args = parser.parse_args()
+
+    from service_registry import get_artifact_index, get_blob_client, get_sweep_grace_seconds
+
+    index = get_artifact_index()
+
+    if args.command == "sweep":
+        count = sweep(index, get_blob_client(args.container), get_sweep_grace_seconds(), dry_run=args.dry_run)
+        print(f"{'Would delete' if args.dry_run else 'Deleted'} {count} expired blobs")
+
+    report = index.usage_report(args.container)
+    print(f"Live: {report['live_count']} blobs, {_format_bytes(report['live_bytes'])}")
+    print(f"Deleted: {report['deleted_count']} blobs, {_format_bytes(report['deleted_bytes'])}")
+    print(f"Added in the last day: {_format_bytes(report['last_day_bytes'])}, last week: {_format_bytes(report['last_week_bytes'])}")
+    print(f"Average growth: {_format_bytes(report['average_daily_bytes'])}/day")
+
+if __name__ == "__main__":
+    main()
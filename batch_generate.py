@@ -0,0 +1,212 @@
+"""
+Headless batch generation of Minecraft characters.
+
+Reads prompts from a JSONL, CSV or plain text file (or stdin), generates, frames and uploads
+each character with bounded concurrency and rate limiting, and appends every result to a
+manifest so an interrupted run can be resumed.
+
+Usage:
+    python batch_generate.py prompts.jsonl --output-dir packs/halloween --concurrency 2 --rate 5
+    cat prompts.txt | python batch_generate.py - --format txt
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from result_cache import FRESH
+from qr_code_generator import get_qr_settings
+from telemetry import set_request_id
+
+# Default lifetime of a pack's links: a month
+DEFAULT_LINK_HOURS = 30 * 24
+
+class RateLimiter:
+    """Spaces calls at least 60/rate_per_minute seconds apart across threads."""
+    def __init__(self, rate_per_minute):
+        self.interval = 60.0 / rate_per_minute if rate_per_minute else 0.0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+def read_prompts(source, input_format=None):
+    """
+    Read prompt records from a file path or '-' for stdin.
+
+    Returns:
+        list: dicts with "id" and "prompt"; ids default to the 1-based position in the input
+    """
+    if input_format is None:
+        extension = os.path.splitext(source)[1].lower().lstrip(".")
+        input_format = extension if extension in ("jsonl", "csv") else "txt"
+
+    stream = sys.stdin if source == "-" else open(source, "r", encoding="utf-8", newline="")
+    try:
+        if input_format == "jsonl":
+            rows = [json.loads(line) for line in stream if line.strip()]
+        elif input_format == "csv":
+            rows = list(csv.DictReader(stream))
+        else:
+            rows = [{"prompt": line.strip()} for line in stream if line.strip()]
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+
+    records = []
+    for index, row in enumerate(rows, start=1):
+        prompt = row.get("prompt") or row.get("description")
+        if not prompt:
+            raise ValueError(f"Input row {index} has no 'prompt' or 'description'")
+        records.append({"id": str(row.get("id") or f"{index:05d}"), "prompt": prompt})
+    return records
+
+def load_completed(manifest_path):
+    """Return the ids already completed in an existing manifest."""
+    completed = set()
+    if not os.path.exists(manifest_path):
+        return completed
+
+    with open(manifest_path, "r", encoding="utf-8") as manifest:
+        for line in manifest:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A line cut short by an interruption
+                continue
+            if entry.get("status") == "done":
+                completed.add(entry["id"])
+    return completed
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def run_batch(records, generator, output_dir, manifest_path, concurrency=2, rate_per_minute=5, add_frame=True, cache_policy=FRESH):
+    """
+    Generate every record not yet completed in the manifest.
+
+    Returns:
+        dict: counts of done/failed/skipped items, wall time and per-item latencies
+    """
+    qr_dir = os.path.join(output_dir, "qr")
+    os.makedirs(qr_dir, exist_ok=True)
+
+    completed = load_completed(manifest_path)
+    pending = [record for record in records if record["id"] not in completed]
+    print(f"{len(records)} prompts, {len(records) - len(pending)} already done, {len(pending)} to generate")
+
+    limiter = RateLimiter(rate_per_minute)
+    manifest_lock = threading.Lock()
+    latencies = []
+    failed = 0
+
+    def process(record):
+        limiter.wait()
+        set_request_id(record["id"])
+        start = time.perf_counter()
+        try:
+            result = generator.generate_minecraft_image(record["prompt"], add_frame=add_frame, cache_policy=cache_policy)
+            qr_path = os.path.join(qr_dir, f"{record['id']}.{get_qr_settings()['format']}")
+            with open(qr_path, "wb") as file:
+                file.write(result["qr_bytes"])
+            entry = {
+                "status": "done",
+                "blob_url": result["blob_url"],
+                "filename": result["filename"],
+                "qr_path": qr_path,
+                "timings": result["timings"]
+            }
+        except Exception as e:
+            entry = {"status": "failed", "error": str(e)}
+        entry.update(id=record["id"], prompt=record["prompt"], elapsed=time.perf_counter() - start)
+        return entry
+
+    start = time.perf_counter()
+    with open(manifest_path, "a", encoding="utf-8") as manifest:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(process, record) for record in pending]
+            for future in as_completed(futures):
+                entry = future.result()
+                with manifest_lock:
+                    manifest.write(json.dumps(entry) + "\n")
+                    manifest.flush()
+
+                if entry["status"] == "done":
+                    latencies.append(entry["elapsed"])
+                    print(f"[{entry['id']}] done in {entry['elapsed']:.1f}s: {entry['blob_url']}")
+                else:
+                    failed += 1
+                    print(f"[{entry['id']}] failed: {entry['error']}")
+
+    return {
+        "done": len(latencies),
+        "failed": failed,
+        "skipped": len(records) - len(pending),
+        "wall_seconds": time.perf_counter() - start,
+        "latencies": latencies
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate Minecraft characters in bulk")
+    parser.add_argument("input", help="Prompt file (.jsonl, .csv or .txt), or '-' for stdin")
+    parser.add_argument("--format", choices=["jsonl", "csv", "txt"], help="Input format, guessed from the extension by default")
+    parser.add_argument("--output-dir", default="batch_output", help="Directory for QR codes and the manifest")
+    parser.add_argument("--manifest", help="Results manifest, <output-dir>/manifest.jsonl by default")
+    parser.add_argument("--concurrency", type=int, default=2, help="Generations running at the same time")
+    parser.add_argument("--rate", type=float, default=5, help="Maximum generations started per minute, 0 for no limit")
+    parser.add_argument("--no-frame", action="store_true", help="Upload the images without the frame")
+    parser.add_argument("--cache-policy", default=FRESH, help="Result cache policy: cache, round_robin or fresh")
+    parser.add_argument("--link-hours", type=float, default=DEFAULT_LINK_HOURS,
+                        help="Lifetime of the links in the manifest and the QR codes, SAS_EXPIRY_HOURS is only meant for guests")
+    args = parser.parse_args()
+
+    from service_registry import get_image_generator, get_metrics_exporter
+
+    records = read_prompts(args.input, args.format)
+    manifest_path = args.manifest or os.path.join(args.output_dir, "manifest.jsonl")
+    os.makedirs(os.path.dirname(manifest_path) or ".", exist_ok=True)
+
+    # A pack's QR codes are printed or shown long after the run: sign its links for --link-hours
+    # and keep its images, new or served from the result cache, out of the sweeper
+    generator = get_image_generator()
+    generator.sas_expiry_hours = args.link_hours
+    generator.pin_uploads = True
+
+    summary = run_batch(
+        records,
+        generator,
+        args.output_dir,
+        manifest_path,
+        concurrency=args.concurrency,
+        rate_per_minute=args.rate,
+        add_frame=not args.no_frame,
+        cache_policy=args.cache_policy
+    )
+
+    wall = summary["wall_seconds"]
+    print(f"\nDone: {summary['done']}, failed: {summary['failed']}, skipped: {summary['skipped']} in {wall:.1f}s")
+    if summary["latencies"]:
+        print(f"Throughput: {summary['done'] / wall * 60:.1f} characters/min")
+        print(f"Latency p50: {percentile(summary['latencies'], 0.5):.1f}s, p95: {percentile(summary['latencies'], 0.95):.1f}s")
+    print(f"Manifest: {manifest_path}")
+
+    # Write the final metrics, the exporter only runs periodically
+    exporter = get_metrics_exporter()
+    if exporter is not None:
+        exporter.stop()
+        print(f"Metrics: {exporter.path}")
+
+    return 1 if summary["failed"] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+"""
+Benchmark of the output encodings offered by ImageEncoder on the real frame.
+Reports encode time and size for every format.
+
+Run from the repository root:
+    python -m benchmarks.encode_benchmark [--iterations 5]
+"""
+import argparse
+import io
+import time
+from image_encoder import ImageEncoder
+from image_frame_processor import ImageFrameProcessor
+from benchmarks.frame_benchmark import FRAME_PATH, make_sample_image
+
+ENCODERS = [
+    ("png (level 9)", ImageEncoder("png", compress_level=9)),
+    ("png (level 6)", ImageEncoder("png", compress_level=6)),
+    ("png (level 1)", ImageEncoder("png", compress_level=1)),
+    ("webp q85", ImageEncoder("webp", quality=85)),
+    ("webp <=300KB", ImageEncoder("webp", quality=85, max_bytes=300 * 1024)),
+    ("jpeg q85 progressive", ImageEncoder("jpeg", quality=85)),
+    ("jpeg <=300KB", ImageEncoder("jpeg", quality=85, max_bytes=300 * 1024)),
+]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image encodings")
+    parser.add_argument("--iterations", type=int, default=5)
+    args = parser.parse_args()
+
+    framed = ImageFrameProcessor().frame_image(io.BytesIO(make_sample_image()), FRAME_PATH)
+
+    print(f"{'encoding':<22} {'mean (ms)':>10} {'size (KB)':>10}")
+    for name, encoder in ENCODERS:
+        timings = []
+        for _ in range(args.iterations):
+            start = time.perf_counter()
+            encoded = encoder.encode(framed)
+            timings.append(time.perf_counter() - start)
+        print(f"{name:<22} {sum(timings) / len(timings) * 1000:>10.1f} {encoded.size / 1024:>10.1f}")
+
+    preview = ImageEncoder(preview_max_edge=512).encode_preview(framed)
+    print(f"{'preview 512px jpeg':<22} {'':>10} {preview.size / 1024:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Micro-benchmark for ImageFrameProcessor.add_frame.
+Compares the original per-request framing against the cached frame assets.
+
+Run from the repository root:
+    python -m benchmarks.frame_benchmark [--iterations 20] [--resample bicubic]
+"""
+import argparse
+import io
+import multiprocessing
+import os
+import resource
+import time
+from PIL import Image
+from image_frame_processor import ImageFrameProcessor
+
+FRAME_PATH = "frames/frame1.png"
+
+def legacy_add_frame(image_bytes, frame_path):
+    # The framing code as it was before frame assets were cached
+    base_image = Image.open(image_bytes).convert("RGBA")
+    frame = Image.open(frame_path).convert("RGBA")
+    frame_width, frame_height = 1705, 1705
+    hole_width, hole_height = 1400, 1400
+    if frame.size != (frame_width, frame_height):
+        frame = frame.resize((frame_width, frame_height))
+    base_image = base_image.resize((hole_width, hole_height))
+    result = Image.new("RGBA", (frame_width, frame_height), (0, 0, 0, 0))
+    x_offset = (frame_width - hole_width) // 2
+    y_offset = (frame_height - hole_height) // 2
+    result.paste(base_image, (x_offset, y_offset))
+    result = Image.alpha_composite(result, frame)
+    final_image = result.convert("RGB")
+    result_bytes = io.BytesIO()
+    final_image.save(result_bytes, format="PNG")
+    result_bytes.seek(0)
+    return result_bytes
+
+def make_sample_image():
+    """Return a 1024x1024 noisy PNG, similar in size to a DALL-E result."""
+    image = Image.frombytes("RGB", (1024, 1024), os.urandom(1024 * 1024 * 3))
+    sample = io.BytesIO()
+    image.save(sample, format="PNG")
+    return sample.getvalue()
+
+def run_variant(name, iterations, resample, results):
+    sample = make_sample_image()
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    if name == "legacy":
+        add_frame = legacy_add_frame
+        setup = 0.0
+    else:
+        start = time.perf_counter()
+        processor = ImageFrameProcessor(resample=resample)
+        setup = time.perf_counter() - start
+        add_frame = processor.add_frame
+
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        add_frame(io.BytesIO(sample), FRAME_PATH)
+        timings.append(time.perf_counter() - start)
+
+    rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results[name] = {
+        "setup": setup,
+        "mean": sum(timings) / len(timings),
+        "min": min(timings),
+        # ru_maxrss is reported in kilobytes on Linux
+        "peak_mb": (rss_after - rss_before) / 1024
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image framing")
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--resample", default="bicubic")
+    args = parser.parse_args()
+
+    # Each variant runs in its own process so peak memory is measured independently
+    manager = multiprocessing.Manager()
+    results = manager.dict()
+    for name in ("legacy", "cached"):
+        process = multiprocessing.Process(target=run_variant, args=(name, args.iterations, args.resample, results))
+        process.start()
+        process.join()
+
+    print(f"{'variant':<8} {'setup (ms)':>11} {'mean (ms)':>10} {'min (ms)':>9} {'peak growth (MB)':>17}")
+    for name in ("legacy", "cached"):
+        r = results[name]
+        print(f"{name:<8} {r['setup'] * 1000:>11.1f} {r['mean'] * 1000:>10.1f} {r['min'] * 1000:>9.1f} {r['peak_mb']:>17.1f}")
+
+if __name__ == "__main__":
+    main()
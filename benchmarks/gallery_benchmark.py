@@ -0,0 +1,97 @@
+"""
+Memory check of the session gallery during a long event.
+Frames a sample character, times its thumbnail, then simulates many sessions each generating
+several characters through a job queue, as the app does. Compares the bytes held by the
+gallery (thumbnail index plus the shared image cache) and by the job queue with keeping every
+session's displayed images, and reports how often reopening a character needs a download.
+
+Run from the repository root:
+    python -m benchmarks.gallery_benchmark [--sessions 200] [--per-session 6] [--preview-max-edge 0] [--no-release]
+"""
+import argparse
+import io
+import random
+import time
+import uuid
+from benchmarks.frame_benchmark import FRAME_PATH, make_sample_image
+from gallery import GalleryStore
+from image_encoder import ImageEncoder
+from image_frame_processor import ImageFrameProcessor
+from job_queue import JobQueue
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the gallery's memory caps with simulated sessions")
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--per-session", type=int, default=6, help="Characters generated per session")
+    parser.add_argument("--reopen-rate", type=float, default=0.3, help="Share of generations followed by reopening an earlier character")
+    parser.add_argument("--preview-max-edge", type=int, default=0, help="PREVIEW_MAX_EDGE, 0 displays the full image")
+    parser.add_argument("--thumbnail-max-edge", type=int, default=160)
+    parser.add_argument("--no-release", action="store_true", help="Keep finished jobs until their TTL, as before jobs were released")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    encoder = ImageEncoder(preview_max_edge=args.preview_max_edge, thumbnail_max_edge=args.thumbnail_max_edge)
+    framed = ImageFrameProcessor().frame_image(io.BytesIO(make_sample_image()), FRAME_PATH)
+    full = encoder.encode(framed).image_bytes.getvalue()
+    preview = encoder.encode_preview(framed)
+    display = preview.image_bytes.getvalue() if preview is not None else full
+
+    start = time.perf_counter()
+    thumbnail = encoder.encode_thumbnail(framed).image_bytes.getvalue()
+    thumbnail_ms = (time.perf_counter() - start) * 1000
+    print(f"Framed image {framed.size[0]}x{framed.size[1]}: {len(full) / 1024:.0f} KB, displayed {len(display) / 1024:.0f} KB, "
+          f"thumbnail {len(thumbnail) / 1024:.1f} KB in {thumbnail_ms:.1f} ms")
+
+    rng = random.Random(args.seed)
+    store = GalleryStore()
+    qr = bytes(800)
+    downloads = 0
+
+    def handler(job):
+        # What the generation job holds: the downloaded image while running, the displayed one as its result
+        job.partial["image_downloaded"] = {"image_bytes": full}
+        filename = f"minecraft_{uuid.uuid4().hex}.png"
+        return {"filename": filename, "blob_url": "https://example.blob.core.windows.net/minecraft/" + filename + "?sig=" + "x" * 120,
+                "qr_bytes": qr, "thumbnail_bytes": thumbnail, "image_bytes": display}
+
+    job_queue = JobQueue(handler, num_workers=1, max_queue_size=10)
+
+    def download():
+        nonlocal downloads
+        downloads += 1
+        return display
+
+    # Sessions overlap: each generation goes to a random session that still has characters to make
+    remaining = {uuid.uuid4().hex: args.per_session for _ in range(args.sessions)}
+    peak = 0
+    queue_peak = 0
+    while remaining:
+        session_id = rng.choice(list(remaining))
+        job = job_queue.submit("a character generated during the benchmark")
+        while not job.is_finished():
+            time.sleep(0.001)
+        store.add(session_id, job.result, job.description, time.time() + 3600)
+        if not args.no_release:
+            job_queue.release(job.job_id)
+        queue_peak = max(queue_peak, job_queue.retained_bytes())
+
+        entries = store.entries(session_id)
+        if len(entries) > 1 and rng.random() < args.reopen_rate:
+            store.load_image(rng.choice(entries[1:])["filename"], download)
+
+        stats = store.stats()
+        peak = max(peak, stats["index_bytes"] + stats["image_bytes"])
+        remaining[session_id] -= 1
+        if not remaining[session_id]:
+            del remaining[session_id]
+
+    stats = store.stats()
+    naive = args.sessions * args.per_session * (len(display) + len(qr))
+    print(f"\nGallery: {stats}")
+    print(f"Peak held by the gallery: {peak / 2 ** 20:.1f} MB, per session {peak / args.sessions / 1024:.0f} KB")
+    print(f"Peak held by finished jobs in the job queue: {queue_peak / 2 ** 20:.1f} MB")
+    print(f"Keeping every displayed image per session: {naive / 2 ** 20:.1f} MB")
+    print(f"Downloads from storage when reopening: {downloads}")
+
+if __name__ == "__main__":
+    main()
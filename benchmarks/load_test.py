@@ -0,0 +1,197 @@
+"""
+Offline load test of the generation pipeline.
+Runs the vision analysis, the full DALL-E pipeline, framing/encoding and QR rendering at a
+controlled concurrency against local mock endpoints and in-memory storage, and reports
+throughput, latency percentiles, CPU and memory per scenario, plus the per-stage latencies
+recorded by telemetry. No Azure quota is used.
+
+Run from the repository root:
+    python -m benchmarks.load_test [--requests 40] [--concurrency 4] [--throttle-rate 0.05] [--json results.json]
+"""
+import argparse
+import io
+import json
+import os
+import resource
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from benchmarks.mock_services import LatencyModel, start_mock_services
+from benchmarks.frame_benchmark import FRAME_PATH, make_sample_image
+from benchmarks.vision_payload_benchmark import make_capture
+
+SCENARIOS = ["vision", "vision_stream", "generate", "frame", "qr"]
+
+def configure_environment(concurrency):
+    # Keep every run self-contained: in-memory storage and no caches, pools or background jobs
+    os.environ.update({
+        "STORAGE_BACKEND": "memory",
+        "RESULT_CACHE_DIR": "",
+        "WARM_POOL_PROMPTS": "",
+        "ARTIFACT_INDEX_PATH": "",
+        "SHORT_LINK_BASE_URL": "",
+        "VISION_CACHE_SIZE": "0",
+        "MAX_CONCURRENCY_DALLE": str(concurrency),
+        "RPM_DALLE": "0",
+        "RPM_MISTRAL": "0",
+    })
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+def current_rss_mb():
+    # Resident set size from /proc, the peak from getrusage is reported separately
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return 0.0
+
+def run_scenario(name, operation, requests, concurrency):
+    """Run operation(index) requests times on concurrency threads and measure it."""
+    latencies = []
+    errors = 0
+
+    def timed(index):
+        start = time.perf_counter()
+        operation(index)
+        return time.perf_counter() - start
+
+    rss_before = current_rss_mb()
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(timed, index) for index in range(requests)]
+        for future in futures:
+            try:
+                latencies.append(future.result())
+            except Exception as e:
+                errors += 1
+                print(f"{name}: request failed: {e}")
+
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    return {
+        "scenario": name,
+        "requests": requests,
+        "errors": errors,
+        "wall_seconds": wall,
+        "throughput_per_second": len(latencies) / wall if wall else 0.0,
+        "p50_ms": percentile(latencies, 0.5) * 1000 if latencies else 0.0,
+        "p95_ms": percentile(latencies, 0.95) * 1000 if latencies else 0.0,
+        "p99_ms": percentile(latencies, 0.99) * 1000 if latencies else 0.0,
+        "cpu_ms_per_request": cpu / requests * 1000,
+        "cpu_percent": cpu / wall * 100 if wall else 0.0,
+        "rss_delta_mb": current_rss_mb() - rss_before,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+def build_operations(add_frame):
+    # Imported after the mock endpoint variables are set, since models are discovered on first use
+    from capture_preprocessor import CapturePreprocessor
+    from dalle_image_generator import DalleImageGenerator
+    from qr_code_generator import generate_qr_code
+    from service_registry import get_frame_processor, get_image_encoder
+    from webcam_analyzer import WebcamAnalyzer
+
+    # A few different captures, with the payload cache off so every request prepares its capture
+    captures = [make_capture(1280, 720) for _ in range(4)]
+    analyzer = WebcamAnalyzer(model_id="mistral", preprocessor=CapturePreprocessor(cache_size=0))
+
+    generator = DalleImageGenerator()
+    frame_processor = get_frame_processor()
+    encoder = get_image_encoder()
+    sample = make_sample_image()
+
+    def frame(index):
+        encoder.encode(frame_processor.frame_image(io.BytesIO(sample), FRAME_PATH))
+
+    def qr(index):
+        # A new URL every time so the render cache does not hide the cost
+        generate_qr_code(f"https://account.blob.core.windows.net/minecraft/minecraft_{uuid.uuid4().hex}.png?sig={'x' * 120}")
+
+    return {
+        "vision": lambda index: analyzer.analyze_face(captures[index % len(captures)]),
+        "vision_stream": lambda index: "".join(analyzer.analyze_face_stream(captures[index % len(captures)])),
+        "generate": lambda index: generator.generate_minecraft_image(f"load test character {index}", add_frame=add_frame),
+        "frame": frame,
+        "qr": qr,
+    }
+
+def print_results(results):
+    print(f"\n{'scenario':<10} {'ok':>5} {'err':>4} {'req/s':>7} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} "
+          f"{'cpu ms/req':>11} {'cpu %':>6} {'rss +MB':>8} {'peak MB':>8}")
+    for result in results:
+        print(
+            f"{result['scenario']:<10} {result['requests'] - result['errors']:>5} {result['errors']:>4} "
+            f"{result['throughput_per_second']:>7.2f} {result['p50_ms']:>9.0f} {result['p95_ms']:>9.0f} {result['p99_ms']:>9.0f} "
+            f"{result['cpu_ms_per_request']:>11.1f} {result['cpu_percent']:>6.0f} {result['rss_delta_mb']:>8.1f} {result['peak_rss_mb']:>8.1f}"
+        )
+
+def print_stages(snapshot):
+    print(f"\n{'stage':<24} {'count':>6} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'errors':>7}")
+    for name, histogram in sorted(snapshot["histograms"].items()):
+        print(
+            f"{name:<24} {histogram['count']:>6} {histogram['p50'] * 1000:>9.1f} {histogram['p95'] * 1000:>9.1f} "
+            f"{histogram['p99'] * 1000:>9.1f} {snapshot['counters'].get(f'{name}_errors', 0):>7}"
+        )
+
+    counters = {name: value for name, value in snapshot["counters"].items() if not name.endswith("_errors")}
+    if counters:
+        print("\nCounters: " + ", ".join(f"{name}={value}" for name, value in sorted(counters.items())))
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the pipeline against local mock endpoints")
+    parser.add_argument("--requests", type=int, default=40, help="Requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--image-latency-ms", type=float, default=1000, help="Median DALL-E latency")
+    parser.add_argument("--chat-latency-ms", type=float, default=400, help="Median vision model latency")
+    parser.add_argument("--latency-sigma", type=float, default=0.25, help="Log-normal spread of the latencies, 0 for fixed")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Share of model calls answered with 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of model calls answered with 500")
+    parser.add_argument("--retry-after-ms", type=int, default=200)
+    parser.add_argument("--no-frame", action="store_true", help="Skip framing in the generate scenario")
+    parser.add_argument("--json", help="Also write the results to this file, to compare runs")
+    args = parser.parse_args()
+
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    _, mock_counters = start_mock_services(
+        LatencyModel(args.image_latency_ms, args.latency_sigma),
+        LatencyModel(args.chat_latency_ms, args.latency_sigma),
+        throttle_rate=args.throttle_rate,
+        error_rate=args.error_rate,
+        retry_after_ms=args.retry_after_ms
+    )
+    configure_environment(args.concurrency)
+
+    from telemetry import get_telemetry
+
+    operations = build_operations(add_frame=not args.no_frame)
+    telemetry = get_telemetry()
+    telemetry.reset()
+
+    results = []
+    for name in scenarios:
+        print(f"Running {name}: {args.requests} requests at concurrency {args.concurrency}")
+        results.append(run_scenario(name, operations[name], args.requests, args.concurrency))
+
+    print_results(results)
+    snapshot = telemetry.snapshot()
+    print_stages(snapshot)
+    print("Mock endpoint: " + ", ".join(f"{name}={value}" for name, value in sorted(mock_counters.items())))
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump({"arguments": vars(args), "scenarios": results, "stages": snapshot, "mock": mock_counters}, file, indent=2)
+        print(f"Results written to {args.json}")
+
+if __name__ == "__main__":
+    main()
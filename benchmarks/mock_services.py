@@ -0,0 +1,192 @@
+"""
+Local stand-ins for the Azure OpenAI images API and the Azure AI Inference chat completions API.
+Responses are delayed by a configurable latency distribution, and a share of the requests can be
+answered with 429 (with a Retry-After) or 500 so the rate governor is exercised too. Streaming
+chat completions are sent as server-sent events, one word at a time.
+
+Used by the load test; start_mock_services() points the dalle and mistral models at the mock.
+"""
+import base64
+import itertools
+import json
+import math
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from benchmarks.frame_benchmark import make_sample_image
+
+DESCRIPTION = "boy, about 10 years old, brown eyes, short black hair, light skin tone"
+
+class LatencyModel:
+    """Log-normal latency around a median; sigma 0 gives a fixed delay."""
+    def __init__(self, median_ms, sigma=0.0):
+        self.median_ms = median_ms
+        self.sigma = sigma
+
+    def sample(self):
+        if self.median_ms <= 0:
+            return 0.0
+        if self.sigma <= 0:
+            return self.median_ms / 1000
+        return random.lognormvariate(math.log(self.median_ms), self.sigma) / 1000
+
+class MockAzureHandler(BaseHTTPRequestHandler):
+    """Answers images/generations and chat/completions POSTs, and serves the generated images."""
+    # HTTP/1.1 for keep-alive and chunked streams, as the real endpoints use
+    protocol_version = "HTTP/1.1"
+    image_latency = LatencyModel(1000, 0.25)
+    chat_latency = LatencyModel(400, 0.25)
+    throttle_rate = 0.0
+    error_rate = 0.0
+    retry_after_ms = 200
+    image_png = None
+    counters = None
+    counters_lock = threading.Lock()
+    image_ids = itertools.count()
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        route = "images" if "images/generations" in self.path else "chat"
+        self._count(f"{route}_requests")
+
+        # Fail before the model "works", as the real service does when it throttles
+        roll = random.random()
+        if roll < self.throttle_rate:
+            self._count(f"{route}_throttled")
+            return self._send_json(429, {"error": {"code": "429", "message": "Rate limit is exceeded."}},
+                                   {"retry-after-ms": str(self.retry_after_ms), "Retry-After": str(max(1, self.retry_after_ms // 1000))})
+        if roll < self.throttle_rate + self.error_rate:
+            self._count(f"{route}_errors")
+            return self._send_json(500, {"error": {"code": "InternalServerError", "message": "Injected failure"}})
+
+        if route == "images":
+            time.sleep(self.image_latency.sample())
+            self._send_json(200, self._image_response(body.get("response_format", "url")))
+        elif body.get("stream"):
+            self._send_chat_stream(self.chat_latency.sample())
+        else:
+            time.sleep(self.chat_latency.sample())
+            self._send_json(200, self._chat_response())
+
+    def do_GET(self):
+        # Generated image downloads, every image is the same real PNG
+        if not self.path.startswith("/images/"):
+            return self.send_error(404)
+        self._count("image_downloads")
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(self.image_png)))
+        self.end_headers()
+        self.wfile.write(self.image_png)
+
+    def _image_response(self, response_format):
+        if response_format == "b64_json":
+            data = {"b64_json": base64.b64encode(self.image_png).decode("ascii")}
+        else:
+            host, port = self.server.server_address[:2]
+            data = {"url": f"http://{host}:{port}/images/{next(self.image_ids)}.png"}
+        data["revised_prompt"] = "mock"
+        return {"created": int(time.time()), "data": [data]}
+
+    def _chat_response(self):
+        return {
+            "id": "mock",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "mock",
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": DESCRIPTION}
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        }
+
+    def _send_chat_stream(self, latency):
+        # The first word comes after a third of the latency, the others are spread over the rest
+        words = [word + " " for word in DESCRIPTION.split(" ")]
+        words[-1] = words[-1].strip()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        time.sleep(latency / 3)
+        for index, word in enumerate(words):
+            if index:
+                time.sleep(latency * 2 / 3 / len(words))
+            self._send_event({
+                "id": "mock",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": "mock",
+                "choices": [{"index": 0, "delta": {"role": "assistant", "content": word}, "finish_reason": None}]
+            })
+        self._send_event({
+            "id": "mock",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": "mock",
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+        })
+        self._send_chunk(b"data: [DONE]\n\n")
+        self._send_chunk(b"")
+
+    def _send_event(self, payload):
+        self._send_chunk(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+
+    def _send_chunk(self, data):
+        # One chunk per event so the client sees every event as soon as it is sent
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status, payload, headers=None):
+        response = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(response)
+
+    def _count(self, name):
+        with self.counters_lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def log_message(self, format, *args):
+        pass
+
+def start_mock_services(image_latency, chat_latency, throttle_rate=0.0, error_rate=0.0, retry_after_ms=200):
+    """
+    Start the mock endpoint on a free local port and point the dalle and mistral models at it.
+
+    Returns:
+        tuple: (server, counters dict updated as requests are served)
+    """
+    counters = {}
+    handler = type("Handler", (MockAzureHandler,), {
+        "image_latency": image_latency,
+        "chat_latency": chat_latency,
+        "throttle_rate": throttle_rate,
+        "error_rate": error_rate,
+        "retry_after_ms": retry_after_ms,
+        "image_png": make_sample_image(),
+        "counters": counters,
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, name="mock-azure", daemon=True).start()
+
+    endpoint = f"http://127.0.0.1:{server.server_port}"
+    for suffix, api_version in (("DALLE", "2024-02-01"), ("MISTRAL", "2024-05-01-preview")):
+        os.environ.update({
+            f"MODEL_{suffix}": f"Mock {suffix.title()}",
+            f"DEPLOYMENT_NAME_{suffix}": suffix.lower(),
+            f"ENDPOINT_{suffix}": endpoint,
+            f"API_KEY_{suffix}": "mock-key",
+            f"API_VERSION_{suffix}": api_version,
+            f"API_TYPE_{suffix}": "azure",
+        })
+    return server, counters
@@ -0,0 +1,93 @@
+"""
+Benchmark of the links encoded in QR codes.
+Compares a signed blob URL with short links: QR version, modules per side and render time.
+When azure-storage-blob is installed, also compares signing every URL with the cached container SAS.
+
+Run from the repository root:
+    python -m benchmarks.qr_link_benchmark [--iterations 50]
+"""
+import argparse
+import base64
+import time
+import uuid
+import qrcode
+from qr_code_generator import generate_qr_code, clear_render_cache
+from short_links import CODE_ALPHABET
+
+ACCOUNT_NAME = "benchmarkaccount"
+ACCOUNT_KEY = base64.b64encode(b"0" * 64).decode("ascii")
+
+def sample_links():
+    """Return (name, url) pairs shaped like the links the app hands out."""
+    blob_name = f"minecraft_{uuid.uuid4().hex}.png"
+    signature = base64.b64encode(b"1" * 32).decode("ascii").replace("+", "%2B").replace("/", "%2F").replace("=", "%3D")
+    signed_url = (
+        f"https://{ACCOUNT_NAME}.blob.core.windows.net/minecraft/{blob_name}"
+        f"?se=2026-01-01T12%3A00%3A00Z&sp=r&sv=2024-08-04&sr=b&sig={signature}"
+    )
+    code = CODE_ALPHABET[:8]
+    return [
+        ("signed blob URL", signed_url),
+        ("short link", f"http://192.168.1.20:8503/{code}"),
+        ("short link, upper", f"HTTP://192.168.1.20:8503/{code}"),
+    ]
+
+def qr_version(url):
+    qr = qrcode.QRCode(version=1, error_correction=qrcode.constants.ERROR_CORRECT_L, box_size=10, border=4)
+    qr.add_data(url)
+    qr.make(fit=True)
+    return qr.version, qr.modules_count
+
+def benchmark_signing(iterations):
+    try:
+        from datetime import datetime, timedelta
+        from azure.storage.blob import generate_blob_sas, generate_container_sas, BlobSasPermissions, ContainerSasPermissions
+    except ImportError:
+        print("\nazure-storage-blob is not installed, skipping the signing benchmark")
+        return
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        generate_blob_sas(
+            account_name=ACCOUNT_NAME, container_name="minecraft", blob_name=f"{uuid.uuid4().hex}.png",
+            account_key=ACCOUNT_KEY, permission=BlobSasPermissions(read=True),
+            expiry=datetime.utcnow() + timedelta(hours=1)
+        )
+    per_blob = (time.perf_counter() - start) / iterations
+
+    # The cached path signs once, then only formats the URL
+    start = time.perf_counter()
+    token = generate_container_sas(
+        account_name=ACCOUNT_NAME, container_name="minecraft", account_key=ACCOUNT_KEY,
+        permission=ContainerSasPermissions(read=True), expiry=datetime.utcnow() + timedelta(hours=1, minutes=15)
+    )
+    for _ in range(iterations):
+        f"https://{ACCOUNT_NAME}.blob.core.windows.net/minecraft/{uuid.uuid4().hex}.png?{token}"
+    cached = (time.perf_counter() - start) / iterations
+
+    print(f"\n{'signing':<22} {'mean (us)':>10}")
+    print(f"{'per-blob SAS':<22} {per_blob * 1e6:>10.1f}")
+    print(f"{'cached container SAS':<22} {cached * 1e6:>10.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark QR codes for signed and short links")
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'link':<18} {'length':>7} {'version':>8} {'modules':>8} {'render (ms)':>12} {'png (KB)':>9}")
+    for name, url in sample_links():
+        version, modules = qr_version(url)
+        start = time.perf_counter()
+        for _ in range(args.iterations):
+            clear_render_cache()
+            qr_bytes = generate_qr_code(url)
+        elapsed = (time.perf_counter() - start) / args.iterations
+        print(
+            f"{name:<18} {len(url):>7} {version:>8} {modules:>8} "
+            f"{elapsed * 1000:>12.2f} {len(qr_bytes.getvalue()) / 1024:>9.1f}"
+        )
+
+    benchmark_signing(args.iterations)
+
+if __name__ == "__main__":
+    main()
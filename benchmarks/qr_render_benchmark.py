@@ -0,0 +1,68 @@
+"""
+Benchmark of QR code rendering.
+Compares the original qrcode/PIL renderer with the NumPy renderer (uncached, cached and
+with a fixed mask pattern) and the SVG output, across link lengths from a short link to
+long signed URLs.
+
+Run from the repository root:
+    python -m benchmarks.qr_render_benchmark [--iterations 50]
+"""
+import argparse
+import io
+import time
+import qrcode
+from qr_code_generator import generate_qr_code, clear_render_cache
+
+LINK_LENGTHS = [32, 120, 220, 320, 480]
+
+def legacy_generate_qr_code(url):
+    """The renderer before the NumPy path, kept for comparison."""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_L,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+    img = qr.make_image(fill_color="black", back_color="white")
+    img_bytes = io.BytesIO()
+    img.save(img_bytes, format='PNG')
+    img_bytes.seek(0)
+    return img_bytes
+
+def make_link(length):
+    """Return a URL of the given length shaped like a signed blob URL."""
+    base = "https://account.blob.core.windows.net/minecraft/minecraft_0123456789abcdef.png?sig="
+    return (base + "A1b2C3d4" * 64)[:length]
+
+def measure(func, url, iterations, clear_cache):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        if clear_cache:
+            clear_render_cache()
+        output = func(url)
+    return (time.perf_counter() - start) / iterations, len(output.getvalue())
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark QR code rendering")
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    variants = [
+        ("legacy png", legacy_generate_qr_code, False),
+        ("numpy png", generate_qr_code, True),
+        ("numpy png cached", generate_qr_code, False),
+        ("numpy png, mask 0", lambda url: generate_qr_code(url, mask_pattern=0), True),
+        ("svg", lambda url: generate_qr_code(url, format="svg"), True),
+    ]
+
+    print(f"{'length':>7} {'renderer':<18} {'mean (ms)':>10} {'size (KB)':>10}")
+    for length in LINK_LENGTHS:
+        url = make_link(length)
+        for name, func, clear_cache in variants:
+            elapsed, size = measure(func, url, args.iterations, clear_cache)
+            print(f"{length:>7} {name:<18} {elapsed * 1000:>10.2f} {size / 1024:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+Multi-replica check of the shared result store.
+Starts several app processes ("replicas") against one mock Azure endpoint and one SQLite
+result store. Each replica submits generations drawn from a small set of prompts, a few
+seconds apart, so identical prompts overlap across replicas. Reports how many DALL-E calls
+were made for how many requests, the dedup counters, the request latencies, and whether
+every job can be served by ID from a process that did not run it.
+
+Run from the repository root:
+    python -m benchmarks.shared_results_benchmark [--replicas 3] [--requests 6] [--prompts 4] [--no-store]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from benchmarks.mock_services import LatencyModel, start_mock_services
+from benchmarks.load_test import configure_environment, percentile
+
+PROMPTS = [
+    "a knight in golden armor",
+    "a girl with red hair and a green hoodie",
+    "a robot pirate with a parrot",
+    "a wizard with a long white beard",
+    "a zombie chef",
+    "an astronaut holding a pickaxe",
+]
+
+def run_replica(index, prompts, requests, spread_seconds, start_at, seed, results):
+    """Body of one replica process: submit requests jobs and wait for them."""
+    from job_queue import DONE
+    from service_registry import get_job_queue
+
+    rng = random.Random(seed + index)
+    job_queue = get_job_queue()
+    delays = sorted(rng.uniform(0, spread_seconds) for _ in range(requests))
+
+    time.sleep(max(0.0, start_at - time.time()))
+    submitted = []
+    for delay in delays:
+        time.sleep(max(0.0, start_at + delay - time.time()))
+        submitted.append((job_queue.submit(rng.choice(prompts)), time.time()))
+
+    outcomes = []
+    for job, submitted_at in submitted:
+        while not job.is_finished():
+            time.sleep(0.05)
+        outcomes.append({
+            "job_id": job.job_id,
+            "ok": job.status == DONE,
+            "error": job.error,
+            "latency": job.finished_at - submitted_at,
+            "filename": job.result["filename"] if job.status == DONE else None
+        })
+    results.put((index, outcomes))
+
+def main():
+    parser = argparse.ArgumentParser(description="Check cross-process deduplication of identical generations")
+    parser.add_argument("--replicas", type=int, default=3, help="App processes")
+    parser.add_argument("--requests", type=int, default=6, help="Requests per replica")
+    parser.add_argument("--prompts", type=int, default=4, help="Distinct prompts the requests are drawn from")
+    parser.add_argument("--spread-seconds", type=float, default=3.0, help="Requests of a replica arrive over this long")
+    parser.add_argument("--image-latency-ms", type=float, default=1500)
+    parser.add_argument("--no-store", action="store_true", help="Run without the shared store, for comparison")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    _, mock_counters = start_mock_services(LatencyModel(args.image_latency_ms, 0.2), LatencyModel(400))
+    configure_environment(concurrency=4)
+
+    store_path = os.path.join(tempfile.mkdtemp(), "results.db")
+    os.environ.update({
+        "RESULT_STORE": "" if args.no_store else "sqlite",
+        "RESULT_STORE_PATH": store_path,
+        "STARTUP_WARMUP": "false",
+    })
+
+    # Fresh interpreters, like separate replicas; they inherit the mock endpoint settings
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    start_at = time.time() + 3
+    processes = [
+        context.Process(target=run_replica, args=(index, PROMPTS[:args.prompts], args.requests, args.spread_seconds, start_at, args.seed, results))
+        for index in range(args.replicas)
+    ]
+    for process in processes:
+        process.start()
+    outcomes = {}
+    for _ in processes:
+        index, replica_outcomes = results.get()
+        outcomes[index] = replica_outcomes
+    for process in processes:
+        process.join()
+
+    every = [outcome for replica_outcomes in outcomes.values() for outcome in replica_outcomes]
+    latencies = [outcome["latency"] for outcome in every if outcome["ok"]]
+    failures = [outcome for outcome in every if not outcome["ok"]]
+    print(f"Requests: {len(every)} from {args.replicas} replicas over {args.prompts} prompts, failed: {len(failures)}")
+    for outcome in failures[:5]:
+        print(f"  {outcome['job_id']}: {outcome['error']}")
+    print(f"DALL-E calls: {mock_counters.get('images_requests', 0)}, distinct images handed out: {len({o['filename'] for o in every if o['ok']})}")
+    if latencies:
+        print(f"Latency: p50 {percentile(latencies, 0.5) * 1000:.0f} ms, p95 {percentile(latencies, 0.95) * 1000:.0f} ms")
+
+    if args.no_store:
+        return
+
+    from shared_results import SQLiteResultStore, DONE
+
+    store = SQLiteResultStore(store_path)
+    stats = store.stats()
+    print("Store: " + ", ".join(f"{name}={value:.1%}" if name == "dedup_rate" else f"{name}={value}" for name, value in stats.items()))
+
+    # This process ran none of the jobs, yet it can serve all of them by ID
+    served = sum(
+        1 for outcome in every
+        if outcome["ok"] and (record := store.get(outcome["job_id"])) is not None
+        and record["status"] == DONE and record["result"]["filename"] == outcome["filename"] and record["result"]["image_bytes"]
+    )
+    print(f"Served by job ID from another process: {served}/{len(every) - len(failures)}")
+
+if __name__ == "__main__":
+    main()
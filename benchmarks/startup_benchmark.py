@@ -0,0 +1,101 @@
+"""
+Cold-start profile of the kiosk app.
+Runs `python -X importtime -c "import app"` in a fresh interpreter and lists the slowest
+top-level imports, then times a fresh Streamlit script run of app.py up to its first render.
+Models are stubbed and storage is in memory, so nothing reaches Azure.
+
+Run from the repository root:
+    python -m benchmarks.startup_benchmark [--runs 5] [--top 15]
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+FIRST_RENDER = """
+import time
+start = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+AppTest.from_file("app.py", default_timeout=60).run()
+print(time.perf_counter() - start)
+"""
+
+def stub_environment():
+    env = dict(os.environ)
+    for suffix, api_version in (("DALLE", "2024-02-01"), ("MISTRAL", "2024-05-01-preview")):
+        env.update({
+            f"MODEL_{suffix}": f"Stub {suffix.title()}",
+            f"DEPLOYMENT_NAME_{suffix}": suffix.lower(),
+            f"ENDPOINT_{suffix}": "http://127.0.0.1:9",
+            f"API_KEY_{suffix}": "stub-key",
+            f"API_VERSION_{suffix}": api_version,
+            f"API_TYPE_{suffix}": "azure",
+        })
+    env.update({
+        "STORAGE_BACKEND": "memory",
+        "ARTIFACT_INDEX_PATH": "",
+        "WARM_POOL_PROMPTS": "",
+        "STARTUP_WARMUP": "false",
+    })
+    return env
+
+def profile_imports(env, top):
+    """Return the total import time of app in seconds and its top-level imports, slowest first."""
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        env=env, capture_output=True, text=True
+    )
+    wall = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr[-2000:])
+
+    # Modules imported directly by app (or by the interpreter) are the least indented lines
+    entries = []
+    for line in completed.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            entries.append((len(match.group(3)), int(match.group(2)), match.group(4)))
+    base = min(depth for depth, _, _ in entries)
+    top_level = {}
+    for depth, cumulative, name in entries:
+        if depth <= base + 2:
+            top_level[name] = max(top_level.get(name, 0), cumulative)
+
+    app_total = top_level.get("app", 0) / 1_000_000
+    slowest = sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:top]
+    return wall, app_total, slowest
+
+def time_first_render(env, runs):
+    timings = []
+    for _ in range(runs):
+        completed = subprocess.run([sys.executable, "-c", FIRST_RENDER], env=env, capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise RuntimeError(completed.stderr[-2000:])
+        timings.append(float(completed.stdout.strip().splitlines()[-1]))
+    return timings
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the app's cold start")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes timed to first render")
+    parser.add_argument("--top", type=int, default=15, help="Slowest imports listed")
+    args = parser.parse_args()
+
+    env = stub_environment()
+    wall, app_total, slowest = profile_imports(env, args.top)
+    print(f"import app: {app_total * 1000:.0f} ms cumulative ({wall * 1000:.0f} ms for the whole interpreter)")
+    print(f"\n{'module':<40} {'cumulative (ms)':>16}")
+    for name, cumulative in slowest:
+        print(f"{name:<40} {cumulative / 1000:>16.1f}")
+
+    timings = time_first_render(env, args.runs)
+    print(f"\nFirst render in a fresh process over {args.runs} runs: "
+          f"median {statistics.median(timings) * 1000:.0f} ms, min {min(timings) * 1000:.0f} ms, max {max(timings) * 1000:.0f} ms")
+
+if __name__ == "__main__":
+    main()
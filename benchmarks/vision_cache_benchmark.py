@@ -0,0 +1,138 @@
+"""
+Offline check of the perceptual-hash vision cache with synthetic captures.
+Builds scenes of a "guest" in front of a fixed kiosk background, then compares retakes of the
+same guest (shifted, exposure changed, noisy, recompressed) with different guests in front of
+the same background. Reports hash time, distance distributions and, per threshold, how many
+retakes would hit, how many pairs of different guests match and how many new guests would be
+served an earlier guest's features by a cache shared across sessions.
+
+Run from the repository root:
+    python -m benchmarks.vision_cache_benchmark [--scenes 40]
+"""
+import argparse
+import io
+import random
+import time
+from PIL import Image, ImageDraw, ImageEnhance
+from vision_cache import difference_hash, hamming_distance, VisionCache
+
+CAPTURE_SIZE = (1280, 720)
+THRESHOLDS = [4, 6, 8, 10, 12, 16, 20, 24]
+
+def make_background(rng):
+    # The same room for every guest: a gradient wall with a few fixed shapes
+    background = Image.linear_gradient("L").resize(CAPTURE_SIZE).convert("RGB")
+    draw = ImageDraw.Draw(background)
+    for _ in range(6):
+        x, y = rng.randrange(CAPTURE_SIZE[0]), rng.randrange(CAPTURE_SIZE[1])
+        draw.rectangle((x, y, x + rng.randrange(50, 300), y + rng.randrange(50, 300)), fill=tuple(rng.randrange(256) for _ in range(3)))
+    return background
+
+def make_guest(rng):
+    """Return the parameters of a guest: position, size, skin, hair and shirt colours."""
+    return {
+        "x": rng.randrange(300, 980),
+        "y": rng.randrange(150, 350),
+        "size": rng.randrange(140, 260),
+        "skin": tuple(rng.randrange(90, 250) for _ in range(3)),
+        "hair": tuple(rng.randrange(0, 160) for _ in range(3)),
+        "shirt": tuple(rng.randrange(256) for _ in range(3)),
+    }
+
+def render(background, guest, shift=(0, 0)):
+    image = background.copy()
+    draw = ImageDraw.Draw(image)
+    x, y, size = guest["x"] + shift[0], guest["y"] + shift[1], guest["size"]
+    draw.rectangle((x - size, y + size, x + size, CAPTURE_SIZE[1]), fill=guest["shirt"])
+    draw.ellipse((x - size // 2, y - size // 2, x + size // 2, y + size // 2 + size // 4), fill=guest["skin"])
+    draw.chord((x - size // 2, y - size // 2 - 10, x + size // 2, y + size // 4), 180, 360, fill=guest["hair"])
+    return image
+
+def to_jpeg(image, quality=90):
+    capture = io.BytesIO()
+    image.save(capture, format="JPEG", quality=quality)
+    return capture.getvalue()
+
+def retake(background, guest, rng):
+    # The same guest a moment later: moved a little, exposure and sensor noise changed
+    image = render(background, guest, shift=(rng.randint(-12, 12), rng.randint(-8, 8)))
+    image = ImageEnhance.Brightness(image).enhance(rng.uniform(0.9, 1.1))
+    noise = Image.effect_noise(CAPTURE_SIZE, 30).convert("RGB")
+    image = Image.blend(image, noise, 0.08)
+    return to_jpeg(image, quality=rng.randint(70, 95))
+
+def summarize(distances):
+    ordered = sorted(distances)
+    return f"min {ordered[0]:>3}, median {ordered[len(ordered) // 2]:>3}, max {ordered[-1]:>3}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the vision cache's perceptual hash on synthetic captures")
+    parser.add_argument("--scenes", type=int, default=40, help="Number of guests")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    background = make_background(rng)
+    guests = [make_guest(rng) for _ in range(args.scenes)]
+    originals = [to_jpeg(render(background, guest)) for guest in guests]
+    retakes = [retake(background, guest, rng) for guest in guests]
+
+    start = time.perf_counter()
+    original_hashes = [difference_hash(capture) for capture in originals]
+    hash_ms = (time.perf_counter() - start) / len(originals) * 1000
+    retake_hashes = [difference_hash(capture) for capture in retakes]
+
+    same = [hamming_distance(a, b) for a, b in zip(original_hashes, retake_hashes)]
+    different = [
+        hamming_distance(original_hashes[i], original_hashes[j])
+        for i in range(len(guests)) for j in range(i + 1, len(guests))
+    ]
+
+    print(f"Hash time: {hash_ms:.2f} ms per {CAPTURE_SIZE[0]}x{CAPTURE_SIZE[1]} capture")
+    print(f"Retakes of the same guest:  {summarize(same)} bits")
+    print(f"Different guests, same room: {summarize(different)} bits")
+
+    # A pair rate understates the risk: a new guest is wrongly served if any earlier guest is close enough
+    print(f"\n{'threshold':>9} {'retake hits':>12} {'false pairs':>12} {'new guests hit':>15}")
+    for threshold in THRESHOLDS:
+        hits = sum(distance <= threshold for distance in same) / len(same)
+        false_pairs = sum(distance <= threshold for distance in different) / len(different)
+        print(f"{threshold:>9} {hits:>11.0%} {false_pairs:>11.1%} {first_capture_false_hits(original_hashes, threshold) / len(guests):>14.0%}")
+
+    # The cache itself: every guest's first capture, then their retake, each guest in their own session
+    print()
+    for label, cache in (
+        ("Per-session cache (default)", VisionCache()),
+        ("Shared cache, cross-session threshold 2", VisionCache(shared_threshold=2)),
+        ("Shared cache, cross-session threshold 8", VisionCache(shared_threshold=8)),
+    ):
+        wrong_first, wrong_retake = replay(cache, originals, retakes)
+        print(f"{label}: {cache.stats()}, wrong guest served on first captures: {wrong_first}, on retakes: {wrong_retake}")
+
+def first_capture_false_hits(hashes, threshold):
+    """Count the guests whose capture is within threshold of an earlier guest's."""
+    return sum(
+        1 for index in range(1, len(hashes))
+        if any(hamming_distance(hashes[index], hashes[earlier]) <= threshold for earlier in range(index))
+    )
+
+def replay(cache, originals, retakes):
+    """Run every guest's first capture, then every retake, through the cache; return the wrong hits of each phase."""
+    wrong_first = 0
+    for index, capture in enumerate(originals):
+        image_hash = cache.hash_image(capture)
+        features = cache.lookup(image_hash, "mistral", f"session {index}")
+        if features is None:
+            cache.store(image_hash, "mistral", f"session {index}", f"guest {index}")
+        elif features != f"guest {index}":
+            wrong_first += 1
+
+    wrong_retake = 0
+    for index, capture in enumerate(retakes):
+        features = cache.lookup(cache.hash_image(capture), "mistral", f"session {index}")
+        if features is not None and features != f"guest {index}":
+            wrong_retake += 1
+    return wrong_first, wrong_retake
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Benchmark of webcam capture preprocessing for the vision model.
+Sends captures of several resolutions to a local stub of the chat completions endpoint
+and reports the payload size and analyze latency with and without preprocessing.
+
+Run from the repository root:
+    python -m benchmarks.vision_payload_benchmark [--bandwidth-mbps 20] [--iterations 3]
+"""
+import argparse
+import io
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from PIL import Image
+
+RESOLUTIONS = [(640, 480), (1280, 720), (1920, 1080), (3840, 2160)]
+
+class StubChatHandler(BaseHTTPRequestHandler):
+    """Answers chat completions after a delay proportional to the request size."""
+    bandwidth_bytes_per_second = 20 * 1024 * 1024 / 8
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        # Simulate the upload over the event network
+        time.sleep(len(body) / self.bandwidth_bytes_per_second)
+
+        response = json.dumps({
+            "id": "stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": "stub",
+            "choices": [{
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": "boy, about 10 years old, brown eyes, short black hair"}
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        }).encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stub_server():
+    """Start the stub endpoint on a free local port and point a STUB model at it."""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubChatHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    os.environ.update({
+        "MODEL_STUB": "Stub",
+        "DEPLOYMENT_NAME_STUB": "stub",
+        "ENDPOINT_STUB": f"http://127.0.0.1:{server.server_port}",
+        "API_KEY_STUB": "stub-key",
+        "API_VERSION_STUB": "2024-05-01-preview",
+        "API_TYPE_STUB": "azure",
+        # Every analyze call has to reach the stub
+        "VISION_CACHE_SIZE": "0",
+    })
+    return server
+
+def make_capture(width, height):
+    """Return a camera-like JPEG: a gradient with sensor noise, saved at high quality."""
+    gradient = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    noise = Image.effect_noise((width, height), 40).convert("RGB")
+    capture = io.BytesIO()
+    Image.blend(gradient, noise, 0.3).save(capture, format="JPEG", quality=95)
+    return capture.getvalue()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vision payload preprocessing")
+    parser.add_argument("--bandwidth-mbps", type=float, default=20, help="Simulated upload bandwidth")
+    parser.add_argument("--iterations", type=int, default=3)
+    args = parser.parse_args()
+
+    StubChatHandler.bandwidth_bytes_per_second = args.bandwidth_mbps * 1024 * 1024 / 8
+    start_stub_server()
+
+    # Imported after the stub model variables are set, since models are discovered on first use
+    from capture_preprocessor import CapturePreprocessor
+    from webcam_analyzer import WebcamAnalyzer
+
+    variants = [
+        ("original", lambda: CapturePreprocessor(format="original")),
+        ("jpeg 768", lambda: CapturePreprocessor(max_edge=768, format="jpeg", quality=80)),
+        ("webp 512", lambda: CapturePreprocessor(max_edge=512, format="webp", quality=75)),
+    ]
+
+    print(f"{'capture':<10} {'variant':<9} {'payload (KB)':>13} {'prepare (ms)':>13} {'analyze (ms)':>13}")
+    for width, height in RESOLUTIONS:
+        capture = make_capture(width, height)
+        for name, build in variants:
+            prepare_times, analyze_times = [], []
+            for _ in range(args.iterations):
+                # Fresh preprocessors so their caches do not hide the preparation cost
+                start = time.perf_counter()
+                payload, _ = build().prepare(capture)
+                prepare_times.append(time.perf_counter() - start)
+
+                analyzer = WebcamAnalyzer(model_id="stub", preprocessor=build())
+                start = time.perf_counter()
+                analyzer.analyze_face(capture)
+                analyze_times.append(time.perf_counter() - start)
+
+            print(
+                f"{width}x{height:<5} {name:<9} {len(payload) / 1024:>13.1f} "
+                f"{min(prepare_times) * 1000:>13.1f} {min(analyze_times) * 1000:>13.1f}"
+            )
+
+if __name__ == "__main__":
+    main()
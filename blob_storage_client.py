@@ -1,15 +1,30 @@
-from azure.storage.blob import BlobServiceClient, generate_blob_sas, BlobSasPermissions
+from azure.storage.blob import BlobServiceClient, generate_blob_sas, generate_container_sas, BlobSasPermissions, ContainerSasPermissions, ContentSettings
 import os
+import threading
 from dotenv import load_dotenv
 from datetime import datetime, timedelta
+from storage_backends import StorageBackend
 
 load_dotenv()
 
-class BlobStorageClient:
-    def __init__(self, container_name):
+class BlobStorageClient(StorageBackend):
+    def __init__(self, container_name, verify_container=True):
         connection_string = os.getenv("AZURE_STORAGE_CONNECTION_STRING")
-        self.blob_service_client = BlobServiceClient.from_connection_string(connection_string)
+        # Blobs larger than max_single_put_size are staged as blocks of max_block_size
+        self.blob_service_client = BlobServiceClient.from_connection_string(
+            connection_string,
+            max_single_put_size=int(os.getenv("BLOB_MAX_SINGLE_PUT_SIZE", 4 * 1024 * 1024)),
+            max_block_size=int(os.getenv("BLOB_MAX_BLOCK_SIZE", 1024 * 1024))
+        )
         self.container_name = container_name
+        self.max_concurrency = int(os.getenv("BLOB_UPLOAD_CONCURRENCY", 4))
+
+        # "container" signs one read-only token per container and reuses it, "blob" signs every URL
+        self.sas_scope = os.getenv("BLOB_SAS_SCOPE", "container")
+        # Cached tokens are signed for this much longer than a link needs, then replaced
+        self.sas_refresh_margin = timedelta(minutes=float(os.getenv("SAS_REFRESH_MINUTES", 15)))
+        self._sas_cache = {}
+        self._sas_lock = threading.Lock()
         
         self.account_name = None
         self.account_key = None
@@ -23,6 +38,12 @@ class BlobStorageClient:
         self.account_name = conn_dict.get('AccountName')
         self.account_key = conn_dict.get('AccountKey')
         
+        # Only check the container once, when the shared client is built
+        if verify_container:
+            self.ensure_container()
+
+    def ensure_container(self):
+        """Create the container if it does not exist yet."""
         container_client = self.blob_service_client.get_container_client(self.container_name)
         if not container_client.exists():
             container_client.create_container()
@@ -38,12 +59,20 @@ class BlobStorageClient:
             print(f"Failed to upload {local_file_path} to Azure Blob Storage: {e}")
             raise e
     
-    def upload_bytes(self, bytes_data, blob_name):
+    def upload_bytes(self, bytes_data, blob_name, content_type=None):
         try:
             blob_client = self.blob_service_client.get_blob_client(container=self.container_name, blob=blob_name)
             # Reset pointer to start of stream
             bytes_data.seek(0)
-            blob_client.upload_blob(bytes_data, overwrite=True)
+            # Set the content type so browsers render the image instead of downloading it
+            content_settings = ContentSettings(content_type=content_type) if content_type else None
+            # Large streams are read in blocks and staged in parallel, without copying the whole buffer
+            blob_client.upload_blob(
+                bytes_data,
+                overwrite=True,
+                content_settings=content_settings,
+                max_concurrency=self.max_concurrency
+            )
             print(f"Uploaded {blob_name} to Azure Blob Storage.")
         except Exception as e:
             print(f"Failed to upload bytes to Azure Blob Storage: {e}")
@@ -56,6 +85,25 @@ class BlobStorageClient:
             file.write(download_stream.readall())
             print(f"Downloaded {blob_name} to {download_file_path}.")
 
+    def download_bytes(self, blob_name):
+        blob_client = self.blob_service_client.get_blob_client(container=self.container_name, blob=blob_name)
+        return blob_client.download_blob().readall()
+
+    def delete_blob(self, blob_name):
+        container_client = self.blob_service_client.get_container_client(self.container_name)
+        container_client.delete_blob(blob_name)
+        print(f"Deleted {blob_name} from Azure Blob Storage.")
+
+    def delete_blobs(self, blob_names):
+        # One batch request for up to 256 blobs, missing blobs are not an error
+        container_client = self.blob_service_client.get_container_client(self.container_name)
+        container_client.delete_blobs(*blob_names, raise_on_any_failure=False)
+        print(f"Deleted {len(blob_names)} blobs from Azure Blob Storage.")
+
+    def list_blobs(self, prefix=None):
+        container_client = self.blob_service_client.get_container_client(self.container_name)
+        return [blob.name for blob in container_client.list_blobs(name_starts_with=prefix)]
+
     def get_blob_url(self, blob_name, sas_token=True, expiry_hours=1):
         blob_client = self.blob_service_client.get_blob_client(container=self.container_name, blob=blob_name)
         
@@ -63,6 +111,9 @@ class BlobStorageClient:
             return blob_client.url
         
         try:
+            if self.sas_scope == "container":
+                return f"{blob_client.url}?{self._container_sas(expiry_hours)}"
+
             # Generate SAS token with read permission
             sas_token = generate_blob_sas(
                 account_name=self.account_name,
@@ -79,3 +130,29 @@ class BlobStorageClient:
             print(f"Failed to generate SAS token: {e}")
             # Fall back to the regular URL without SAS token
             return blob_client.url
+
+    def _container_sas(self, expiry_hours):
+        """
+        Return a read-only container SAS valid for at least expiry_hours.
+
+        The token is reused until less than expiry_hours of it is left, so every link
+        still lives as long as requested while signing happens once per refresh margin.
+        """
+        now = datetime.utcnow()
+        lifetime = timedelta(hours=expiry_hours)
+
+        with self._sas_lock:
+            cached = self._sas_cache.get(expiry_hours)
+            if cached is not None and cached[1] - now >= lifetime:
+                return cached[0]
+
+            expiry = now + lifetime + self.sas_refresh_margin
+            sas_token = generate_container_sas(
+                account_name=self.account_name,
+                container_name=self.container_name,
+                account_key=self.account_key,
+                permission=ContainerSasPermissions(read=True),
+                expiry=expiry
+            )
+            self._sas_cache[expiry_hours] = (sas_token, expiry)
+            return sas_token
@@ -0,0 +1,117 @@
+import base64
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageOps
+from image_encoder import ImageEncoder
+
+# MIME types for captures sent as they are
+ORIGINAL_MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+    "GIF": "image/gif",
+}
+
+# Extra room around a detected face so hair and accessories are kept
+FACE_MARGIN = 0.6
+
+class CapturePreprocessor:
+    def __init__(self, max_edge=768, format="jpeg", quality=80, crop_face=False, cache_size=8):
+        """
+        Args:
+            max_edge (int): Longest edge sent to the vision model, 0 to keep the capture size
+            format (str): "jpeg", "webp" or "png" to re-encode, or "original" to send the capture unchanged
+            quality (int): Quality used when re-encoding as JPEG or WebP
+            crop_face (bool): Crop to the detected faces when OpenCV is installed
+            cache_size (int): Number of prepared payloads kept for retries
+        """
+        self.max_edge = max_edge
+        self.format = format
+        self.crop_face = crop_face
+        self.cache_size = cache_size
+        self.encoder = ImageEncoder(format, quality=quality) if format != "original" else None
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._face_detector = None
+
+    def prepare(self, image_bytes):
+        """
+        Turn a raw capture into the payload sent to the vision model.
+
+        Args:
+            image_bytes (bytes): The capture as returned by st.camera_input
+
+        Returns:
+            tuple: (base64 payload, MIME type)
+        """
+        key = hashlib.sha1(image_bytes).hexdigest()
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key]
+
+        payload = self._prepare(image_bytes)
+
+        with self._lock:
+            self._cache[key] = payload
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return payload
+
+    def _prepare(self, image_bytes):
+        image = Image.open(io.BytesIO(image_bytes))
+
+        if self.encoder is None:
+            # Only the header is read to find the real MIME type
+            mime_type = ORIGINAL_MIME_TYPES.get(image.format, "image/jpeg")
+            return base64.b64encode(image_bytes).decode("utf-8"), mime_type
+
+        # Decode once, honoring the camera's orientation
+        image = ImageOps.exif_transpose(image).convert("RGB")
+
+        if self.crop_face:
+            box = self._detect_faces(image)
+            if box is not None:
+                image = image.crop(box)
+
+        if self.max_edge and max(image.size) > self.max_edge:
+            image.thumbnail((self.max_edge, self.max_edge), Image.Resampling.LANCZOS)
+
+        encoded = self.encoder.encode(image)
+        return base64.b64encode(encoded.image_bytes.getbuffer()).decode("utf-8"), encoded.content_type
+
+    def _detect_faces(self, image):
+        # Face detection is optional and only available when OpenCV is installed
+        try:
+            import cv2
+            import numpy
+        except ImportError:
+            print("OpenCV is not installed, sending the whole capture")
+            self.crop_face = False
+            return None
+
+        if self._face_detector is None:
+            self._face_detector = cv2.CascadeClassifier(cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+
+        gray = cv2.cvtColor(numpy.asarray(image), cv2.COLOR_RGB2GRAY)
+        faces = self._face_detector.detectMultiScale(gray, scaleFactor=1.2, minNeighbors=5)
+        if len(faces) == 0:
+            return None
+
+        # One box around every face, since the prompt describes all the people in the shot
+        left = min(x for x, y, w, h in faces)
+        top = min(y for x, y, w, h in faces)
+        right = max(x + w for x, y, w, h in faces)
+        bottom = max(y + h for x, y, w, h in faces)
+
+        margin_x = int((right - left) * FACE_MARGIN)
+        margin_y = int((bottom - top) * FACE_MARGIN)
+        return (
+            max(0, left - margin_x),
+            max(0, top - margin_y),
+            min(image.width, right + margin_x),
+            min(image.height, bottom + margin_y)
+        )
@@ -1,60 +1,416 @@
 import io
+import hashlib
 import uuid
-import requests
+import time
+import base64
 import os
-from openai_utils import OpenAIClient
-from blob_storage_client import BlobStorageClient
-from image_frame_processor import ImageFrameProcessor
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from service_registry import get_openai_client, get_blob_client, get_frame_processor, get_image_encoder, get_result_cache, get_http_session, get_rate_governor, get_artifact_index, get_short_links
+from qr_code_generator import generate_qr_code
+from result_cache import PREFER_CACHE, FRESH, normalize_description
+from models_config import get_concurrency_limit
+from telemetry import span, observe, increment, log_event, submit_with_context
+
+# Enhanced prompt for Minecraft character generation
+PROMPT_TEMPLATE = """
+        A full-body Minecraft character depicting a friendly-looking {description}. The character stands in a vibrant Minecraft environment surrounded by lush pixelated grass blocks and stylized pixelated trees under a clear blue sky. The character must have all the classic Minecraft characteristics: Blocky, pixelated appearance with clear cube structure. Wide-angle view capturing the entire figure clearly, simulating a Minecraft screenshot. """
+
+IMAGE_SIZE = "1024x1024"
+
+# Chunk size used when streaming a generated image download
+DOWNLOAD_CHUNK_SIZE = 256 * 1024
+
+# Stages after which a cancelled generation stops; later ones run to the end, since the upload
+# has started and the blob must still be recorded for the sweeper
+CANCELLABLE_STAGES = ("image_generated", "image_downloaded", "image_framed")
 
 class DalleImageGenerator:
     def __init__(self, container_name="minecraft"):
-        self.openai_client = OpenAIClient(model_id="dalle")
-        self.blob_client = BlobStorageClient(container_name)
-        self.frame_processor = ImageFrameProcessor()
-    
-    def generate_minecraft_image(self, description, add_frame=True, frame_path="frames/frame1.png"):
-        """Generate a Minecraft style image from a text description."""
+        # Clients are shared process-wide so reruns do not rebuild them
+        self.openai_client = get_openai_client("dalle")
+        self.governor = get_rate_governor("dalle")
+        self.blob_client = get_blob_client(container_name)
+        self.frame_processor = get_frame_processor()
+        self.encoder = get_image_encoder()
+        self.result_cache = get_result_cache()
+        self.http_session = get_http_session()
+        self.artifact_index = get_artifact_index()
+        self.short_links = get_short_links()
+        # Pinned uploads, and cached ones served again, are never deleted by the artifact sweeper (set by batch_generate.py)
+        self.pin_uploads = False
+
+        # Lifetime of the signed links handed to guests
+        self.sas_expiry_hours = float(os.getenv("SAS_EXPIRY_HOURS", 1))
+
+        # "url" downloads the image from the service, "b64_json" returns it inline with the response
+        self.response_format = os.getenv("IMAGE_RESPONSE_FORMAT", "url")
+        self.download_timeout = (
+            float(os.getenv("DOWNLOAD_CONNECT_TIMEOUT", 5)),
+            float(os.getenv("DOWNLOAD_READ_TIMEOUT", 30))
+        )
+
+        # Worker threads for the pipeline stages that can run alongside the main one
+        self.executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("PIPELINE_WORKERS", 4)),
+            thread_name_prefix="pipeline"
+        )
+
+        # Worker threads running whole pipelines when several candidates are requested
+        self.max_candidates = int(os.getenv("MAX_CANDIDATES", 4))
+        self.candidate_executor = ThreadPoolExecutor(
+            max_workers=self.max_candidates,
+            thread_name_prefix="candidate"
+        )
+
+        # Caps the DALL-E calls in flight from this process, whatever started them
+        try:
+            generation_limit = get_concurrency_limit("dalle")
+        except ValueError:
+            generation_limit = 2
+        self.generation_slots = threading.BoundedSemaphore(generation_limit)
+
+    def generate_minecraft_image(self, description, add_frame=True, frame_path="frames/frame1.png", on_event=None, cache_policy=None, cancel_event=None):
+        """
+        Generate a Minecraft style image from a text description.
+
+        Args:
+            description (str): Character description
+            add_frame (bool): Whether to add the frame to the image
+            frame_path (str): Path to the frame image
+            on_event (callable): Optional callback receiving (stage, payload) for every pipeline event
+            cache_policy (str): Result cache policy (see result_cache), RESULT_CACHE_POLICY by default
+            cancel_event (threading.Event): Set to stop the generation at its next stage before the upload
+
+        Returns:
+            dict: image_bytes, preview_bytes, thumbnail_bytes, content_type, blob_url, filename, qr_bytes and per-stage timings
+
+        Raises:
+            Exception: "Cancelled" once cancel_event is set, before the remaining stages run
+        """
+        result = None
+        stages = self.generate_minecraft_image_stages(description, add_frame, frame_path, cache_policy, cancel_event)
+        try:
+            for stage, payload in stages:
+                if on_event is not None:
+                    on_event(stage, payload)
+                if stage == "done":
+                    result = payload
+                elif stage in CANCELLABLE_STAGES and cancel_event is not None and cancel_event.is_set():
+                    raise Exception("Cancelled")
+        finally:
+            stages.close()
+        return result
+
+    def generate_minecraft_image_stages(self, description, add_frame=True, frame_path="frames/frame1.png", cache_policy=None, cancel_event=None):
+        """
+        Run the generation pipeline, yielding (stage, payload) events as each stage completes.
+
+        The SAS URL and QR code only depend on the filename, so they are built on a worker
+        thread while the image is generated, downloaded and framed. The framed image is
+        uploaded on a worker thread too, so the caller gets it before the upload finishes.
+
+        Stages, in order of availability:
+            generation_started {} - a generation slot was taken, the DALL-E call follows
+            image_generated  {"image_url"} - None for b64_json responses
+            image_downloaded {"image_bytes"} - the unframed image, ready to display
+            image_framed     {"image_bytes"} - the encoded framed image, or its preview rendition
+            link_ready       {"blob_url", "filename", "qr_bytes"} - may arrive earlier
+            uploaded         {"filename"}
+            done             the final result dict, including "timings"
+
+        When the result cache serves a variant, image_generated is skipped and the result has "cached" set.
+        A set cancel_event stops the pipeline before the DALL-E call; callers check it between stages.
+        """
+        start = time.perf_counter()
+        timings = {}
+
+        # Serve a cached variant of this prompt when the policy allows it
+        cache_key = None
+        if self.result_cache is not None:
+            cache_key = self.result_cache.make_key(description, PROMPT_TEMPLATE, IMAGE_SIZE, frame_path if add_frame else None)
+            cached = self.result_cache.lookup(cache_key, cache_policy or os.getenv("RESULT_CACHE_POLICY", PREFER_CACHE))
+            if cached is not None:
+                yield from self._serve_cached(cached, start, timings)
+                return
+
+        # Generate a unique filename for blob storage
+        filename = f"minecraft_{uuid.uuid4().hex}.{self.encoder.extension}"
+
+        # Sign the blob URL and render its QR code while the image is being produced
+        link_future = submit_with_context(self.executor, self._timed, timings, "link", self.build_link, filename)
+
         client = self.openai_client.get_client()
         deployment_name = self.openai_client.deployment_name
-        
+
         # Enhanced prompt for Minecraft character generation
-        enhanced_prompt = f"""
-        A full-body Minecraft character depicting a friendly-looking {description}. The character stands in a vibrant Minecraft environment surrounded by lush pixelated grass blocks and stylized pixelated trees under a clear blue sky. The character must have all the classic Minecraft characteristics: Blocky, pixelated appearance with clear cube structure. Wide-angle view capturing the entire figure clearly, simulating a Minecraft screenshot. """
-        
-        # Generate image using DALL-E
-        response = client.images.generate(
-            model=deployment_name,
-            prompt=enhanced_prompt,
-            n=1,
-            size="1024x1024",
-            response_format="url"
-        )
-        
-        # Get the image URL from the response
-        image_url = response.data[0].url
-        
-        # Download the image into memory
-        image_response = requests.get(image_url)
-        image_bytes = io.BytesIO(image_response.content)
-        
+        enhanced_prompt = PROMPT_TEMPLATE.format(description=description)
+
+        # Generate image using DALL-E, paced and retried by the deployment's governor
+        with self.generation_slots:
+            # The wait for a slot can be long, the guest may have given up meanwhile
+            if cancel_event is not None and cancel_event.is_set():
+                raise Exception("Cancelled")
+            yield "generation_started", {}
+            response = self._timed(
+                timings, "generate", self.governor.call, client.images.generate,
+                model=deployment_name,
+                prompt=enhanced_prompt,
+                n=1,
+                size=IMAGE_SIZE,
+                response_format=self.response_format
+            )
+
+        if self.response_format == "b64_json":
+            # The image is inline, decode it straight into the buffer
+            yield "image_generated", {"image_url": None}
+            image_bytes = io.BytesIO(self._timed(timings, "decode", base64.b64decode, response.data[0].b64_json))
+        else:
+            # Get the image URL from the response and stream the image into memory
+            image_url = response.data[0].url
+            yield "image_generated", {"image_url": image_url}
+            image_bytes = self._timed(timings, "download", self._download, image_url)
+
+        timings["first_pixel"] = time.perf_counter() - start
+        # BytesIO.getvalue() shares the buffer's bytes object rather than copying it
+        yield "image_downloaded", {"image_bytes": image_bytes.getvalue()}
+        content_type = "image/png"
+        preview = None
+        thumbnail = None
+
         # Apply frame if requested
         if add_frame and os.path.exists(frame_path):
-            image_bytes = self.frame_processor.add_frame(image_bytes, frame_path)
-        
-        # Generate a unique filename for blob storage
-        filename = f"minecraft_{uuid.uuid4().hex}.png"
-        
-        # Upload directly from memory to blob storage
-        self.blob_client.upload_bytes(image_bytes, filename)
-        
-        # Get the blob URL
-        blob_url = self.blob_client.get_blob_url(filename)
-        
+            image = self._timed(timings, "frame", self.frame_processor.frame_image, image_bytes, frame_path)
+        elif self.encoder.format != "png" or self.encoder.preview_max_edge:
+            image = self.encoder.open(image_bytes)
+        else:
+            # DALL-E already returns a PNG, upload it untouched
+            image = None
+
+        # Encode the full-size image and the optional preview rendition
+        if image is not None:
+            encoded = self._timed(timings, "encode", self.encoder.encode, image)
+            image_bytes = encoded.image_bytes
+            content_type = encoded.content_type
+            preview = self._timed(timings, "preview", self.encoder.encode_preview, image)
+            display_bytes = preview.image_bytes if preview is not None else image_bytes
+            yield "image_framed", {"image_bytes": display_bytes.getvalue()}
+            thumbnail = self._timed(timings, "thumbnail", self.encoder.encode_thumbnail, image)
+        elif self.encoder.thumbnail_max_edge:
+            # The PNG is uploaded untouched, it only has to be decoded for its gallery thumbnail
+            thumbnail = self._timed(timings, "thumbnail", self.encoder.encode_thumbnail, self.encoder.open(image_bytes))
+            image_bytes.seek(0)
+
+        # Upload directly from memory to blob storage on a worker thread
+        upload_future = submit_with_context(
+            self.executor, self._timed, timings, "upload", self.blob_client.upload_bytes, image_bytes, filename, content_type
+        )
+
+        link_event = link_future.result()
+        yield "link_ready", link_event
+
+        upload_future.result()
+        yield "uploaded", {"filename": filename}
+
+        # Record the upload so the sweeper can delete it once its link has expired
+        if self.artifact_index is not None:
+            self.artifact_index.record(
+                filename,
+                self.blob_client.container_name,
+                image_bytes.getbuffer().nbytes,
+                hashlib.sha256(normalize_description(description).encode("utf-8")).hexdigest()[:16],
+                time.time() + self.sas_expiry_hours * 3600,
+                pinned=self.pin_uploads
+            )
+
+        # Keep the result so the same prompt can be served without calling DALL-E again
+        if cache_key is not None:
+            self.result_cache.store(cache_key, filename, image_bytes.getvalue(), content_type)
+
+        timings["total"] = time.perf_counter() - start
+        print(f"Pipeline timings for {filename}: " + ", ".join(f"{k}={v:.2f}s" for k, v in timings.items()))
+        self._record_timings(filename, timings, cached=False)
+
         # Reset the stream position to start for Streamlit to read
         image_bytes.seek(0)
-        
-        return {
+
+        yield "done", {
+            "image_bytes": image_bytes,
+            "preview_bytes": preview.image_bytes if preview is not None else None,
+            "thumbnail_bytes": thumbnail.image_bytes.getvalue() if thumbnail is not None else None,
+            "content_type": content_type,
+            "blob_url": link_event["blob_url"],
+            "filename": filename,
+            "qr_bytes": link_event["qr_bytes"],
+            "timings": timings,
+            "cached": False
+        }
+
+    def generate_candidates(self, description, count, add_frame=True, frame_path="frames/frame1.png", cancel_event=None):
+        """
+        Generate several candidates concurrently, yielding each result as soon as it is ready.
+
+        DALL-E 3 only returns one image per request, so every candidate is its own pipeline.
+        Once cancel_event is set, or the caller stops iterating, candidates that have not
+        started are dropped and in-flight ones skip their remaining stages.
+
+        Args:
+            description (str): Character description
+            count (int): Number of candidates, capped at MAX_CANDIDATES
+            add_frame (bool): Whether to add the frame to the images
+            frame_path (str): Path to the frame image
+            cancel_event (threading.Event): Set to stop the remaining candidates
+
+        Yields:
+            dict: The generate_minecraft_image result of each candidate, plus its "index"
+        """
+        cancel_event = cancel_event or threading.Event()
+
+        def run(index):
+            if cancel_event.is_set():
+                return None
+
+            # Candidates still waiting for a generation slot give up before their DALL-E call
+            stages = self.generate_minecraft_image_stages(description, add_frame, frame_path, FRESH, cancel_event)
+            try:
+                for stage, payload in stages:
+                    if stage == "done":
+                        payload["index"] = index
+                        return payload
+                    if stage in CANCELLABLE_STAGES and cancel_event.is_set():
+                        return None
+            except Exception:
+                # Stopped by the cancellation, not a failure
+                if cancel_event.is_set():
+                    return None
+                raise
+            finally:
+                stages.close()
+
+        futures = [submit_with_context(self.candidate_executor, run, index) for index in range(min(count, self.max_candidates))]
+        errors = []
+        delivered = 0
+
+        try:
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Candidate generation failed: {e}")
+                    errors.append(e)
+                    continue
+
+                if result is not None:
+                    delivered += 1
+                    yield result
+        finally:
+            # Stop the candidates nobody is waiting for any more
+            cancel_event.set()
+            for future in futures:
+                future.cancel()
+
+        if not delivered and errors:
+            raise errors[0]
+
+    def _serve_cached(self, cached, start, timings):
+        # Sign a fresh URL for the existing blob while the image is loaded
+        filename = cached["filename"]
+        link_future = submit_with_context(self.executor, self._timed, timings, "link", self.build_link, filename)
+
+        if cached["image_path"] and os.path.exists(cached["image_path"]):
+            with open(cached["image_path"], "rb") as file:
+                raw_bytes = file.read()
+        else:
+            raw_bytes = self._timed(timings, "download", self.blob_client.download_bytes, filename)
+
+        timings["first_pixel"] = time.perf_counter() - start
+        image_bytes = io.BytesIO(raw_bytes)
+
+        preview = None
+        thumbnail = None
+        if self.encoder.preview_max_edge or self.encoder.thumbnail_max_edge:
+            image = self.encoder.open(image_bytes)
+            image_bytes.seek(0)
+            preview = self._timed(timings, "preview", self.encoder.encode_preview, image)
+            thumbnail = self._timed(timings, "thumbnail", self.encoder.encode_thumbnail, image)
+
+        display_bytes = preview.image_bytes if preview is not None else image_bytes
+        yield "image_framed", {"image_bytes": display_bytes.getvalue()}
+
+        link_event = link_future.result()
+        yield "link_ready", link_event
+
+        timings["total"] = time.perf_counter() - start
+        print(f"Served cached result {filename} in {timings['total']:.2f}s")
+        self._record_timings(filename, timings, cached=True)
+
+        yield "done", {
             "image_bytes": image_bytes,
+            "preview_bytes": preview.image_bytes if preview is not None else None,
+            "thumbnail_bytes": thumbnail.image_bytes.getvalue() if thumbnail is not None else None,
+            "content_type": cached["content_type"],
+            "blob_url": link_event["blob_url"],
+            "filename": filename,
+            "qr_bytes": link_event["qr_bytes"],
+            "timings": timings,
+            "cached": True
+        }
+
+    def load_display_image(self, filename):
+        """Download a stored image and return the bytes to show on screen: its preview rendition, or the image itself."""
+        image_bytes = self.blob_client.download_bytes(filename)
+        if not self.encoder.preview_max_edge:
+            return image_bytes
+        return self.encoder.encode_preview(self.encoder.open(io.BytesIO(image_bytes))).image_bytes.getvalue()
+
+    def _download(self, image_url):
+        # Stream the download through the pooled session into a single buffer
+        with self.http_session.get(image_url, stream=True, timeout=self.download_timeout) as image_response:
+            image_response.raise_for_status()
+            image_bytes = io.BytesIO()
+            for chunk in image_response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                image_bytes.write(chunk)
+
+        image_bytes.seek(0)
+        return image_bytes
+
+    def build_link(self, filename):
+        """
+        Sign a blob URL for filename and render a QR code pointing to it.
+        With short links enabled, blob_url is the short link and signed_url the URL it redirects to.
+        """
+        signed_url = self.blob_client.get_blob_url(filename, expiry_hours=self.sas_expiry_hours)
+        expires_at = time.time() + self.sas_expiry_hours * 3600
+
+        # Keep the blob at least as long as the new link is valid, for good when a batch pack reuses it
+        if self.artifact_index is not None:
+            self.artifact_index.extend_expiry(filename, expires_at, pinned=self.pin_uploads)
+
+        # A short link keeps the QR code small whatever the length of the signed URL
+        blob_url = self.short_links.shorten(signed_url, expires_at) if self.short_links is not None else signed_url
+
+        qr_bytes = generate_qr_code(blob_url)
+        return {
             "blob_url": blob_url,
-            "filename": filename
+            "signed_url": signed_url,
+            "filename": filename,
+            "qr_bytes": qr_bytes.getvalue()
         }
+
+    @staticmethod
+    def _timed(timings, stage, func, *args, **kwargs):
+        # Run a stage, record how long it took and trace it as a pipeline span
+        stage_start = time.perf_counter()
+        try:
+            with span(f"pipeline_{stage}"):
+                return func(*args, **kwargs)
+        finally:
+            timings[stage] = time.perf_counter() - stage_start
+
+    @staticmethod
+    def _record_timings(filename, timings, cached):
+        # The stages are already traced, add the end-to-end latencies
+        observe("pipeline_first_pixel", timings["first_pixel"])
+        observe("pipeline_total", timings["total"])
+        increment("pipeline_cached" if cached else "pipeline_generated")
+        log_event("pipeline_done", filename=filename, cached=cached, timings={k: round(v, 4) for k, v in timings.items()})
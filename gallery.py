@@ -0,0 +1,172 @@
+"""
+Per-session gallery of generated characters.
+Each session keeps a compact index of its characters (blob name, prompt, link, QR code and a
+small thumbnail); full images are only loaded from storage when a guest opens one, into a
+cache shared by every session. Sessions, the index as a whole and the image cache are each
+capped in bytes and evicted least recently used first, so memory stays flat during long events.
+"""
+import threading
+import time
+from collections import OrderedDict
+from telemetry import increment
+
+# Rough cost of an entry besides its bytes fields (dict, strings, timestamps)
+ENTRY_OVERHEAD_BYTES = 512
+
+def _entry_size(entry):
+    return ENTRY_OVERHEAD_BYTES + sum(
+        len(entry[name] or b"") for name in ("thumbnail_bytes", "qr_bytes")
+    ) + len(entry["description"]) + len(entry["blob_url"])
+
+class GalleryStore:
+    def __init__(self, session_entries=12, session_bytes=512 * 1024, total_bytes=64 * 1024 * 1024, image_cache_bytes=32 * 1024 * 1024):
+        """
+        Args:
+            session_entries (int): Characters kept per session
+            session_bytes (int): Index bytes kept per session
+            total_bytes (int): Index bytes kept across every session
+            image_cache_bytes (int): Bytes of full images kept across every session
+        """
+        self.session_entries = session_entries
+        self.session_bytes = session_bytes
+        self.total_bytes = total_bytes
+        self.image_cache_bytes = image_cache_bytes
+        self.evictions = 0
+        self.image_hits = 0
+        self.image_misses = 0
+        self._sessions = {}
+        self._session_sizes = {}
+        # Every entry of every session, least recently used first
+        self._entries = OrderedDict()
+        self._size = 0
+        self._images = OrderedDict()
+        self._images_size = 0
+        self._lock = threading.Lock()
+
+    def add(self, session_id, result, description, link_expires_at):
+        """
+        Add a generated character to a session's gallery, most recent last.
+
+        Args:
+            session_id (str): The guest's session
+            result (dict): Job result with filename, blob_url, qr_bytes, thumbnail_bytes and image_bytes
+            description (str): Prompt the character was generated from
+            link_expires_at (float): When result's blob_url stops working
+
+        The displayed image also seeds the image cache, so the new character is not downloaded again.
+        """
+        entry = {
+            "filename": result["filename"],
+            "description": description,
+            "blob_url": result["blob_url"],
+            "qr_bytes": result["qr_bytes"],
+            "thumbnail_bytes": result.get("thumbnail_bytes"),
+            "link_expires_at": link_expires_at,
+            "created_at": time.time()
+        }
+
+        with self._lock:
+            self._remove((session_id, entry["filename"]))
+            self._insert(session_id, entry)
+            self._put_image(entry["filename"], result["image_bytes"])
+
+    def entries(self, session_id):
+        """Return a session's characters, most recent first."""
+        with self._lock:
+            session = self._sessions.get(session_id, {})
+            return [dict(entry) for entry in sorted(session.values(), key=lambda entry: entry["created_at"], reverse=True)]
+
+    def get(self, session_id, filename):
+        """Return one of a session's characters and mark it as recently used, or None if it was evicted."""
+        with self._lock:
+            entry = self._sessions.get(session_id, {}).get(filename)
+            if entry is None:
+                return None
+            self._entries.move_to_end((session_id, filename))
+            return dict(entry)
+
+    def update_link(self, session_id, filename, blob_url, qr_bytes, link_expires_at):
+        """Replace an entry's expired link and QR code with freshly signed ones."""
+        with self._lock:
+            entry = self._sessions.get(session_id, {}).get(filename)
+            if entry is None:
+                return
+            self._remove((session_id, filename))
+            entry.update({"blob_url": blob_url, "qr_bytes": qr_bytes, "link_expires_at": link_expires_at})
+            self._insert(session_id, entry)
+
+    def load_image(self, filename, loader):
+        """
+        Return the image to display for filename, from the cache or by calling loader().
+
+        The loader runs outside the lock, so one slow download does not hold up other sessions.
+        """
+        with self._lock:
+            image_bytes = self._images.get(filename)
+            if image_bytes is not None:
+                self._images.move_to_end(filename)
+                self.image_hits += 1
+                increment("gallery_image_hits")
+                return image_bytes
+            self.image_misses += 1
+        increment("gallery_image_misses")
+
+        image_bytes = loader()
+        with self._lock:
+            self._put_image(filename, image_bytes)
+        return image_bytes
+
+    def stats(self):
+        """Return the number of sessions and entries, the bytes held and the image cache counters."""
+        with self._lock:
+            lookups = self.image_hits + self.image_misses
+            return {
+                "sessions": len(self._sessions),
+                "entries": len(self._entries),
+                "index_bytes": self._size,
+                "images": len(self._images),
+                "image_bytes": self._images_size,
+                "image_hit_rate": self.image_hits / lookups if lookups else 0.0,
+                "evictions": self.evictions
+            }
+
+    def _insert(self, session_id, entry):
+        key = (session_id, entry["filename"])
+        size = _entry_size(entry)
+        self._sessions.setdefault(session_id, {})[entry["filename"]] = entry
+        self._session_sizes[session_id] = self._session_sizes.get(session_id, 0) + size
+        self._entries[key] = size
+        self._size += size
+
+        # The session's own caps first, oldest entry out, then the global cap across sessions
+        session = self._sessions[session_id]
+        while len(session) > 1 and (len(session) > self.session_entries or self._session_sizes[session_id] > self.session_bytes):
+            oldest = min(session.values(), key=lambda other: other["created_at"])
+            self._remove((session_id, oldest["filename"]))
+            self.evictions += 1
+        while self._size > self.total_bytes and len(self._entries) > 1:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key):
+        size = self._entries.pop(key, None)
+        if size is None:
+            return
+        session_id, filename = key
+        self._size -= size
+        self._session_sizes[session_id] -= size
+        del self._sessions[session_id][filename]
+        if not self._sessions[session_id]:
+            del self._sessions[session_id]
+            del self._session_sizes[session_id]
+
+    def _put_image(self, filename, image_bytes):
+        if filename in self._images:
+            self._images_size -= len(self._images.pop(filename))
+        if len(image_bytes) > self.image_cache_bytes:
+            return
+        self._images[filename] = image_bytes
+        self._images_size += len(image_bytes)
+        while self._images_size > self.image_cache_bytes:
+            _, evicted = self._images.popitem(last=False)
+            self._images_size -= len(evicted)
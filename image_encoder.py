@@ -0,0 +1,115 @@
+import io
+from PIL import Image
+
+# PIL format name, MIME type and file extension for every supported output format
+FORMATS = {
+    "png": ("PNG", "image/png", "png"),
+    "webp": ("WEBP", "image/webp", "webp"),
+    "jpeg": ("JPEG", "image/jpeg", "jpg"),
+}
+
+class EncodedImage:
+    def __init__(self, image_bytes, content_type, extension):
+        self.image_bytes = image_bytes
+        self.content_type = content_type
+        self.extension = extension
+
+    @property
+    def size(self):
+        return self.image_bytes.getbuffer().nbytes
+
+class ImageEncoder:
+    def __init__(self, format="png", quality=85, compress_level=6, max_bytes=None, min_quality=40, preview_max_edge=0, thumbnail_max_edge=0):
+        """
+        Args:
+            format (str): Output format, one of FORMATS
+            quality (int): Quality for WebP and JPEG (1-100)
+            compress_level (int): zlib compression level for PNG (0-9, lower is faster)
+            max_bytes (int): Optional size target; lossy formats lower their quality until they fit
+            min_quality (int): Lowest quality tried when meeting max_bytes
+            preview_max_edge (int): Longest edge of the preview rendition, 0 to disable previews
+            thumbnail_max_edge (int): Longest edge of the gallery thumbnail, 0 to disable thumbnails
+        """
+        if format not in FORMATS:
+            raise ValueError(f"Unknown image format '{format}', expected one of: {', '.join(FORMATS)}")
+
+        self.format = format
+        self.quality = quality
+        self.compress_level = compress_level
+        self.max_bytes = max_bytes
+        self.min_quality = min_quality
+        self.preview_max_edge = preview_max_edge
+        self.thumbnail_max_edge = thumbnail_max_edge
+
+        _, self.content_type, self.extension = FORMATS[format]
+
+    def open(self, image_bytes):
+        """Decode image bytes into an RGB image."""
+        return Image.open(image_bytes).convert("RGB")
+
+    def encode(self, image):
+        """
+        Encode an image in the configured format.
+
+        Args:
+            image (PIL.Image.Image): The image to encode
+
+        Returns:
+            EncodedImage: The encoded bytes with their content type and file extension
+        """
+        encoded = self._save(image, self.format, self.quality)
+
+        # Lossless PNG cannot trade quality for size
+        if self.max_bytes and self.format != "png" and encoded.getbuffer().nbytes > self.max_bytes:
+            encoded = self._fit_to_size(image)
+
+        return EncodedImage(encoded, self.content_type, self.extension)
+
+    def encode_preview(self, image):
+        """Return a lightweight JPEG rendition for on-screen display, or None if previews are disabled."""
+        if not self.preview_max_edge:
+            return None
+
+        preview = image.copy()
+        preview.thumbnail((self.preview_max_edge, self.preview_max_edge))
+        return EncodedImage(self._save(preview, "jpeg", 80), "image/jpeg", "jpg")
+
+    def encode_thumbnail(self, image):
+        """Return a small JPEG rendition for the gallery, or None if thumbnails are disabled."""
+        if not self.thumbnail_max_edge:
+            return None
+
+        thumbnail = image.copy()
+        # reducing_gap shrinks by whole factors first, much faster from the full-size image
+        thumbnail.thumbnail((self.thumbnail_max_edge, self.thumbnail_max_edge), reducing_gap=2.0)
+        return EncodedImage(self._save(thumbnail, "jpeg", 75), "image/jpeg", "jpg")
+
+    def _fit_to_size(self, image):
+        # Binary search for the highest quality that still fits in max_bytes
+        low, high = self.min_quality, self.quality - 1
+        best = self._save(image, self.format, low)
+
+        while low <= high:
+            quality = (low + high) // 2
+            candidate = self._save(image, self.format, quality)
+            if candidate.getbuffer().nbytes <= self.max_bytes:
+                best = candidate
+                low = quality + 1
+            else:
+                high = quality - 1
+
+        return best
+
+    def _save(self, image, format, quality):
+        pil_format = FORMATS[format][0]
+        result_bytes = io.BytesIO()
+
+        if format == "png":
+            image.save(result_bytes, format=pil_format, compress_level=self.compress_level)
+        elif format == "webp":
+            image.save(result_bytes, format=pil_format, quality=quality, method=4)
+        else:
+            image.save(result_bytes, format=pil_format, quality=quality, optimize=True, progressive=True)
+
+        result_bytes.seek(0)  # Reset the pointer to the beginning
+        return result_bytes
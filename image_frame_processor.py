@@ -1,57 +1,129 @@
-import io
+import os
+from functools import lru_cache
 from PIL import Image
+from image_encoder import ImageEncoder
+
+# Frame dimensions
+FRAME_SIZE = (1705, 1705)
+HOLE_SIZE = (1400, 1400)
+
+RESAMPLING_FILTERS = {
+    "nearest": Image.Resampling.NEAREST,
+    "box": Image.Resampling.BOX,
+    "bilinear": Image.Resampling.BILINEAR,
+    "hamming": Image.Resampling.HAMMING,
+    "bicubic": Image.Resampling.BICUBIC,
+    "lanczos": Image.Resampling.LANCZOS,
+}
+
+# Size of the tiles used to find which parts of the hole the frame overlaps
+MASK_TILE_SIZE = 64
+
+class FrameAsset:
+    """A frame pre-scaled to FRAME_SIZE and split into what compositing needs."""
+    def __init__(self, frame, hole_box):
+        # The frame flattened to RGB, used as the canvas for every framed image
+        self.canvas = frame.convert("RGB")
+        self.hole_offset = hole_box[:2]
+
+        # Only the tiles of the hole where the frame is not fully transparent need blending
+        hole = frame.crop(hole_box)
+        hole_overlay = hole.convert("RGB")
+        hole_mask = hole.getchannel("A")
+
+        self.overlay_tiles = []
+        for top in range(0, hole.height, MASK_TILE_SIZE):
+            for left in range(0, hole.width, MASK_TILE_SIZE):
+                box = (left, top, min(left + MASK_TILE_SIZE, hole.width), min(top + MASK_TILE_SIZE, hole.height))
+                mask_tile = hole_mask.crop(box)
+                if mask_tile.getbbox() is not None:
+                    self.overlay_tiles.append((box[:2], hole_overlay.crop(box), mask_tile))
+
+@lru_cache(maxsize=16)
+def _load_frame_asset(frame_path, mtime, frame_size, hole_size, resample):
+    # mtime is part of the key so an edited frame is picked up again
+    frame = Image.open(frame_path).convert("RGBA")
+
+    # Resize the frame to the expected dimensions if needed
+    if frame.size != frame_size:
+        frame = frame.resize(frame_size, resample)
+
+    # The hole is centered in the frame
+    x_offset = (frame_size[0] - hole_size[0]) // 2
+    y_offset = (frame_size[1] - hole_size[1]) // 2
+    hole_box = (x_offset, y_offset, x_offset + hole_size[0], y_offset + hole_size[1])
+
+    return FrameAsset(frame, hole_box)
 
 class ImageFrameProcessor:
-    def __init__(self, frames_directory="frames"):
+    def __init__(self, frames_directory="frames", resample="bicubic", preload=True, encoder=None):
+        """
+        Args:
+            frames_directory (str): Directory containing the frame images
+            resample (str): Resampling filter used to scale images, one of RESAMPLING_FILTERS
+            preload (bool): Load and pre-scale every frame in frames_directory up front
+            encoder (ImageEncoder): Encoder used by add_frame, PNG by default
+        """
+        if resample not in RESAMPLING_FILTERS:
+            raise ValueError(f"Unknown resampling filter '{resample}', expected one of: {', '.join(RESAMPLING_FILTERS)}")
+
         self.frames_directory = frames_directory
-    
+        self.resample = RESAMPLING_FILTERS[resample]
+        self.encoder = encoder or ImageEncoder()
+
+        if preload:
+            self.preload_frames()
+
+    def preload_frames(self):
+        """Load and pre-scale every frame image in frames_directory."""
+        if not os.path.isdir(self.frames_directory):
+            return
+
+        for name in sorted(os.listdir(self.frames_directory)):
+            if name.lower().endswith(".png"):
+                self.get_frame_asset(os.path.join(self.frames_directory, name))
+
+    def get_frame_asset(self, frame_path):
+        """Return the cached, pre-scaled asset for a frame image."""
+        return _load_frame_asset(frame_path, os.path.getmtime(frame_path), FRAME_SIZE, HOLE_SIZE, self.resample)
+
     def add_frame(self, image_bytes, frame_path):
         """
         Add a frame to an image.
-        
+
         Args:
             image_bytes (io.BytesIO): The image as bytes
             frame_path (str): Path to the frame image
-            
+
         Returns:
             io.BytesIO: The processed image with frame added
         """
-        # Open the image bytes with PIL
-        base_image = Image.open(image_bytes).convert("RGBA")
-        
-        # Open the frame
-        frame = Image.open(frame_path).convert("RGBA")
-        
-        # Frame dimensions
-        frame_width, frame_height = 1705, 1705
-        hole_width, hole_height = 1400, 1400
-        
-        # Resize the frame to the expected dimensions if needed
-        if frame.size != (frame_width, frame_height):
-            frame = frame.resize((frame_width, frame_height))
-        
-        # Resize the base image to fit the hole
-        base_image = base_image.resize((hole_width, hole_height))
-        
-        # Create a new blank image with frame dimensions
-        result = Image.new("RGBA", (frame_width, frame_height), (0, 0, 0, 0))
-        
-        # Calculate the position to paste the base image (centered in the frame)
-        x_offset = (frame_width - hole_width) // 2
-        y_offset = (frame_height - hole_height) // 2
-        
-        # Paste the base image onto the blank canvas
-        result.paste(base_image, (x_offset, y_offset))
-        
-        # Composite the frame over the base image
-        result = Image.alpha_composite(result, frame)
-        
-        # Convert back to RGB
-        final_image = result.convert("RGB")
-        
-        # Save the result to bytes
-        result_bytes = io.BytesIO()
-        final_image.save(result_bytes, format="PNG")
-        result_bytes.seek(0)  # Reset the pointer to the beginning
-        
-        return result_bytes
+        final_image = self.frame_image(image_bytes, frame_path)
+        return self.encoder.encode(final_image).image_bytes
+
+    def frame_image(self, image_bytes, frame_path):
+        """
+        Add a frame to an image without encoding the result.
+
+        Args:
+            image_bytes (io.BytesIO): The image as bytes
+            frame_path (str): Path to the frame image
+
+        Returns:
+            PIL.Image.Image: The framed RGB image
+        """
+        asset = self.get_frame_asset(frame_path)
+
+        # Open the image bytes with PIL and resize it to fit the hole
+        base_image = Image.open(image_bytes).convert("RGB")
+        base_image = base_image.resize(HOLE_SIZE, self.resample)
+
+        # Blend the frame over the image only where the frame is not transparent
+        for position, overlay, mask in asset.overlay_tiles:
+            base_image.paste(overlay, position, mask)
+
+        # Place the image in the hole of a copy of the pre-rendered frame
+        final_image = asset.canvas.copy()
+        final_image.paste(base_image, asset.hole_offset)
+
+        return final_image
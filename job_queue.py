@@ -0,0 +1,420 @@
+"""
+Background job queue for character generation.
+Jobs are submitted from the Streamlit script and run on a pool of worker threads,
+so the UI only has to poll for their status.
+"""
+import hashlib
+import itertools
+import json
+import queue
+import threading
+import time
+import uuid
+from telemetry import span, observe, increment, get_request_id, set_request_id
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+# How often a job waiting for a deployment slot checks whether it was cancelled
+SLOT_POLL_SECONDS = 0.5
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at capacity."""
+
+class Job:
+    def __init__(self, description, deployment, sequence, options=None):
+        self.job_id = uuid.uuid4().hex
+        # Carries the submitter's request ID so the job's spans can be matched with it
+        self.request_id = get_request_id() or self.job_id
+        self.description = description
+        self.deployment = deployment
+        self.sequence = sequence
+        self.options = options or {}
+        self.status = QUEUED
+        self.result = None
+        self.partial = {}
+        self.error = None
+        self.cancel_event = threading.Event()
+        # Set by coalesce while this job leads its prompt in the result store, so its lease is kept alive
+        self.claimed = False
+        # Set once nobody will poll the job again, so it is dropped as soon as it finishes
+        self.released = False
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def is_finished(self):
+        return self.status in (DONE, FAILED)
+
+class JobQueue:
+    def __init__(self, handler, num_workers=2, max_queue_size=20, deployment_limits=None, job_ttl_seconds=3600, result_store=None, coalesce=None):
+        """
+        Create a job queue and start its workers.
+
+        Args:
+            handler (callable): Called with a Job on a worker thread; its return value becomes job.result
+            num_workers (int): Number of worker threads
+            max_queue_size (int): Maximum number of queued jobs before submit() raises QueueFullError
+            deployment_limits (dict): Maximum concurrent running jobs per deployment name
+            job_ttl_seconds (int): How long finished jobs are kept for polling
+            result_store (ResultStore): Shared store consulted for jobs submitted to other replicas
+            coalesce (callable): Called with a Job before it takes a deployment slot; returns None to run the
+                handler, or a callable waiting for an identical job elsewhere, whose return value becomes
+                job.result (None to run the job after all)
+        """
+        self.handler = handler
+        self.coalesce = coalesce
+        self.job_ttl_seconds = job_ttl_seconds
+        self.result_store = result_store
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+        self._deployment_limits = {
+            deployment: threading.BoundedSemaphore(limit)
+            for deployment, limit in (deployment_limits or {}).items()
+        }
+        self._workers = []
+
+        for index in range(num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f"job-worker-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, description, deployment="dalle", **options):
+        """
+        Queue a generation job.
+
+        Returns:
+            Job: The queued job
+
+        Raises:
+            QueueFullError: If the queue is full
+        """
+        self._prune_finished()
+
+        with self._lock:
+            job = Job(description, deployment, next(self._sequence), options)
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                raise QueueFullError("Too many generation requests are waiting, please try again shortly")
+            self._jobs[job.job_id] = job
+
+        return job
+
+    def get_job(self, job_id):
+        """Return the job with the given ID, or None if it is unknown or expired.
+
+        Jobs this process does not know are looked up in the shared result store, if there is one.
+        """
+        self._prune_finished()
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None and self.result_store is not None:
+            record = self.result_store.get(job_id)
+            if record is not None:
+                job = _job_from_record(record)
+        return job
+
+    def release(self, job_id):
+        """Forget a job once its result has been consumed, so its images are not held until the TTL.
+
+        A job still running is forgotten when it finishes.
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.released = True
+            if job.is_finished():
+                del self._jobs[job_id]
+
+    def retained_bytes(self):
+        """Return the approximate bytes held by the results and partial payloads of the jobs still tracked."""
+        with self._lock:
+            return sum(_payload_bytes(job.result) + _payload_bytes(job.partial) for job in self._jobs.values())
+
+    def queue_position(self, job_id):
+        """Return the 1-based position of a queued job, or 0 if it is no longer waiting."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != QUEUED:
+                return 0
+            return 1 + sum(
+                1 for other in self._jobs.values()
+                if other.status == QUEUED and other.sequence < job.sequence
+            )
+
+    def cancel(self, job_id):
+        """Ask a job to stop; queued jobs are skipped and running ones stop at their next stage."""
+        job = self.get_job(job_id)
+        if job is not None:
+            job.cancel_event.set()
+
+    def stats(self):
+        """Return the number of jobs in each status."""
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+    def _worker_loop(self):
+        while True:
+            job = self._queue.get()
+            try:
+                follow = None
+                if self.coalesce is not None and not job.cancel_event.is_set():
+                    follow = self.coalesce(job)
+
+                if follow is not None:
+                    # Waiting for an identical job elsewhere needs neither a deployment slot nor this worker
+                    threading.Thread(target=self._follow, args=(job, follow), name=f"job-follower-{job.job_id[:8]}", daemon=True).start()
+                else:
+                    self._run(job)
+            except Exception as e:
+                # coalesce() failed, e.g. the shared store is unreachable
+                self._fail(job, e)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job):
+        limit = self._deployment_limits.get(job.deployment)
+        acquired = False
+        started = False
+
+        try:
+            # Respect the per-deployment concurrency limit
+            if limit is not None:
+                self._acquire(limit, job)
+                acquired = True
+
+            if job.cancel_event.is_set():
+                raise Exception("Cancelled")
+            self._start(job)
+            started = True
+            with span("job_run", job_id=job.job_id, deployment=job.deployment):
+                job.result = self.handler(job)
+            job.status = DONE
+            self._finish(job)
+        except Exception as e:
+            if job.claimed and not started and self.result_store is not None:
+                # The handler never ran, hand the prompt to the jobs waiting for it rather than let them wait out the lease
+                self.result_store.fail(job.job_id, str(e), retryable=True)
+            self._fail(job, e)
+        finally:
+            if acquired:
+                limit.release()
+
+    def _acquire(self, limit, job):
+        if not job.claimed or self.result_store is None:
+            limit.acquire()
+            return
+
+        # A job leading its prompt keeps the lease alive while it waits, and stops waiting once cancelled
+        interval = self.result_store.lease_seconds / 3
+        heartbeat_at = time.monotonic() + interval
+        while not limit.acquire(timeout=min(SLOT_POLL_SECONDS, interval)):
+            if job.cancel_event.is_set():
+                raise Exception("Cancelled")
+            if time.monotonic() >= heartbeat_at:
+                self.result_store.heartbeat(job.job_id)
+                heartbeat_at = time.monotonic() + interval
+
+    def _follow(self, job, follow):
+        try:
+            self._start(job)
+            with span("job_follow", job_id=job.job_id, deployment=job.deployment):
+                result = follow()
+        except Exception as e:
+            self._fail(job, e)
+            return
+
+        if result is None:
+            # The job it waited for went away, queue this one to generate the prompt itself
+            job.status = QUEUED
+            self._queue.put(job)
+            return
+
+        job.result = result
+        job.status = DONE
+        self._finish(job)
+
+    def _start(self, job):
+        set_request_id(job.request_id)
+        if job.started_at is None:
+            job.started_at = time.time()
+            observe("job_wait", job.started_at - job.submitted_at)
+        job.status = RUNNING
+
+    def _fail(self, job, error):
+        print(f"Job {job.job_id} failed: {error}")
+        job.error = str(error)
+        job.status = FAILED
+        self._finish(job)
+
+    def _finish(self, job):
+        # Intermediate stage payloads are only shown while the job runs
+        job.partial = {}
+        job.finished_at = time.time()
+        if job.released:
+            with self._lock:
+                self._jobs.pop(job.job_id, None)
+
+    def _prune_finished(self):
+        # Forget finished jobs nobody polled within the TTL
+        cutoff = time.time() - self.job_ttl_seconds
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job.is_finished() and job.finished_at < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+def _payload_bytes(value):
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(_payload_bytes(item) for item in value.values())
+    if isinstance(value, list):
+        return sum(_payload_bytes(item) for item in value)
+    return 0
+
+def _job_from_record(record):
+    # A read-only view of a job run by another replica
+    from shared_results import RUNNING as SHARED_RUNNING, FOLLOWING, DONE as SHARED_DONE, ABANDONED
+
+    job = Job(record["description"], None, 0)
+    job.job_id = record["job_id"]
+    if record["status"] in (SHARED_RUNNING, FOLLOWING) and not record["lease_expired"]:
+        job.status = RUNNING
+    elif record["status"] == SHARED_DONE:
+        job.status = DONE
+        job.result = record["result"]
+    else:
+        job.status = FAILED
+        job.error = "The generation was interrupted, please try again" if record["status"] == ABANDONED or record["lease_expired"] else record["error"]
+    if job.is_finished():
+        job.finished_at = time.time()
+    return job
+
+def dedup_key(job):
+    """Return the key identical requests share in the result store, or None if the job must not be coalesced."""
+    from result_cache import normalize_description, ROUND_ROBIN, FRESH
+
+    # Guests asking for another or a fresh variant expect a different image
+    if job.options.get("cache_policy") in (ROUND_ROBIN, FRESH):
+        return None
+
+    material = json.dumps([normalize_description(job.description), job.deployment, job.options], sort_keys=True, default=str)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+def run_generation_job(job):
+    """Default job handler: generate, frame and upload the character along with its QR code."""
+    from service_registry import get_image_generator, get_warm_pool, get_result_store
+
+    def on_event(stage, payload):
+        # Expose intermediate results (e.g. the unframed image) to pollers
+        if stage != "done":
+            job.partial[stage] = payload
+
+    options = dict(job.options)
+    candidates = options.pop("candidates", 1)
+
+    if candidates > 1:
+        # Candidates are always fresh generations
+        options.pop("cache_policy", None)
+
+        # Stream every candidate to pollers as soon as it is ready
+        job.partial["candidates"] = []
+        for result in get_image_generator().generate_candidates(job.description, candidates, cancel_event=job.cancel_event, **options):
+            job.partial["candidates"].append(_display_result(result))
+        return {"candidates": job.partial["candidates"]}
+
+    def generate(on_event):
+        # Hand out a pre-generated character when the warm pool has one for this prompt
+        warm_pool = get_warm_pool()
+        result = warm_pool.take(job.description) if warm_pool is not None else None
+
+        if result is None:
+            result = get_image_generator().generate_minecraft_image(job.description, on_event=on_event, cancel_event=job.cancel_event, **options)
+
+        return _display_result(result)
+
+    store = get_result_store()
+    if store is None or not job.claimed:
+        return generate(on_event)
+
+    # coalesce_generation_job() already claimed the prompt for this job
+    return _run_as_leader(job, store, generate, on_event)
+
+def coalesce_generation_job(job, store=None):
+    """
+    Claim the job's prompt in the shared result store, before the job takes a deployment slot.
+
+    Args:
+        job (Job): The job about to run
+        store (ResultStore): Store to claim the prompt in, the shared one by default
+
+    Returns:
+        callable: None when this job should generate the prompt, otherwise a function waiting for the
+        identical job that does; it returns that job's result, or None if the job went away
+    """
+    if store is None:
+        from service_registry import get_result_store
+        store = get_result_store()
+    if store is None or job.options.get("candidates", 1) > 1:
+        return None
+
+    leader_id = store.claim(job.job_id, dedup_key(job), job.description)
+    job.claimed = leader_id == job.job_id
+    if job.claimed:
+        return None
+
+    increment("result_store_coalesced")
+
+    def follow():
+        record = store.wait(leader_id, cancel_event=job.cancel_event)
+        if job.cancel_event.is_set():
+            raise Exception("Cancelled")
+        if record is None:
+            return None
+        if record["status"] == FAILED:
+            raise Exception(record["error"])
+        return record["result"]
+
+    return follow
+
+def _run_as_leader(job, store, generate, on_event):
+    """Generate a claimed prompt, keeping its lease alive and publishing the result to the waiting jobs."""
+    def on_event_with_heartbeat(stage, payload):
+        # Every pipeline stage renews the lease, so followers keep waiting
+        store.heartbeat(job.job_id)
+        on_event(stage, payload)
+
+    try:
+        result = generate(on_event_with_heartbeat)
+    except Exception as e:
+        store.fail(job.job_id, str(e), retryable=job.cancel_event.is_set())
+        raise
+
+    store.complete(job.job_id, result)
+    return result
+
+def _display_result(result):
+    # Show the lightweight preview rendition when there is one
+    display_bytes = result["preview_bytes"] or result["image_bytes"]
+
+    return {
+        "image_bytes": display_bytes.getvalue(),
+        "thumbnail_bytes": result["thumbnail_bytes"],
+        "qr_bytes": result["qr_bytes"],
+        "blob_url": result["blob_url"],
+        "filename": result["filename"],
+        "timings": result["timings"],
+        "cached": result["cached"]
+    }
@@ -1,17 +1,34 @@
 """
 Simple configuration loader for LLM models.
 Dynamically loads model configurations from environment variables.
+Models are discovered on first use rather than at import, so importing this module is cheap
+and variables set after the import are still seen.
 """
 import os
-from dotenv import load_dotenv
+import threading
 
-load_dotenv()
+_models = None
+_models_lock = threading.Lock()
+_settings_loaded = False
+_settings_lock = threading.Lock()
+
+def load_settings():
+    """Load .env into the environment, once per process, before the first setting is read."""
+    global _settings_loaded
+    if not _settings_loaded:
+        with _settings_lock:
+            if not _settings_loaded:
+                from dotenv import load_dotenv
+                load_dotenv()
+                _settings_loaded = True
 
 def _discover_models():
     """
     Discover models from environment variables by looking for variable groups
     with the pattern DEPLOYMENT_NAME_*.
     """
+    load_settings()
+
     models = {}
     
     deployment_vars = [v for v in os.environ if v.startswith('DEPLOYMENT_NAME_')]
@@ -35,16 +52,30 @@ def _discover_models():
     
     return models
 
-MODELS = _discover_models()
+def get_models():
+    """Return the discovered models, discovering them on the first call."""
+    global _models
+    if _models is None:
+        with _models_lock:
+            if _models is None:
+                _models = _discover_models()
+    return _models
+
+def __getattr__(name):
+    # MODELS is still available as a module attribute, computed on first access
+    if name == "MODELS":
+        return get_models()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 def get_model_names():
     """Return a list of tuples containing model IDs and their display names."""
-    return [(key, model["name"]) for key, model in MODELS.items()]
+    return [(key, model["name"]) for key, model in get_models().items()]
 
 def get_model_info(model_id):
     """Retrieve configuration information for a given model ID."""
-    if model_id in MODELS:
-        return MODELS[model_id]
+    models = get_models()
+    if model_id in models:
+        return models[model_id]
     else:
         raise ValueError(f"Model ID '{model_id}' not found in configuration")
 
@@ -60,3 +91,24 @@ def get_env_variable_keys(model_id):
         "deployment_name": f"DEPLOYMENT_NAME_{suffix}",
         "api_type": f"API_TYPE_{suffix}"
     }
+
+def get_concurrency_limit(model_id, default=2):
+    """Return the maximum number of concurrent requests allowed for a model ID (MAX_CONCURRENCY_*)."""
+    model = get_model_info(model_id)
+    return int(os.getenv(f"MAX_CONCURRENCY_{model['suffix']}", default))
+
+def get_rate_limit_config(model_id):
+    """Retrieve rate limit and retry settings for a model ID from the optional *_<SUFFIX> variables."""
+    suffix = get_model_info(model_id)["suffix"]
+
+    def setting(key, default):
+        return float(os.getenv(f"{key}_{suffix}", default))
+
+    return {
+        "rpm": setting("RPM", 0),
+        "tpm": setting("TPM", 0),
+        "max_retries": int(setting("MAX_RETRIES", 3)),
+        "timeout": setting("TIMEOUT", 60),
+        "circuit_failures": int(setting("CIRCUIT_FAILURES", 5)),
+        "circuit_reset_seconds": setting("CIRCUIT_RESET_SECONDS", 30)
+    }
@@ -1,13 +1,29 @@
 import os
-from models_config import get_env_variable_keys
-from openai import AzureOpenAI
+import threading
+from models_config import get_env_variable_keys, get_rate_limit_config
 
 class OpenAIClient:
     def __init__(self, model_id="gpt4o_1"):
         self.model_id = model_id
         self.deployment_name = ""
+        self._client = None
+        self._lock = threading.Lock()
 
     def get_client(self):
+        # Reuse the client (and its HTTP connection pool) once it has been built
+        if self._client is not None:
+            return self._client
+
+        with self._lock:
+            if self._client is None:
+                self._client = self._create_client()
+
+        return self._client
+
+    def _create_client(self):
+        # The SDK is imported on first use, it is slow to import
+        from openai import AzureOpenAI
+
         env_keys = get_env_variable_keys(self.model_id)
 
         endpoint = os.getenv(env_keys["endpoint"])
@@ -20,12 +36,13 @@ class OpenAIClient:
             missing = [key for key, val in env_keys.items() if not os.getenv(val)]
             raise ValueError(f"Missing environment variables: {', '.join(missing)}")
 
+        # Retries are handled by the deployment's RateGovernor, not by the SDK
         client = AzureOpenAI(
             azure_endpoint=endpoint,
             api_key=api_key,
             api_version=api_version,
-            max_retries=3,
-            timeout=60  # Increased timeout for image generation
+            max_retries=0,
+            timeout=get_rate_limit_config(self.model_id)["timeout"]
         )
 
         return client
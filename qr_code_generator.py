@@ -1,24 +1,158 @@
-import qrcode
 import io
+import os
+from functools import lru_cache
+from models_config import load_settings
+from telemetry import span
+
+# qrcode, NumPy and PIL are imported on first render, they are slow to import
+
+ERROR_CORRECTION_LEVELS = ("L", "M", "Q", "H")
+
+# Share of the QR code width covered by the logo, small enough for level H to recover
+LOGO_FRACTION = 0.22
+
+_settings = None
+_cached_render = None
+
+def get_qr_settings():
+    """
+    Return the defaults used by generate_qr_code, the QR code shown to guests.
+
+    The QR_* variables are read on the first call, so .env and variables set after the import are seen.
+
+    Returns:
+        dict: format, error_correction, box_size, border, logo_path, mask_pattern and cache_size
+    """
+    global _settings
+    if _settings is None:
+        load_settings()
+        mask_pattern = os.getenv("QR_MASK_PATTERN")
+        _settings = {
+            "format": os.getenv("QR_FORMAT", "png"),
+            "error_correction": os.getenv("QR_ERROR_CORRECTION", "L").upper(),
+            "box_size": int(os.getenv("QR_BOX_SIZE", 10)),
+            "border": int(os.getenv("QR_BORDER", 4)),
+            "logo_path": os.getenv("QR_LOGO_PATH") or None,
+            # A fixed mask (0-7) skips scoring all eight masks, the slowest step; empty picks the best one
+            "mask_pattern": int(mask_pattern) if mask_pattern else None,
+            "cache_size": int(os.getenv("QR_CACHE_SIZE", 64))
+        }
+    return _settings
+
+def generate_qr_code(url, format=None, error_correction=None, box_size=None, border=None, logo_path=None, mask_pattern=None):
+    """
+    Generate a QR code for the given URL and return bytes.
+
+    Args:
+        url (str): Data to encode
+        format (str): "png", or "svg" for a vector image the browser scales itself
+        error_correction (str): "L", "M", "Q" or "H"; a logo always uses "H"
+        box_size (int): Pixels per module for PNG output
+        border (int): Quiet zone width in modules
+        logo_path (str): Optional image pasted in the centre of PNG codes
+        mask_pattern (int): Fixed mask pattern (0-7) instead of the best scoring one
+
+    Returns:
+        io.BytesIO: The encoded QR code
+    """
+    settings = get_qr_settings()
+    format = format or settings["format"]
+    error_correction = (error_correction or settings["error_correction"]).upper()
+    box_size = box_size or settings["box_size"]
+    border = settings["border"] if border is None else border
+    logo_path = logo_path or settings["logo_path"]
+    mask_pattern = settings["mask_pattern"] if mask_pattern is None else mask_pattern
+
+    if format not in ("png", "svg"):
+        raise ValueError(f"Unknown QR code format '{format}', expected png or svg")
+    if error_correction not in ERROR_CORRECTION_LEVELS:
+        raise ValueError(f"Unknown error correction level '{error_correction}', expected L, M, Q or H")
+
+    # The logo hides modules, only the highest level recovers them reliably
+    logo_mtime = None
+    if logo_path and format == "png":
+        error_correction = "H"
+        logo_mtime = os.path.getmtime(logo_path)
+    else:
+        logo_path = None
+
+    with span("qr_code", format=format):
+        return io.BytesIO(_render(url, format, error_correction, box_size, border, logo_path, logo_mtime, mask_pattern))
+
+def _render(url, format, error_correction, box_size, border, logo_path, logo_mtime, mask_pattern):
+    # Cached by URL and render options, the same link always gives the same image; QR_CACHE_SIZE entries
+    global _cached_render
+    if _cached_render is None:
+        _cached_render = lru_cache(maxsize=get_qr_settings()["cache_size"])(_render_uncached)
+    return _cached_render(url, format, error_correction, box_size, border, logo_path, logo_mtime, mask_pattern)
+
+def clear_render_cache():
+    """Forget the rendered QR codes, e.g. to time uncached renders."""
+    if _cached_render is not None:
+        _cached_render.cache_clear()
+
+def _render_uncached(url, format, error_correction, box_size, border, logo_path, logo_mtime, mask_pattern):
+    matrix = _module_matrix(url, error_correction, border, mask_pattern)
+
+    if format == "svg":
+        return _render_svg(matrix)
+
+    import numpy
+    from PIL import Image
+
+    # Dark modules are False so they come out black; each module becomes a box_size square
+    pixels = numpy.logical_not(matrix).repeat(box_size, axis=0).repeat(box_size, axis=1)
+    img = Image.fromarray(pixels)
+
+    if logo_path:
+        img = img.convert("RGB")
+        logo = _load_logo(logo_path, logo_mtime, int(img.width * LOGO_FRACTION))
+        position = ((img.width - logo.width) // 2, (img.height - logo.height) // 2)
+        img.paste(logo, position, logo)
+
+    # Save image to bytes buffer
+    img_bytes = io.BytesIO()
+    img.save(img_bytes, format='PNG')
+    return img_bytes.getvalue()
+
+def _module_matrix(url, error_correction, border, mask_pattern):
+    """Return the QR modules, quiet zone included, as a boolean array (True is dark)."""
+    import numpy
+    import qrcode
 
-def generate_qr_code(url):
-    """Generate a QR code for the given URL and return bytes."""
-    # Generate the QR code
     qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=4,
+        version=None,
+        error_correction=getattr(qrcode.constants, f"ERROR_CORRECT_{error_correction}"),
+        border=border,
+        mask_pattern=mask_pattern,
     )
     qr.add_data(url)
     qr.make(fit=True)
-    
-    # Create an image from the QR code in memory
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Save image to bytes buffer
-    img_bytes = io.BytesIO()
-    img.save(img_bytes, format='PNG')
-    img_bytes.seek(0)
-    
-    return img_bytes
+    return numpy.array(qr.get_matrix(), dtype=bool)
+
+def _render_svg(matrix):
+    import numpy
+
+    # One rectangle per horizontal run of dark modules keeps the document small
+    rects = []
+    for y, row in enumerate(matrix):
+        # Run boundaries are where the row changes between light and dark
+        edges = numpy.flatnonzero(numpy.diff(numpy.concatenate(([False], row, [False]))))
+        for start, end in zip(edges[::2], edges[1::2]):
+            rects.append(f'<rect x="{start}" y="{y}" width="{end - start}" height="1"/>')
+
+    size = len(matrix)
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="white"/>'
+        f'<g fill="black">{"".join(rects)}</g></svg>'
+    ).encode("utf-8")
+
+@lru_cache(maxsize=4)
+def _load_logo(path, mtime, size):
+    # The modification time is part of the key so an edited logo is reloaded
+    from PIL import Image
+
+    logo = Image.open(path).convert("RGBA")
+    logo.thumbnail((size, size), Image.Resampling.LANCZOS)
+    return logo
@@ -0,0 +1,243 @@
+"""
+Process-wide rate governor for model deployments.
+Every call to a deployment goes through its governor, which paces requests with token
+buckets, retries throttled and transient failures with jittered exponential backoff
+(honoring Retry-After), and stops calling a failing deployment with a circuit breaker.
+"""
+import email.utils
+import random
+import threading
+import time
+from telemetry import increment, observe
+
+# Exceptions raised by the SDKs for network problems, matched by name to avoid importing them
+TRANSIENT_ERRORS = {
+    "APIConnectionError", "APITimeoutError",        # openai
+    "ServiceRequestError", "ServiceResponseError",  # azure-core
+    "ConnectionError", "Timeout", "TimeoutError",
+}
+
+class CircuitOpenError(Exception):
+    """Raised when a deployment's circuit breaker is open."""
+
+class TokenBucket:
+    def __init__(self, rate_per_second, capacity):
+        self.rate_per_second = rate_per_second
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens=1):
+        """Block until tokens are available and take them. Returns the seconds spent waiting."""
+        waited = 0.0
+        tokens = min(tokens, self.capacity)
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_second)
+                self._updated = now
+
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return waited
+
+                delay = (tokens - self._tokens) / self.rate_per_second
+
+            time.sleep(delay)
+            waited += delay
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, reset_seconds=30):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.opens = 0
+        self._failures = 0
+        self._opened_at = None
+        # Thread making the half-open trial call, its retries are let through too
+        self._trial_thread = None
+        self._lock = threading.Lock()
+
+    def check(self):
+        """
+        Raise CircuitOpenError while open.
+
+        After reset_seconds a single trial call is let through; every other caller keeps
+        failing fast until the trial succeeds (closing the circuit) or fails (reopening it).
+        """
+        with self._lock:
+            if self._opened_at is None or self._trial_thread == threading.get_ident():
+                return
+            if self._trial_thread is not None or time.monotonic() - self._opened_at < self.reset_seconds:
+                raise CircuitOpenError("The service is failing repeatedly, please try again in a moment")
+            self._trial_thread = threading.get_ident()
+
+    def release_trial(self):
+        """Let another trial through when this thread's trial ended without saying anything about the service's health."""
+        with self._lock:
+            if self._trial_thread == threading.get_ident():
+                self._trial_thread = None
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_thread = None
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_thread == threading.get_ident():
+                # The trial failed, stay open for another reset_seconds
+                self._trial_thread = None
+                self._opened_at = time.monotonic()
+                self.opens += 1
+            elif self._failures >= self.failure_threshold and self._opened_at is None:
+                self._opened_at = time.monotonic()
+                self.opens += 1
+
+class RateGovernor:
+    def __init__(self, name, rpm=0, tpm=0, max_retries=3, base_delay=1.0, max_delay=30.0, circuit_failures=5, circuit_reset_seconds=30):
+        """
+        Args:
+            name (str): Deployment name used in logs
+            rpm (float): Requests per minute, 0 for no limit
+            tpm (float): Tokens per minute, 0 for no limit
+            max_retries (int): Retries for throttled and transient failures
+            base_delay (float): First backoff delay in seconds, doubled on every retry
+            max_delay (float): Longest backoff delay in seconds
+            circuit_failures (int): Consecutive failures that open the circuit breaker
+            circuit_reset_seconds (float): How long the circuit stays open
+        """
+        self.name = name
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.request_bucket = TokenBucket(rpm / 60.0, max(1.0, rpm / 60.0)) if rpm else None
+        self.token_bucket = TokenBucket(tpm / 60.0, tpm / 6.0) if tpm else None
+        self.breaker = CircuitBreaker(circuit_failures, circuit_reset_seconds)
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self._metrics = {"requests": 0, "throttles": 0, "retries": 0, "failures": 0, "wait_seconds": 0.0}
+
+    def call(self, func, *args, tokens=1, **kwargs):
+        """
+        Call func(*args, **kwargs) under the governor.
+
+        Args:
+            tokens (int): Estimated tokens the request consumes, used for the TPM budget
+
+        Raises:
+            CircuitOpenError: If the deployment's circuit breaker is open
+        """
+        attempt = 0
+        while True:
+            self.breaker.check()
+
+            waited = self._wait_if_paused()
+            if self.request_bucket is not None:
+                waited += self.request_bucket.acquire()
+            if self.token_bucket is not None:
+                waited += self.token_bucket.acquire(tokens)
+            self._count("requests", 1, waited)
+
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                status = _status_code(e)
+                retryable = status in (408, 429) or (status or 0) >= 500 or type(e).__name__ in TRANSIENT_ERRORS
+
+                # Rejected requests (e.g. content policy) say nothing about the deployment's health,
+                # and a throttled one only that it is busy: the pause below handles that, so a 429
+                # only counts towards the breaker once the call gives up
+                if retryable and (status != 429 or attempt >= self.max_retries):
+                    self.breaker.record_failure()
+
+                if not retryable or attempt >= self.max_retries:
+                    self._count("failures")
+                    if not retryable:
+                        self.breaker.release_trial()
+                    raise
+
+                retry_after = _retry_after(e)
+                delay = retry_after if retry_after is not None else self._backoff(attempt)
+
+                if status == 429:
+                    self._count("throttles")
+                    # Hold back every caller of this deployment, not just this one
+                    with self._lock:
+                        self._paused_until = max(self._paused_until, time.monotonic() + delay)
+
+                print(f"{self.name}: attempt {attempt + 1} failed ({status or type(e).__name__}), retrying in {delay:.1f}s")
+                self._count("retries", 1, delay)
+                time.sleep(delay)
+                attempt += 1
+                continue
+
+            self.breaker.record_success()
+            return result
+
+    def stats(self):
+        """Return request, throttle, retry and failure counters and the total time spent waiting."""
+        with self._lock:
+            stats = dict(self._metrics)
+        stats["circuit_opens"] = self.breaker.opens
+        return stats
+
+    def _wait_if_paused(self):
+        # Sleep until the deployment's throttling pause is over
+        with self._lock:
+            delay = self._paused_until - time.monotonic()
+        if delay <= 0:
+            return 0.0
+        time.sleep(delay)
+        return delay
+
+    def _backoff(self, attempt):
+        # Exponential backoff with full jitter so retries from different sessions spread out
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _count(self, metric, amount=1, wait_seconds=0.0):
+        with self._lock:
+            self._metrics[metric] += amount
+            self._metrics["wait_seconds"] += wait_seconds
+
+        # Mirror the counters into the exported metrics, e.g. dalle_retries
+        increment(f"{self.name}_{metric}", amount)
+        if wait_seconds:
+            observe(f"{self.name}_wait", wait_seconds)
+
+def _status_code(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+def _retry_after(error):
+    # Both SDKs attach the HTTP response to their errors
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        pass
+
+    # Retry-After may also be an HTTP date
+    try:
+        retry_at = email.utils.parsedate_to_datetime(retry_after)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
@@ -0,0 +1,159 @@
+"""
+Prompt-level cache of generated characters.
+Stores up to N framed variants per normalized prompt on local disk, together with the
+name of the blob they were uploaded to, so repeated prompts can skip the DALL-E call.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+# Cache policies
+PREFER_CACHE = "cache"        # Serve the most recent cached variant if there is one
+ROUND_ROBIN = "round_robin"   # Generate until the key has max_variants, then rotate through them
+FRESH = "fresh"               # Always generate, and add the result to the cache
+
+POLICIES = (PREFER_CACHE, ROUND_ROBIN, FRESH)
+
+def normalize_description(description):
+    """Lowercase, collapse whitespace and drop trailing punctuation so near-identical prompts share a key."""
+    description = re.sub(r"\s+", " ", description.strip().lower())
+    return description.rstrip(" .!?,;")
+
+class ResultCache:
+    def __init__(self, cache_dir, max_variants=3, ttl_seconds=24 * 3600, max_entries=500, store_images=True):
+        """
+        Args:
+            cache_dir (str): Directory for the index and cached images
+            max_variants (int): Number of variants kept per key
+            ttl_seconds (int): Age after which a variant is evicted
+            max_entries (int): Number of keys kept, least recently used keys are evicted first
+            store_images (bool): Keep a local copy of each image; otherwise it is downloaded from its blob on a hit
+        """
+        self.cache_dir = cache_dir
+        self.max_variants = max_variants
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.store_images = store_images
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._entries = self._load_index()
+
+    def make_key(self, description, prompt_template, size, frame_path):
+        """Build the cache key for a description and the generation settings that shape the image."""
+        material = json.dumps([normalize_description(description), prompt_template, size, frame_path])
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def lookup(self, key, policy=PREFER_CACHE):
+        """
+        Return a cached variant for key according to policy, or None if a fresh generation is needed.
+
+        Returns:
+            dict: filename, content_type, image_path (None when images are not stored locally) and created_at
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown cache policy '{policy}', expected one of: {', '.join(POLICIES)}")
+
+        with self._lock:
+            self._evict_expired()
+            entry = self._entries.get(key)
+            variants = entry["variants"] if entry else []
+
+            if policy == FRESH or not variants or (policy == ROUND_ROBIN and len(variants) < self.max_variants):
+                self.misses += 1
+                return None
+
+            if policy == ROUND_ROBIN:
+                variant = variants[entry["next"] % len(variants)]
+                entry["next"] = (entry["next"] + 1) % len(variants)
+            else:
+                variant = variants[-1]
+
+            entry["last_access"] = time.time()
+            self.hits += 1
+            self._save_index()
+            return dict(variant)
+
+    def store(self, key, filename, image_bytes, content_type):
+        """Add a freshly generated variant for key, dropping the oldest one when the key is full."""
+        with self._lock:
+            entry = self._entries.setdefault(key, {"variants": [], "next": 0, "last_access": time.time()})
+
+            image_path = None
+            if self.store_images:
+                image_path = os.path.join(self.cache_dir, filename)
+                with open(image_path, "wb") as file:
+                    file.write(image_bytes)
+
+            entry["variants"].append({
+                "filename": filename,
+                "content_type": content_type,
+                "image_path": image_path,
+                "created_at": time.time()
+            })
+            entry["last_access"] = time.time()
+
+            while len(entry["variants"]) > self.max_variants:
+                self._remove_variant(entry["variants"].pop(0))
+
+            self._evict_lru()
+            self._save_index()
+
+    def stats(self):
+        """Return hit/miss counters and the current cache size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "keys": len(self._entries),
+                "variants": sum(len(entry["variants"]) for entry in self._entries.values())
+            }
+
+    def _evict_expired(self):
+        cutoff = time.time() - self.ttl_seconds
+        for key in list(self._entries):
+            entry = self._entries[key]
+            expired = [variant for variant in entry["variants"] if variant["created_at"] < cutoff]
+            for variant in expired:
+                entry["variants"].remove(variant)
+                self._remove_variant(variant)
+            if not entry["variants"]:
+                del self._entries[key]
+
+    def _evict_lru(self):
+        while len(self._entries) > self.max_entries:
+            key = min(self._entries, key=lambda k: self._entries[k]["last_access"])
+            for variant in self._entries.pop(key)["variants"]:
+                self._remove_variant(variant)
+
+    def _remove_variant(self, variant):
+        self.evictions += 1
+        if variant["image_path"] and os.path.exists(variant["image_path"]):
+            os.remove(variant["image_path"])
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, "r") as file:
+                return json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"Could not read result cache index, starting empty: {e}")
+            return {}
+
+    def _save_index(self):
+        # Write to a temporary file first so a crash never leaves a truncated index
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, "w") as file:
+            json.dump(self._entries, file)
+        os.replace(temp_path, self.index_path)
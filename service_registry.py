@@ -0,0 +1,418 @@
+"""
+Process-wide registry of shared service clients.
+Each client is built once per process and reused across Streamlit reruns and sessions.
+"""
+import os
+import threading
+import time
+from models_config import get_concurrency_limit, get_rate_limit_config, load_settings
+from openai_utils import OpenAIClient
+from storage_backends import create_storage_backend
+
+class ServiceRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._services = {}
+        self.hits = 0
+        self.misses = 0
+        self.construction_seconds = {}
+
+    def get_or_create(self, key, factory):
+        """
+        Return the service registered under key, building it with factory on first use.
+
+        Args:
+            key (tuple): Registry key, e.g. ("openai", model_id) or ("blob", container_name)
+            factory (callable): Zero-argument callable that builds the service
+
+        Returns:
+            object: The shared service instance
+        """
+        with self._lock:
+            if key in self._services:
+                self.hits += 1
+                return self._services[key]
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        # Build outside the global lock so a slow client does not block the others
+        with key_lock:
+            with self._lock:
+                if key in self._services:
+                    self.hits += 1
+                    return self._services[key]
+
+            # Services read their own settings when built, e.g. the model endpoints
+            load_settings()
+            start = time.perf_counter()
+            service = factory()
+            elapsed = time.perf_counter() - start
+
+            with self._lock:
+                self._services[key] = service
+                self.misses += 1
+                self.construction_seconds[key] = elapsed
+            print(f"Built service {key} in {elapsed:.3f}s")
+            return service
+
+    def stats(self):
+        """Return hit/miss counters and construction times for every registered service."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "services": {
+                    "/".join(str(part) for part in key): seconds
+                    for key, seconds in self.construction_seconds.items()
+                }
+            }
+
+    def clear(self):
+        """Drop every registered service so the next lookup rebuilds it."""
+        with self._lock:
+            self._services.clear()
+            self._key_locks.clear()
+            self.construction_seconds.clear()
+            self.hits = 0
+            self.misses = 0
+
+_registry = ServiceRegistry()
+
+def _getenv(name, default=None):
+    # Settings are read by the getters below, .env is loaded by the first one
+    load_settings()
+    return os.getenv(name, default)
+
+def get_registry():
+    """Return the process-wide service registry."""
+    return _registry
+
+def get_openai_client(model_id):
+    """Return the shared OpenAIClient wrapper for a model ID."""
+    return _registry.get_or_create(("openai", model_id), lambda: OpenAIClient(model_id=model_id))
+
+def get_rate_governor(model_id):
+    """Return the shared RateGovernor for a model ID, configured from RPM_*, TPM_*, MAX_RETRIES_* etc."""
+    from rate_governor import RateGovernor
+
+    def build():
+        config = get_rate_limit_config(model_id)
+        return RateGovernor(
+            model_id,
+            rpm=config["rpm"],
+            tpm=config["tpm"],
+            max_retries=config["max_retries"],
+            circuit_failures=config["circuit_failures"],
+            circuit_reset_seconds=config["circuit_reset_seconds"]
+        )
+
+    return _registry.get_or_create(("governor", model_id), build)
+
+def get_blob_client(container_name):
+    """Return the shared storage backend for a container (see STORAGE_BACKEND), verifying the container once."""
+    return _registry.get_or_create(("blob", container_name), lambda: create_storage_backend(container_name))
+
+def get_short_links():
+    """
+    Return the shared ShortLinkService, or None unless SHORT_LINK_BASE_URL is set.
+    The resolver is served on SHORT_LINK_HOST:SHORT_LINK_PORT.
+    """
+    base_url = _getenv("SHORT_LINK_BASE_URL")
+    if not base_url:
+        return None
+
+    def build():
+        from short_links import ShortLinkService, start_short_link_server
+
+        service = ShortLinkService(
+            _getenv("SHORT_LINK_DB", "short_links.db"),
+            base_url,
+            code_length=int(_getenv("SHORT_LINK_CODE_LENGTH", 8)),
+            prune_every=int(_getenv("SHORT_LINK_PRUNE_EVERY", 500))
+        )
+        start_short_link_server(service, _getenv("SHORT_LINK_HOST", "0.0.0.0"), int(_getenv("SHORT_LINK_PORT", 8503)))
+        return service
+
+    return _registry.get_or_create(("short_links", base_url), build)
+
+def get_http_session():
+    """Return the shared requests.Session used to download generated images."""
+    def build():
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        session = requests.Session()
+        # One pooled connection per concurrent job is enough
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=int(_getenv("JOB_WORKERS", 4)) * 2)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    return _registry.get_or_create(("http_session",), build)
+
+def get_frame_processor(frames_directory="frames"):
+    """Return the shared ImageFrameProcessor for a frames directory, using the FRAME_RESAMPLE filter."""
+    from image_frame_processor import ImageFrameProcessor
+
+    resample = _getenv("FRAME_RESAMPLE", "bicubic")
+    return _registry.get_or_create(
+        ("frames", frames_directory, resample),
+        lambda: ImageFrameProcessor(frames_directory, resample=resample, encoder=get_image_encoder())
+    )
+
+def get_image_encoder():
+    """Return the shared ImageEncoder configured from the IMAGE_*, PREVIEW_MAX_EDGE and THUMBNAIL_MAX_EDGE variables."""
+    from image_encoder import ImageEncoder
+
+    def build():
+        max_bytes = _getenv("IMAGE_MAX_BYTES")
+        return ImageEncoder(
+            format=_getenv("IMAGE_FORMAT", "png").lower(),
+            quality=int(_getenv("IMAGE_QUALITY", 85)),
+            compress_level=int(_getenv("IMAGE_COMPRESS_LEVEL", 6)),
+            max_bytes=int(max_bytes) if max_bytes else None,
+            preview_max_edge=int(_getenv("PREVIEW_MAX_EDGE", 0)),
+            thumbnail_max_edge=int(_getenv("THUMBNAIL_MAX_EDGE", 160))
+        )
+
+    return _registry.get_or_create(("encoder",), build)
+
+def get_capture_preprocessor():
+    """Return the shared CapturePreprocessor configured from the CAPTURE_* variables."""
+    from capture_preprocessor import CapturePreprocessor
+    return _registry.get_or_create(("capture",), lambda: CapturePreprocessor(
+        max_edge=int(_getenv("CAPTURE_MAX_EDGE", 768)),
+        format=_getenv("CAPTURE_FORMAT", "jpeg").lower(),
+        quality=int(_getenv("CAPTURE_QUALITY", 80)),
+        crop_face=_getenv("CAPTURE_CROP_FACE", "false").lower() == "true"
+    ))
+
+def get_vision_cache():
+    """Return the shared VisionCache configured from the VISION_CACHE_* variables, or None if VISION_CACHE_SIZE is 0.
+
+    Analyses are only reused within a session unless VISION_CACHE_SHARED_THRESHOLD is set.
+    """
+    max_entries = int(_getenv("VISION_CACHE_SIZE", 64))
+    if max_entries <= 0:
+        return None
+
+    shared_threshold = _getenv("VISION_CACHE_SHARED_THRESHOLD")
+
+    from vision_cache import VisionCache
+    return _registry.get_or_create(("vision_cache",), lambda: VisionCache(
+        max_entries=max_entries,
+        ttl_seconds=float(_getenv("VISION_CACHE_TTL_SECONDS", 300)),
+        threshold=int(_getenv("VISION_CACHE_THRESHOLD", 8)),
+        shared_threshold=int(shared_threshold) if shared_threshold else None
+    ))
+
+def get_image_generator(container_name="minecraft"):
+    """Return the shared DalleImageGenerator for a container."""
+    from dalle_image_generator import DalleImageGenerator
+    return _registry.get_or_create(("generator", container_name), lambda: DalleImageGenerator(container_name))
+
+def get_webcam_analyzer(model_id="mistral"):
+    """Return the shared WebcamAnalyzer for a model ID."""
+    from webcam_analyzer import WebcamAnalyzer
+    return _registry.get_or_create(("analyzer", model_id), lambda: WebcamAnalyzer(model_id=model_id))
+
+def get_result_cache():
+    """Return the shared ResultCache, or None unless RESULT_CACHE_DIR is set."""
+    cache_dir = _getenv("RESULT_CACHE_DIR")
+    if not cache_dir:
+        return None
+
+    from result_cache import ResultCache
+    return _registry.get_or_create(("result_cache", cache_dir), lambda: ResultCache(
+        cache_dir,
+        max_variants=int(_getenv("RESULT_CACHE_VARIANTS", 3)),
+        ttl_seconds=float(_getenv("RESULT_CACHE_TTL_HOURS", 24)) * 3600,
+        max_entries=int(_getenv("RESULT_CACHE_MAX_ENTRIES", 500)),
+        store_images=_getenv("RESULT_CACHE_STORE_IMAGES", "true").lower() == "true"
+    ))
+
+def get_result_store():
+    """Return the shared ResultStore selected by RESULT_STORE (sqlite or memory), or None if it is not set."""
+    backend = _getenv("RESULT_STORE", "").lower()
+    if not backend:
+        return None
+
+    from shared_results import SQLiteResultStore, MemoryResultStore
+
+    settings = {
+        "dedup_window_seconds": float(_getenv("RESULT_STORE_DEDUP_WINDOW", 30)),
+        "lease_seconds": float(_getenv("RESULT_STORE_LEASE_SECONDS", 120)),
+        "ttl_seconds": float(_getenv("RESULT_STORE_TTL_HOURS", 1)) * 3600
+    }
+
+    def build():
+        if backend == "sqlite":
+            return SQLiteResultStore(_getenv("RESULT_STORE_PATH", "results.db"), **settings)
+        if backend == "memory":
+            return MemoryResultStore(**settings)
+        raise ValueError(f"Unknown result store '{backend}', expected sqlite or memory")
+
+    return _registry.get_or_create(("result_store", backend), build)
+
+def get_gallery():
+    """Return the process-wide GalleryStore holding every session's gallery, capped by the GALLERY_* variables."""
+    from gallery import GalleryStore
+    return _registry.get_or_create(("gallery",), lambda: GalleryStore(
+        session_entries=int(_getenv("GALLERY_SESSION_ENTRIES", 12)),
+        session_bytes=int(_getenv("GALLERY_SESSION_KB", 512)) * 1024,
+        total_bytes=int(_getenv("GALLERY_TOTAL_MB", 64)) * 1024 * 1024,
+        image_cache_bytes=int(_getenv("GALLERY_IMAGE_CACHE_MB", 32)) * 1024 * 1024
+    ))
+
+def get_warm_pool():
+    """Return the shared, running WarmPool, or None unless WARM_POOL_PROMPTS is set.
+
+    WARM_POOL_PROMPTS is either a path to a file with one prompt per line or a ';' separated list.
+    """
+    prompts_setting = _getenv("WARM_POOL_PROMPTS")
+    if not prompts_setting:
+        return None
+
+    from warm_pool import WarmPool
+    from job_queue import QUEUED, RUNNING
+
+    def build():
+        if os.path.isfile(prompts_setting):
+            with open(prompts_setting, "r", encoding="utf-8") as file:
+                prompts = [line.strip() for line in file if line.strip()]
+        else:
+            prompts = [prompt.strip() for prompt in prompts_setting.split(";") if prompt.strip()]
+
+        def is_idle():
+            # Only use the deployment when no guest is waiting for it
+            counts = get_job_queue().stats()
+            return counts[QUEUED] == 0 and counts[RUNNING] == 0
+
+        pool = WarmPool(
+            get_image_generator(),
+            prompts,
+            target_per_prompt=int(_getenv("WARM_POOL_SIZE", 1)),
+            rate_per_minute=float(_getenv("WARM_POOL_RATE_PER_MINUTE", 2)),
+            is_idle=is_idle,
+            max_age_seconds=float(_getenv("WARM_POOL_MAX_AGE_HOURS", 12)) * 3600
+        )
+        pool.start()
+        return pool
+
+    return _registry.get_or_create(("warm_pool",), build)
+
+def get_artifact_index():
+    """Return the shared ArtifactIndex at ARTIFACT_INDEX_PATH, or None if it is set to an empty value."""
+    db_path = _getenv("ARTIFACT_INDEX_PATH", "artifacts.db")
+    if not db_path:
+        return None
+
+    from artifact_index import ArtifactIndex
+    return _registry.get_or_create(("artifact_index", db_path), lambda: ArtifactIndex(db_path))
+
+def get_sweep_grace_seconds():
+    """Return how long blobs are kept after their link expires (SWEEP_GRACE_HOURS).
+
+    This must stay longer than the result cache TTL and the warm pool maximum age,
+    since both hand out blobs again long after they were first signed.
+    """
+    return float(_getenv("SWEEP_GRACE_HOURS", 48)) * 3600
+
+def get_artifact_sweeper(container_name="minecraft"):
+    """Return the shared, running ArtifactSweeper for a container, or None if sweeping is disabled.
+
+    Sweeping deletes blobs, so it only runs when ARTIFACT_SWEEP_INTERVAL_MINUTES is set.
+    """
+    interval_minutes = float(_getenv("ARTIFACT_SWEEP_INTERVAL_MINUTES", 0))
+    index = get_artifact_index()
+    if index is None or interval_minutes <= 0:
+        return None
+
+    from artifact_index import ArtifactSweeper
+
+    def build():
+        sweeper = ArtifactSweeper(index, get_blob_client(container_name), interval_minutes * 60, get_sweep_grace_seconds())
+        sweeper.start()
+        return sweeper
+
+    return _registry.get_or_create(("sweeper", container_name), build)
+
+def get_metrics_exporter():
+    """Return the shared MetricsExporter writing TELEMETRY_PROMETHEUS_PATH, or None if it is not set."""
+    path = _getenv("TELEMETRY_PROMETHEUS_PATH")
+    if not path:
+        return None
+
+    from telemetry import MetricsExporter, get_telemetry
+
+    def build():
+        exporter = MetricsExporter(get_telemetry(), path, float(_getenv("TELEMETRY_EXPORT_INTERVAL", 15)))
+        exporter.start()
+        return exporter
+
+    return _registry.get_or_create(("metrics_exporter", path), build)
+
+def get_job_queue():
+    """Return the shared generation job queue, configured from JOB_WORKERS and JOB_QUEUE_SIZE."""
+    from job_queue import JobQueue, run_generation_job, coalesce_generation_job
+
+    def build():
+        try:
+            deployment_limits = {"dalle": get_concurrency_limit("dalle")}
+        except ValueError:
+            deployment_limits = {}
+
+        return JobQueue(
+            run_generation_job,
+            num_workers=int(_getenv("JOB_WORKERS", 4)),
+            max_queue_size=int(_getenv("JOB_QUEUE_SIZE", 20)),
+            deployment_limits=deployment_limits,
+            result_store=get_result_store(),
+            coalesce=coalesce_generation_job
+        )
+
+    return _registry.get_or_create(("jobs",), build)
+
+def start_background_workers(container_name="minecraft"):
+    """Start the configured background workers: warm pool, artifact sweeper and metrics exporter."""
+    get_warm_pool()
+    get_artifact_sweeper(container_name)
+    get_metrics_exporter()
+
+def start_warmup(container_name="minecraft", vision_model_id="mistral"):
+    """
+    Warm the process up once, in a background thread: import the SDKs and image libraries,
+    build the shared clients (checking the storage container opens its first connection)
+    and start the background workers.
+
+    Call it after the page has been rendered so a new replica serves its first page quickly.
+    With STARTUP_WARMUP=false nothing is pre-imported and the workers are started right away.
+    """
+    if _getenv("STARTUP_WARMUP", "true").lower() != "true":
+        start_background_workers(container_name)
+        return None
+
+    def step(name, func):
+        start = time.perf_counter()
+        try:
+            func()
+        except Exception as e:
+            print(f"Warm-up step '{name}' failed: {e}")
+            return
+        print(f"Warm-up step '{name}' took {time.perf_counter() - start:.3f}s")
+
+    def run():
+        from qr_code_generator import generate_qr_code
+
+        step("image libraries", lambda: generate_qr_code("warm-up"))
+        step("generator", lambda: get_image_generator(container_name).openai_client.get_client())
+        step("vision client", lambda: get_webcam_analyzer(vision_model_id).get_client())
+        step("capture preprocessor", get_capture_preprocessor)
+        step("background workers", lambda: start_background_workers(container_name))
+
+    def build():
+        thread = threading.Thread(target=run, name="warmup", daemon=True)
+        thread.start()
+        return thread
+
+    return _registry.get_or_create(("warmup",), build)
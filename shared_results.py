@@ -0,0 +1,346 @@
+"""
+Job and result store shared by every replica of the app.
+Identical generation requests arriving close together are coalesced: the first one to claim
+a prompt generates it and the others wait for its result, even when they were submitted to
+other processes. Finished results are kept by job ID, so any replica can serve them.
+
+SQLiteResultStore works across processes on one machine (or a shared volume); MemoryResultStore
+only dedups within a process. Another store (e.g. Redis, with SET NX on the key for claim())
+only has to implement the ResultStore methods.
+
+Usage:
+    python shared_results.py [--db results.db]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+RUNNING = "running"
+FOLLOWING = "following"
+DONE = "done"
+FAILED = "failed"
+ABANDONED = "abandoned"
+
+# Result fields stored as blobs rather than JSON
+BINARY_FIELDS = ("image_bytes", "qr_bytes", "thumbnail_bytes")
+
+# Counters kept by every store, see stats()
+COUNTERS = ("leaders", "coalesced_running", "coalesced_done", "takeovers", "unkeyed")
+
+class ResultStore:
+    """Interface shared by every result store."""
+    def claim(self, job_id, key, description=""):
+        """
+        Register job_id and decide who generates it.
+
+        A job leads when no other job with the same key is running (with a live lease)
+        or finished within the dedup window; a key of None never dedups.
+
+        Returns:
+            str: job_id if this job should generate, otherwise the ID of the job to wait for
+        """
+        raise NotImplementedError
+
+    def heartbeat(self, job_id):
+        """Extend the lease of a running job so followers keep waiting for it."""
+        raise NotImplementedError
+
+    def complete(self, job_id, result):
+        """Store the result of a job: a dict with image_bytes, qr_bytes, thumbnail_bytes and JSON-serializable fields."""
+        raise NotImplementedError
+
+    def fail(self, job_id, error, retryable=False):
+        """Record a failed job; followers of a retryable failure (e.g. a cancellation) take over instead of failing."""
+        raise NotImplementedError
+
+    def get(self, job_id):
+        """
+        Return a job's record, following a coalesced job to the job it waits for, or None if it is unknown.
+
+        Returns:
+            dict: job_id, description, status, result and error
+        """
+        raise NotImplementedError
+
+    def stats(self):
+        """Return the counters of every process using the store and the dedup rate."""
+        raise NotImplementedError
+
+    def wait(self, job_id, timeout=300, poll_interval=0.25, cancel_event=None):
+        """
+        Wait for a job to finish.
+
+        Returns:
+            dict: The finished record, or None if the job was abandoned, its lease expired,
+            the timeout passed or cancel_event was set
+        """
+        deadline = time.time() + timeout
+        while time.time() < deadline and not (cancel_event is not None and cancel_event.is_set()):
+            record = self.get(job_id)
+            if record is None or record["status"] == ABANDONED or record.get("lease_expired"):
+                return None
+            if record["status"] in (DONE, FAILED):
+                return record
+            time.sleep(poll_interval)
+        return None
+
+def _dedup_rate(counters):
+    coalesced = counters["coalesced_running"] + counters["coalesced_done"]
+    keyed = counters["leaders"] - counters["unkeyed"] + coalesced
+    return {**counters, "dedup_rate": coalesced / keyed if keyed else 0.0}
+
+def _split_result(result):
+    # Images are stored as blobs, everything else as JSON
+    metadata = {name: value for name, value in result.items() if name not in BINARY_FIELDS}
+    return (json.dumps(metadata),) + tuple(result.get(name) for name in BINARY_FIELDS)
+
+class SQLiteResultStore(ResultStore):
+    def __init__(self, db_path, dedup_window_seconds=30, lease_seconds=120, ttl_seconds=3600):
+        """
+        Args:
+            db_path (str): SQLite file shared by the replicas
+            dedup_window_seconds (float): How long a finished result is handed to new identical requests
+            lease_seconds (float): How long a leader may go without a heartbeat before others take over
+            ttl_seconds (float): Age after which jobs are forgotten
+        """
+        self.db_path = db_path
+        self.dedup_window_seconds = dedup_window_seconds
+        self.lease_seconds = lease_seconds
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # Transactions are opened explicitly, so claims can take the write lock up front
+        self._connection = sqlite3.connect(db_path, timeout=30, isolation_level=None, check_same_thread=False)
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS shared_jobs (
+                    job_id TEXT PRIMARY KEY,
+                    dedup_key TEXT,
+                    leader_id TEXT NOT NULL,
+                    description TEXT,
+                    status TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    lease_expires_at REAL,
+                    metadata TEXT,
+                    image BLOB,
+                    qr BLOB,
+                    thumbnail BLOB,
+                    error TEXT
+                )
+            """)
+            self._connection.execute("CREATE INDEX IF NOT EXISTS shared_jobs_key ON shared_jobs (dedup_key, status)")
+            self._connection.execute("CREATE INDEX IF NOT EXISTS shared_jobs_updated ON shared_jobs (updated_at)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS shared_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def claim(self, job_id, key, description=""):
+        now = time.time()
+        counters = []
+        with self._lock:
+            # BEGIN IMMEDIATE serializes claims across processes, so only one job can lead a key
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                self._connection.execute("DELETE FROM shared_jobs WHERE updated_at < ?", (now - self.ttl_seconds,))
+
+                row = None
+                if key is not None:
+                    row = self._connection.execute("""
+                        SELECT job_id, status FROM shared_jobs
+                        WHERE dedup_key = ? AND job_id = leader_id AND job_id != ?
+                          AND ((status = ? AND lease_expires_at >= ?) OR (status = ? AND updated_at >= ?))
+                        ORDER BY created_at DESC LIMIT 1
+                    """, (key, job_id, RUNNING, now, DONE, now - self.dedup_window_seconds)).fetchone()
+
+                if row is not None:
+                    leader_id = row[0]
+                    counters.append("coalesced_running" if row[1] == RUNNING else "coalesced_done")
+                else:
+                    leader_id = job_id
+                    counters.append("leaders")
+                    if key is None:
+                        counters.append("unkeyed")
+                    else:
+                        # A leader that stopped sending heartbeats (e.g. its replica died) is replaced
+                        stale = self._connection.execute(
+                            "UPDATE shared_jobs SET status = ?, updated_at = ? WHERE dedup_key = ? AND status = ? AND lease_expires_at < ?",
+                            (ABANDONED, now, key, RUNNING, now)
+                        ).rowcount
+                        if stale:
+                            counters.append("takeovers")
+
+                status = RUNNING if leader_id == job_id else FOLLOWING
+                self._connection.execute("""
+                    INSERT INTO shared_jobs (job_id, dedup_key, leader_id, description, status, created_at, updated_at, lease_expires_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (job_id) DO UPDATE SET leader_id = excluded.leader_id, status = excluded.status,
+                        updated_at = excluded.updated_at, lease_expires_at = excluded.lease_expires_at
+                """, (job_id, key, leader_id, description, status, now, now, now + self.lease_seconds))
+
+                for name in counters:
+                    self._connection.execute(
+                        "INSERT INTO shared_counters VALUES (?, 1) ON CONFLICT (name) DO UPDATE SET value = value + 1", (name,)
+                    )
+                self._connection.execute("COMMIT")
+            except Exception:
+                self._connection.execute("ROLLBACK")
+                raise
+        return leader_id
+
+    def heartbeat(self, job_id):
+        now = time.time()
+        self._execute(
+            "UPDATE shared_jobs SET updated_at = ?, lease_expires_at = ? WHERE job_id = ? AND status = ?",
+            (now, now + self.lease_seconds, job_id, RUNNING)
+        )
+
+    def complete(self, job_id, result):
+        metadata, image, qr, thumbnail = _split_result(result)
+        self._execute(
+            "UPDATE shared_jobs SET status = ?, updated_at = ?, metadata = ?, image = ?, qr = ?, thumbnail = ? WHERE job_id = ?",
+            (DONE, time.time(), metadata, image, qr, thumbnail, job_id)
+        )
+
+    def fail(self, job_id, error, retryable=False):
+        self._execute(
+            "UPDATE shared_jobs SET status = ?, updated_at = ?, error = ? WHERE job_id = ?",
+            (ABANDONED if retryable else FAILED, time.time(), error, job_id)
+        )
+
+    def get(self, job_id):
+        query = "SELECT job_id, leader_id, description, status, lease_expires_at, metadata, image, qr, thumbnail, error FROM shared_jobs WHERE job_id = ?"
+        with self._lock:
+            row = self._connection.execute(query, (job_id,)).fetchone()
+            if row is not None and row[1] != job_id:
+                leader = self._connection.execute(query, (row[1],)).fetchone()
+                # The follower's own description and ID, with its leader's outcome
+                row = row[:3] + leader[3:] if leader is not None else row[:3] + (ABANDONED,) + row[4:]
+        if row is None:
+            return None
+
+        status = row[3]
+        result = None
+        if status == DONE:
+            result = json.loads(row[5])
+            result.update(zip(BINARY_FIELDS, row[6:9]))
+        return {
+            "job_id": row[0],
+            "description": row[2],
+            "status": status,
+            "result": result,
+            "error": row[9],
+            "lease_expired": status == RUNNING and row[4] < time.time()
+        }
+
+    def stats(self):
+        with self._lock:
+            rows = dict(self._connection.execute("SELECT name, value FROM shared_counters"))
+        return _dedup_rate({name: rows.get(name, 0) for name in COUNTERS})
+
+    def _execute(self, query, params):
+        with self._lock:
+            self._connection.execute(query, params)
+
+class MemoryResultStore(ResultStore):
+    """Same behaviour as SQLiteResultStore within a single process."""
+    def __init__(self, dedup_window_seconds=30, lease_seconds=120, ttl_seconds=3600):
+        self.dedup_window_seconds = dedup_window_seconds
+        self.lease_seconds = lease_seconds
+        self.ttl_seconds = ttl_seconds
+        self._jobs = {}
+        self._counters = {name: 0 for name in COUNTERS}
+        self._lock = threading.Lock()
+
+    def claim(self, job_id, key, description=""):
+        now = time.time()
+        with self._lock:
+            for other_id in [other_id for other_id, job in self._jobs.items() if job["updated_at"] < now - self.ttl_seconds]:
+                del self._jobs[other_id]
+
+            leader = None
+            if key is not None:
+                candidates = [
+                    job for other_id, job in self._jobs.items()
+                    if other_id != job_id and job["key"] == key and job["leader_id"] == other_id
+                    and ((job["status"] == RUNNING and job["lease_expires_at"] >= now)
+                         or (job["status"] == DONE and job["updated_at"] >= now - self.dedup_window_seconds))
+                ]
+                leader = max(candidates, key=lambda job: job["created_at"]) if candidates else None
+
+            if leader is not None:
+                leader_id = leader["job_id"]
+                self._counters["coalesced_running" if leader["status"] == RUNNING else "coalesced_done"] += 1
+            else:
+                leader_id = job_id
+                self._counters["leaders"] += 1
+                if key is None:
+                    self._counters["unkeyed"] += 1
+                else:
+                    stale = [job for job in self._jobs.values()
+                             if job["key"] == key and job["status"] == RUNNING and job["lease_expires_at"] < now]
+                    for job in stale:
+                        job["status"], job["updated_at"] = ABANDONED, now
+                    if stale:
+                        self._counters["takeovers"] += 1
+
+            job = self._jobs.setdefault(job_id, {"job_id": job_id, "key": key, "description": description, "created_at": now,
+                                                 "result": None, "error": None})
+            job.update({
+                "leader_id": leader_id,
+                "status": RUNNING if leader_id == job_id else FOLLOWING,
+                "updated_at": now,
+                "lease_expires_at": now + self.lease_seconds
+            })
+        return leader_id
+
+    def heartbeat(self, job_id):
+        now = time.time()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job["status"] == RUNNING:
+                job["updated_at"], job["lease_expires_at"] = now, now + self.lease_seconds
+
+    def complete(self, job_id, result):
+        self._finish(job_id, DONE, result=dict(result))
+
+    def fail(self, job_id, error, retryable=False):
+        self._finish(job_id, ABANDONED if retryable else FAILED, error=error)
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            outcome = self._jobs.get(job["leader_id"], {"status": ABANDONED, "result": None, "error": None, "lease_expires_at": 0})
+            return {
+                "job_id": job_id,
+                "description": job["description"],
+                "status": outcome["status"],
+                "result": dict(outcome["result"]) if outcome["result"] is not None else None,
+                "error": outcome["error"],
+                "lease_expired": outcome["status"] == RUNNING and outcome["lease_expires_at"] < time.time()
+            }
+
+    def stats(self):
+        with self._lock:
+            return _dedup_rate(dict(self._counters))
+
+    def _finish(self, job_id, status, result=None, error=None):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update({"status": status, "updated_at": time.time(), "result": result, "error": error})
+
+def main():
+    parser = argparse.ArgumentParser(description="Report the dedup counters of a shared result store")
+    parser.add_argument("--db", default=os.getenv("RESULT_STORE_PATH", "results.db"), help="SQLite result store")
+    args = parser.parse_args()
+
+    stats = SQLiteResultStore(args.db).stats()
+    for name, value in stats.items():
+        print(f"{name:<18} {value:.1%}" if name == "dedup_rate" else f"{name:<18} {value}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Short links for the QR codes handed to guests.
+A signed blob URL is a few hundred characters long, which pushes the QR code to a large,
+dense version. Short links map a small code to the signed URL until it expires, so every
+QR code encodes the same short, constant-size address.
+"""
+import secrets
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+# Upper case letters and digits keep the QR code in its compact alphanumeric mode
+CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+
+class ShortLinkService:
+    def __init__(self, db_path, base_url, code_length=8, prune_every=500):
+        """
+        Args:
+            db_path (str): SQLite file holding the links, so they survive restarts
+            base_url (str): Address of the resolver as seen by guests' phones
+            code_length (int): Characters per code
+            prune_every (int): Expired links are deleted after this many new ones, 0 to only prune at startup
+        """
+        self.db_path = db_path
+        self.base_url = base_url.rstrip("/")
+        self.code_length = code_length
+        self.prune_every = prune_every
+        self._inserts = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS short_links (
+                    code TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            # Links from previous runs that can no longer be used
+            self._prune()
+
+    def shorten(self, url, expires_at):
+        """
+        Register url under a new code until expires_at.
+
+        Returns:
+            str: The short link, base_url/code
+        """
+        with self._lock, self._connection:
+            while True:
+                code = "".join(secrets.choice(CODE_ALPHABET) for _ in range(self.code_length))
+                try:
+                    self._connection.execute(
+                        "INSERT INTO short_links VALUES (?, ?, ?)", (code, url, expires_at)
+                    )
+                    break
+                except sqlite3.IntegrityError:
+                    continue
+
+            # Keep the table at roughly the links still in use during a long event
+            self._inserts += 1
+            if self.prune_every and self._inserts % self.prune_every == 0:
+                self._prune()
+        return f"{self.base_url}/{code}"
+
+    def prune_expired(self):
+        """Delete the expired links and return how many there were."""
+        with self._lock, self._connection:
+            return self._prune()
+
+    def _prune(self):
+        return self._connection.execute("DELETE FROM short_links WHERE expires_at < ?", (time.time(),)).rowcount
+
+    def resolve(self, code):
+        """Return the URL behind code, or None if it is unknown or expired."""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT url, expires_at FROM short_links WHERE code = ?", (code.upper(),)
+            ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return row[0]
+
+class ShortLinkRequestHandler(BaseHTTPRequestHandler):
+    """Redirects GET /<code> to the signed URL behind it."""
+    service = None
+
+    def do_GET(self):
+        # Only the last path segment is the code, so the resolver can sit behind a path prefix
+        code = urlparse(self.path).path.rstrip("/").rsplit("/", 1)[-1]
+        url = self.service.resolve(code) if code else None
+        if url is None:
+            return self.send_error(404, "Link expired or unknown")
+
+        self.send_response(302)
+        self.send_header("Location", url)
+        self.send_header("Cache-Control", "no-store")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+def start_short_link_server(service, host, port):
+    """Start the resolver in a daemon thread and return the server."""
+    handler = type("Handler", (ShortLinkRequestHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="short-links", daemon=True).start()
+    print(f"Serving short links on {host}:{server.server_port}")
+    return server
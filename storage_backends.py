@@ -0,0 +1,210 @@
+"""
+Storage backends for generated images.
+BlobStorageClient (Azure Blob Storage) is the default; the local disk and in-memory
+backends let the app and its benchmarks run without Azure. STORAGE_BACKEND selects one.
+"""
+import hashlib
+import hmac
+import mimetypes
+import os
+import secrets
+import shutil
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, quote, unquote
+
+class StorageBackend:
+    """Interface shared by every storage backend."""
+    container_name = None
+
+    def upload_bytes(self, bytes_data, blob_name, content_type=None):
+        raise NotImplementedError
+
+    def download_bytes(self, blob_name):
+        raise NotImplementedError
+
+    def get_blob_url(self, blob_name, sas_token=True, expiry_hours=1):
+        raise NotImplementedError
+
+    def delete_blob(self, blob_name):
+        raise NotImplementedError
+
+    def list_blobs(self, prefix=None):
+        """Return the names of the stored blobs, optionally only those starting with prefix."""
+        raise NotImplementedError
+
+    def delete_blobs(self, blob_names):
+        """Delete several blobs; backends with a batch API override this."""
+        for blob_name in blob_names:
+            self.delete_blob(blob_name)
+
+    def upload_file(self, local_file_path, blob_name=None):
+        blob_name = blob_name or os.path.basename(local_file_path)
+        with open(local_file_path, "rb") as data:
+            self.upload_bytes(data, blob_name, mimetypes.guess_type(blob_name)[0])
+
+    def download_file(self, blob_name, download_file_path):
+        with open(download_file_path, "wb") as file:
+            file.write(self.download_bytes(blob_name))
+
+class MemoryStorageBackend(StorageBackend):
+    """Keeps blobs in a dict. Meant for tests and offline benchmarks."""
+    def __init__(self, container_name):
+        self.container_name = container_name
+        self._blobs = {}
+        self._lock = threading.Lock()
+
+    def upload_bytes(self, bytes_data, blob_name, content_type=None):
+        bytes_data.seek(0)
+        with self._lock:
+            self._blobs[blob_name] = (bytes_data.read(), content_type)
+
+    def download_bytes(self, blob_name):
+        with self._lock:
+            if blob_name not in self._blobs:
+                raise FileNotFoundError(f"Blob '{blob_name}' not found")
+            return self._blobs[blob_name][0]
+
+    def get_blob_url(self, blob_name, sas_token=True, expiry_hours=1):
+        return f"memory://{self.container_name}/{quote(blob_name)}"
+
+    def delete_blob(self, blob_name):
+        with self._lock:
+            self._blobs.pop(blob_name, None)
+
+    def list_blobs(self, prefix=None):
+        with self._lock:
+            return [name for name in self._blobs if prefix is None or name.startswith(prefix)]
+
+class LocalStorageBackend(StorageBackend):
+    """Stores blobs as files and serves them with signed, expiring URLs from a small HTTP server."""
+    def __init__(self, container_name, root_dir, base_url, secret):
+        self.container_name = container_name
+        self.directory = os.path.join(root_dir, container_name)
+        self.base_url = base_url.rstrip("/")
+        self.secret = secret
+        os.makedirs(self.directory, exist_ok=True)
+
+    def upload_bytes(self, bytes_data, blob_name, content_type=None):
+        bytes_data.seek(0)
+        path = self._path(blob_name)
+        # Write to a temporary file first so readers never see a partial image
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as file:
+            shutil.copyfileobj(bytes_data, file)
+        os.replace(temp_path, path)
+
+    def download_bytes(self, blob_name):
+        with open(self._path(blob_name), "rb") as file:
+            return file.read()
+
+    def get_blob_url(self, blob_name, sas_token=True, expiry_hours=1):
+        url = f"{self.base_url}/{self.container_name}/{quote(blob_name)}"
+        if not sas_token:
+            return url
+        expires = int(time.time() + expiry_hours * 3600)
+        return f"{url}?expires={expires}&sig={sign_local_url(self.secret, self.container_name, blob_name, expires)}"
+
+    def delete_blob(self, blob_name):
+        try:
+            os.remove(self._path(blob_name))
+        except FileNotFoundError:
+            pass
+
+    def list_blobs(self, prefix=None):
+        return [
+            name for name in os.listdir(self.directory)
+            if not name.endswith(".tmp") and (prefix is None or name.startswith(prefix))
+        ]
+
+    def _path(self, blob_name):
+        # Blob names are flat, never let them escape the container directory
+        if os.path.basename(blob_name) != blob_name or blob_name in ("", ".", ".."):
+            raise ValueError(f"Invalid blob name '{blob_name}'")
+        return os.path.join(self.directory, blob_name)
+
+def sign_local_url(secret, container_name, blob_name, expires):
+    """Return the HMAC signature for a local blob URL."""
+    message = f"{container_name}/{blob_name}:{expires}".encode("utf-8")
+    return hmac.new(secret.encode("utf-8"), message, hashlib.sha256).hexdigest()
+
+class LocalStorageRequestHandler(BaseHTTPRequestHandler):
+    """Serves GET /<container>/<blob>?expires=...&sig=... from the local storage root."""
+    root_dir = None
+    secret = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = unquote(url.path).strip("/").split("/")
+        query = parse_qs(url.query)
+
+        if len(parts) != 2 or any(part in ("", ".", "..") for part in parts):
+            return self.send_error(404)
+        container_name, blob_name = parts
+
+        try:
+            expires = int(query.get("expires", ["0"])[0])
+        except ValueError:
+            return self.send_error(403)
+        signature = query.get("sig", [""])[0]
+        expected = sign_local_url(self.secret, container_name, blob_name, expires)
+        if expires < time.time() or not hmac.compare_digest(signature, expected):
+            return self.send_error(403, "Link expired or invalid")
+
+        path = os.path.join(self.root_dir, container_name, blob_name)
+        if not os.path.isfile(path):
+            return self.send_error(404)
+
+        self.send_response(200)
+        self.send_header("Content-Type", mimetypes.guess_type(blob_name)[0] or "application/octet-stream")
+        self.send_header("Content-Length", str(os.path.getsize(path)))
+        self.end_headers()
+        with open(path, "rb") as file:
+            shutil.copyfileobj(file, self.wfile)
+
+    def log_message(self, format, *args):
+        pass
+
+_local_server = None
+_local_server_lock = threading.Lock()
+
+# Used when STORAGE_LOCAL_SECRET is not set, so links only stay valid while this process runs
+_process_secret = secrets.token_hex(32)
+
+def start_local_storage_server(root_dir, secret, host, port):
+    """Start the HTTP server for local blobs once per process, in a daemon thread."""
+    global _local_server
+    with _local_server_lock:
+        if _local_server is None:
+            handler = type("Handler", (LocalStorageRequestHandler,), {"root_dir": root_dir, "secret": secret})
+            _local_server = ThreadingHTTPServer((host, port), handler)
+            threading.Thread(target=_local_server.serve_forever, name="local-storage", daemon=True).start()
+            print(f"Serving local storage from {root_dir} on {host}:{_local_server.server_port}")
+    return _local_server
+
+def create_storage_backend(container_name):
+    """
+    Build the storage backend selected by STORAGE_BACKEND: azure (default), local or memory.
+
+    The local backend stores files under STORAGE_LOCAL_DIR and serves them on
+    STORAGE_LOCAL_HOST:STORAGE_LOCAL_PORT; STORAGE_LOCAL_BASE_URL is the address guests use.
+    """
+    backend = os.getenv("STORAGE_BACKEND", "azure").lower()
+
+    if backend == "azure":
+        from blob_storage_client import BlobStorageClient
+        return BlobStorageClient(container_name)
+
+    if backend == "memory":
+        return MemoryStorageBackend(container_name)
+
+    if backend == "local":
+        root_dir = os.path.abspath(os.getenv("STORAGE_LOCAL_DIR", "storage"))
+        port = int(os.getenv("STORAGE_LOCAL_PORT", 8502))
+        secret = os.getenv("STORAGE_LOCAL_SECRET") or _process_secret
+        base_url = os.getenv("STORAGE_LOCAL_BASE_URL", f"http://localhost:{port}")
+        start_local_storage_server(root_dir, secret, os.getenv("STORAGE_LOCAL_HOST", "0.0.0.0"), port)
+        return LocalStorageBackend(container_name, root_dir, base_url, secret)
+
+    raise ValueError(f"Unknown storage backend '{backend}', expected azure, local or memory")
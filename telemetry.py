@@ -0,0 +1,211 @@
+"""
+Lightweight tracing and metrics for the generation pipeline.
+Spans time a block of work into a latency histogram and are logged as JSON lines tagged
+with the current request ID; counters track errors and retries. Metrics can be written
+as Prometheus text to a local file, so nothing needs the network.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from models_config import load_settings
+
+# Latest samples kept per histogram to compute its percentiles
+HISTOGRAM_SAMPLES = 2048
+PERCENTILES = (0.5, 0.95, 0.99)
+
+# Prefix of every exported metric name
+METRIC_PREFIX = "minecraft_"
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+
+def set_request_id(request_id=None):
+    """Tag everything logged from this context with request_id, a new one if not given."""
+    request_id = request_id or uuid.uuid4().hex[:12]
+    _request_id.set(request_id)
+    return request_id
+
+def get_request_id():
+    return _request_id.get()
+
+def submit_with_context(executor, func, *args, **kwargs):
+    """executor.submit() that keeps the caller's request ID on the worker thread."""
+    return executor.submit(contextvars.copy_context().run, func, *args, **kwargs)
+
+class Histogram:
+    def __init__(self, max_samples=HISTOGRAM_SAMPLES):
+        self.count = 0
+        self.total = 0.0
+        self._samples = deque(maxlen=max_samples)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self._samples.append(value)
+
+    def percentiles(self):
+        """Return {fraction: value} for PERCENTILES over the latest samples."""
+        ordered = sorted(self._samples)
+        if not ordered:
+            return {fraction: 0.0 for fraction in PERCENTILES}
+        return {
+            fraction: ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+            for fraction in PERCENTILES
+        }
+
+class Telemetry:
+    def __init__(self, log_path=None):
+        """
+        Args:
+            log_path (str): File the JSON lines are appended to, "-" for stdout, None to not log spans
+        """
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._log_lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Time the enclosed block as name.
+
+        The duration goes into the name histogram and a span line is logged;
+        an exception also increments the name_errors counter before propagating.
+        """
+        start = time.perf_counter()
+        status = "ok"
+        try:
+            yield attributes
+        except Exception as e:
+            status = "error"
+            attributes["error"] = str(e)
+            self.increment(f"{name}_errors")
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            self.observe(name, duration)
+            self.log("span", span=name, duration=round(duration, 4), status=status, **attributes)
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def log(self, event, **fields):
+        """Write one JSON line with the event, a timestamp and the current request ID."""
+        if not self.log_path:
+            return
+
+        line = json.dumps({"ts": round(time.time(), 3), "event": event, "request_id": get_request_id(), **fields}, default=str)
+        with self._log_lock:
+            if self.log_path == "-":
+                print(line)
+            else:
+                with open(self.log_path, "a", encoding="utf-8") as file:
+                    file.write(line + "\n")
+
+    def snapshot(self):
+        """Return the counters and, per histogram, its count, sum and percentiles in seconds."""
+        with self._lock:
+            return {
+                "counters": dict(self._counters),
+                "histograms": {
+                    name: {
+                        "count": histogram.count,
+                        "sum": histogram.total,
+                        **{f"p{int(fraction * 100)}": value for fraction, value in histogram.percentiles().items()}
+                    }
+                    for name, histogram in self._histograms.items()
+                }
+            }
+
+    def prometheus_text(self):
+        """Render the metrics in the Prometheus text format: histograms as summaries, counters as totals."""
+        lines = []
+        with self._lock:
+            for name, histogram in sorted(self._histograms.items()):
+                metric = f"{METRIC_PREFIX}{name}_seconds"
+                lines.append(f"# TYPE {metric} summary")
+                for fraction, value in histogram.percentiles().items():
+                    lines.append(f'{metric}{{quantile="{fraction}"}} {value:.6f}')
+                lines.append(f"{metric}_sum {histogram.total:.6f}")
+                lines.append(f"{metric}_count {histogram.count}")
+            for name, value in sorted(self._counters.items()):
+                metric = f"{METRIC_PREFIX}{name}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        # Replace the file in one step so a scraper never reads a partial file
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.write(self.prometheus_text())
+        os.replace(temp_path, path)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+class MetricsExporter:
+    """Writes the Prometheus text file periodically from a background thread."""
+    def __init__(self, telemetry, path, interval_seconds=15):
+        self.telemetry = telemetry
+        self.path = path
+        self.interval_seconds = interval_seconds
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="metrics-exporter", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.telemetry.write_prometheus(self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.telemetry.write_prometheus(self.path)
+            except OSError as e:
+                print(f"Could not write metrics to {self.path}: {e}")
+
+# Process-wide instance used by the pipeline, the analyzer and the QR code generator
+_telemetry = None
+_telemetry_lock = threading.Lock()
+
+def get_telemetry():
+    """Return the process-wide Telemetry, logging to TELEMETRY_LOG_PATH, created on first use."""
+    global _telemetry
+    if _telemetry is None:
+        with _telemetry_lock:
+            if _telemetry is None:
+                load_settings()
+                _telemetry = Telemetry(os.getenv("TELEMETRY_LOG_PATH") or None)
+    return _telemetry
+
+def span(name, **attributes):
+    return get_telemetry().span(name, **attributes)
+
+def observe(name, seconds):
+    get_telemetry().observe(name, seconds)
+
+def increment(name, amount=1):
+    get_telemetry().increment(name, amount)
+
+def log_event(event, **fields):
+    get_telemetry().log(event, **fields)
@@ -0,0 +1,121 @@
+"""
+Tests of the artifact index and sweeper against the in-memory storage backend.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+import io
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+from artifact_index import ArtifactIndex, sweep
+from storage_backends import MemoryStorageBackend
+
+CONTAINER = "minecraft"
+HOUR = 3600
+
+class FailingStorageBackend(MemoryStorageBackend):
+    """Fails every delete call that includes one of failing_names."""
+    def __init__(self, container_name, failing_names):
+        super().__init__(container_name)
+        self.failing_names = set(failing_names)
+
+    def delete_blobs(self, blob_names):
+        if self.failing_names.intersection(blob_names):
+            raise IOError("batch delete failed")
+        super().delete_blobs(blob_names)
+
+class ArtifactIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.directory.name, "artifacts.db")
+        self.index = ArtifactIndex(self.db_path)
+        self.storage = MemoryStorageBackend(CONTAINER)
+
+    def tearDown(self):
+        self.index._connection.close()
+        self.directory.cleanup()
+
+    def upload(self, storage, blob_name, expires_in, pinned=False):
+        storage.upload_bytes(io.BytesIO(b"image"), blob_name, "image/png")
+        self.index.record(blob_name, CONTAINER, 5, "hash", time.time() + expires_in, pinned=pinned)
+
+    def test_sweep_deletes_only_expired_blobs(self):
+        self.upload(self.storage, "old.png", -2 * HOUR)
+        self.upload(self.storage, "new.png", HOUR)
+
+        self.assertEqual(sweep(self.index, self.storage), 1)
+        self.assertEqual(self.storage.list_blobs(), ["new.png"])
+        self.assertEqual(self.index.expired(CONTAINER), [])
+        self.assertEqual(self.index.usage_report(CONTAINER)["deleted_count"], 1)
+
+    def test_sweep_keeps_blobs_within_grace_period(self):
+        self.upload(self.storage, "recent.png", -HOUR)
+
+        self.assertEqual(sweep(self.index, self.storage, grace_seconds=2 * HOUR), 0)
+        self.assertEqual(self.storage.list_blobs(), ["recent.png"])
+
+    def test_sweep_never_deletes_pinned_blobs(self):
+        self.upload(self.storage, "pack.png", -2 * HOUR, pinned=True)
+
+        self.assertEqual(sweep(self.index, self.storage), 0)
+        self.assertEqual(self.storage.list_blobs(), ["pack.png"])
+
+    def test_extend_expiry_keeps_blob(self):
+        self.upload(self.storage, "reused.png", -2 * HOUR)
+        self.index.extend_expiry("reused.png", time.time() + HOUR)
+
+        self.assertEqual(sweep(self.index, self.storage), 0)
+        self.assertEqual(self.storage.list_blobs(), ["reused.png"])
+
+    def test_extend_expiry_can_pin(self):
+        self.upload(self.storage, "reused.png", -2 * HOUR)
+        self.index.extend_expiry("reused.png", time.time() - HOUR, pinned=True)
+        self.index.extend_expiry("reused.png", time.time() - HOUR)
+
+        self.assertEqual(sweep(self.index, self.storage), 0)
+        self.assertEqual(self.storage.list_blobs(), ["reused.png"])
+
+    def test_dry_run_deletes_nothing(self):
+        self.upload(self.storage, "old.png", -2 * HOUR)
+
+        self.assertEqual(sweep(self.index, self.storage, dry_run=True), 1)
+        self.assertEqual(self.storage.list_blobs(), ["old.png"])
+        self.assertEqual(self.index.expired(CONTAINER), ["old.png"])
+        self.assertEqual(self.index.usage_report(CONTAINER)["deleted_count"], 0)
+
+    def test_failed_batch_stays_live_and_is_retried(self):
+        storage = FailingStorageBackend(CONTAINER, ["b.png"])
+        for offset, blob_name in enumerate(["a.png", "b.png", "c.png", "d.png"]):
+            self.upload(storage, blob_name, -10 * HOUR + offset)
+
+        # Batches of two: a+b fails, c+d is still deleted
+        self.assertEqual(sweep(self.index, storage, batch_size=2), 2)
+        self.assertEqual(sorted(storage.list_blobs()), ["a.png", "b.png"])
+        self.assertEqual(self.index.expired(CONTAINER), ["a.png", "b.png"])
+
+        storage.failing_names.clear()
+        self.assertEqual(sweep(self.index, storage, batch_size=2), 2)
+        self.assertEqual(storage.list_blobs(), [])
+
+    def test_index_without_pinned_column_is_migrated(self):
+        self.index._connection.close()
+        os.remove(self.db_path)
+        connection = sqlite3.connect(self.db_path)
+        with connection:
+            connection.execute("""
+                CREATE TABLE artifacts (
+                    blob_name TEXT PRIMARY KEY, container TEXT NOT NULL, created_at REAL NOT NULL, size INTEGER NOT NULL,
+                    prompt_hash TEXT, sas_expires_at REAL NOT NULL, deleted_at REAL
+                )
+            """)
+            connection.execute("INSERT INTO artifacts VALUES ('old.png', ?, ?, 5, 'hash', ?, NULL)", (CONTAINER, time.time(), time.time() - HOUR))
+        connection.close()
+
+        self.index = ArtifactIndex(self.db_path)
+        self.assertEqual(self.index.expired(CONTAINER), ["old.png"])
+
+if __name__ == "__main__":
+    unittest.main()
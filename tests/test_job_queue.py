@@ -0,0 +1,214 @@
+"""
+Tests of the generation job queue with stub handlers.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+import threading
+import time
+import unittest
+from job_queue import JobQueue, QueueFullError, QUEUED, RUNNING, DONE, FAILED, coalesce_generation_job, _run_as_leader
+from shared_results import MemoryResultStore
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError("Timed out waiting for the condition")
+        time.sleep(0.01)
+
+class BlockingHandler:
+    """Stub handler: records the jobs it runs and blocks each one until the test lets it finish."""
+    def __init__(self):
+        self.proceed = threading.Event()
+        self.ran = []
+        self.running = {}
+        self.max_running = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, job):
+        with self._lock:
+            self.ran.append(job.description)
+            self.running[job.deployment] = self.running.get(job.deployment, 0) + 1
+            self.max_running[job.deployment] = max(self.max_running.get(job.deployment, 0), self.running[job.deployment])
+        try:
+            if not self.proceed.wait(10):
+                raise Exception("The test never let the job finish")
+            if job.description == "broken":
+                raise ValueError("generation failed")
+            return {"filename": job.description, "image_bytes": b"x" * 1000}
+        finally:
+            with self._lock:
+                self.running[job.deployment] -= 1
+
+class JobQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.handler = BlockingHandler()
+
+    def tearDown(self):
+        self.handler.proceed.set()
+
+    def test_runs_jobs_and_reports_failures(self):
+        job_queue = JobQueue(self.handler, num_workers=2)
+        ok = job_queue.submit("a knight", style="pixel")
+        broken = job_queue.submit("broken")
+        self.handler.proceed.set()
+        wait_until(lambda: ok.is_finished() and broken.is_finished())
+
+        self.assertEqual(ok.status, DONE)
+        self.assertEqual(ok.result["filename"], "a knight")
+        self.assertEqual(ok.options, {"style": "pixel"})
+        self.assertEqual(broken.status, FAILED)
+        self.assertEqual(broken.error, "generation failed")
+        self.assertIs(job_queue.get_job(ok.job_id), ok)
+        self.assertIsNone(job_queue.get_job("unknown"))
+        self.assertEqual(job_queue.stats(), {QUEUED: 0, RUNNING: 0, DONE: 1, FAILED: 1})
+
+    def test_submit_raises_when_the_queue_is_full(self):
+        job_queue = JobQueue(self.handler, num_workers=1, max_queue_size=2)
+        running = job_queue.submit("first")
+        wait_until(lambda: running.status == RUNNING)
+        job_queue.submit("second")
+        job_queue.submit("third")
+
+        with self.assertRaises(QueueFullError):
+            job_queue.submit("fourth")
+
+        # Room frees up once the worker moves on
+        self.handler.proceed.set()
+        wait_until(lambda: job_queue.stats()[QUEUED] == 0)
+        job_queue.submit("fifth")
+
+    def test_queue_position(self):
+        job_queue = JobQueue(self.handler, num_workers=1)
+        running = job_queue.submit("first")
+        wait_until(lambda: running.status == RUNNING)
+        second = job_queue.submit("second")
+        third = job_queue.submit("third")
+
+        self.assertEqual(job_queue.queue_position(running.job_id), 0)
+        self.assertEqual(job_queue.queue_position(second.job_id), 1)
+        self.assertEqual(job_queue.queue_position(third.job_id), 2)
+        self.assertEqual(job_queue.queue_position("unknown"), 0)
+
+    def test_deployment_limit(self):
+        job_queue = JobQueue(self.handler, num_workers=4, deployment_limits={"dalle": 1})
+        jobs = [job_queue.submit(f"dalle {index}") for index in range(3)]
+        other = job_queue.submit("other", deployment="other")
+        wait_until(lambda: other.status == RUNNING)
+        time.sleep(0.1)
+
+        # One job per limited deployment, the unlimited one runs alongside it
+        self.assertEqual(sum(1 for job in jobs if job.status == RUNNING), 1)
+        self.handler.proceed.set()
+        wait_until(lambda: all(job.is_finished() for job in jobs))
+        self.assertEqual(self.handler.max_running["dalle"], 1)
+        self.assertTrue(all(job.status == DONE for job in jobs))
+
+    def test_cancelled_queued_job_never_runs(self):
+        job_queue = JobQueue(self.handler, num_workers=1)
+        running = job_queue.submit("first")
+        wait_until(lambda: running.status == RUNNING)
+        queued = job_queue.submit("second")
+
+        job_queue.cancel(queued.job_id)
+        self.handler.proceed.set()
+        wait_until(lambda: queued.is_finished())
+
+        self.assertEqual(queued.status, FAILED)
+        self.assertEqual(queued.error, "Cancelled")
+        self.assertEqual(self.handler.ran, ["first"])
+
+    def test_release(self):
+        job_queue = JobQueue(self.handler, num_workers=1)
+        running = job_queue.submit("running")
+        wait_until(lambda: running.status == RUNNING)
+
+        # A running job is dropped as soon as it finishes
+        job_queue.release(running.job_id)
+        self.assertIs(job_queue.get_job(running.job_id), running)
+        self.handler.proceed.set()
+        wait_until(lambda: running.is_finished())
+        self.assertIsNone(job_queue.get_job(running.job_id))
+
+        finished = job_queue.submit("finished")
+        wait_until(lambda: finished.is_finished())
+        self.assertEqual(job_queue.retained_bytes(), 1000)
+        job_queue.release(finished.job_id)
+        self.assertIsNone(job_queue.get_job(finished.job_id))
+        self.assertEqual(job_queue.retained_bytes(), 0)
+
+class CoalescingTest(unittest.TestCase):
+    """Identical prompts through a MemoryResultStore, with one deployment slot."""
+    def setUp(self):
+        self.release_slot = threading.Event()
+        self.generated = []
+
+    def make_queue(self, store):
+        def handler(job):
+            # "blocker" holds the only deployment slot until the test releases it
+            if job.description == "blocker":
+                self.release_slot.wait(10)
+                return {"filename": "blocker"}
+
+            self.generated.append(job.job_id)
+            if not job.claimed:
+                return {"filename": job.job_id}
+            return _run_as_leader(job, store, lambda on_event: {"filename": job.job_id}, lambda stage, payload: None)
+
+        return JobQueue(
+            handler,
+            num_workers=3,
+            deployment_limits={"dalle": 1},
+            result_store=store,
+            coalesce=lambda job: coalesce_generation_job(job, store)
+        )
+
+    def tearDown(self):
+        self.release_slot.set()
+
+    def test_cancelled_queued_leader_hands_over_its_claim(self):
+        store = MemoryResultStore(lease_seconds=30)
+        job_queue = self.make_queue(store)
+
+        blocker = job_queue.submit("blocker")
+        wait_until(lambda: blocker.started_at is not None)
+        leader = job_queue.submit("a knight")
+        wait_until(lambda: leader.claimed)
+        follower = job_queue.submit("a knight")
+        wait_until(lambda: follower.started_at is not None)
+
+        # The leader gives up its claim while still waiting for the slot, not when the lease runs out
+        job_queue.cancel(leader.job_id)
+        wait_until(lambda: leader.is_finished(), timeout=2)
+        self.assertEqual(leader.status, FAILED)
+        self.assertEqual(leader.error, "Cancelled")
+
+        # The follower takes the prompt over and generates it once the slot is free
+        wait_until(lambda: follower.claimed, timeout=2)
+        self.release_slot.set()
+        wait_until(lambda: follower.is_finished(), timeout=2)
+        self.assertEqual(follower.status, DONE)
+        self.assertEqual(self.generated, [follower.job_id])
+
+    def test_leader_keeps_its_lease_while_waiting_for_a_slot(self):
+        store = MemoryResultStore(lease_seconds=0.6)
+        job_queue = self.make_queue(store)
+
+        blocker = job_queue.submit("blocker")
+        wait_until(lambda: blocker.started_at is not None)
+        leader = job_queue.submit("a knight")
+        wait_until(lambda: leader.claimed)
+        follower = job_queue.submit("a knight")
+
+        # Hold the slot for several leases, the follower must keep waiting for the leader
+        time.sleep(2.0)
+        self.assertFalse(follower.claimed)
+        self.release_slot.set()
+        wait_until(lambda: leader.is_finished() and follower.is_finished())
+
+        self.assertEqual(self.generated, [leader.job_id])
+        self.assertEqual(follower.result["filename"], leader.job_id)
+
+if __name__ == "__main__":
+    unittest.main()
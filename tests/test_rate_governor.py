@@ -0,0 +1,114 @@
+"""
+Tests of the rate governor's circuit breaker.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+import threading
+import time
+import unittest
+from rate_governor import CircuitBreaker, CircuitOpenError, RateGovernor
+
+class StatusError(Exception):
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+def failing(status_code, times):
+    """Return a callable that raises StatusError(status_code) times times, then returns "ok"."""
+    calls = []
+
+    def call():
+        calls.append(status_code)
+        if len(calls) <= times:
+            raise StatusError(status_code)
+        return "ok"
+
+    return call
+
+class RateGovernorTest(unittest.TestCase):
+    def governor(self, max_retries=3, circuit_failures=3):
+        return RateGovernor("test", max_retries=max_retries, base_delay=0, circuit_failures=circuit_failures)
+
+    def test_retried_throttles_do_not_open_the_breaker(self):
+        governor = self.governor()
+        for _ in range(3):
+            self.assertEqual(governor.call(failing(429, 3)), "ok")
+
+        self.assertEqual(governor.stats()["throttles"], 9)
+        self.assertEqual(governor.stats()["circuit_opens"], 0)
+
+    def test_exhausted_throttled_call_counts_once(self):
+        governor = self.governor(max_retries=2, circuit_failures=2)
+        with self.assertRaises(StatusError):
+            governor.call(failing(429, 10))
+        self.assertEqual(governor.breaker._failures, 1)
+
+        with self.assertRaises(StatusError):
+            governor.call(failing(429, 10))
+        with self.assertRaises(CircuitOpenError):
+            governor.call(failing(429, 0))
+
+    def test_server_errors_count_every_attempt(self):
+        governor = self.governor(max_retries=5, circuit_failures=3)
+        with self.assertRaises(CircuitOpenError):
+            governor.call(failing(500, 10))
+        self.assertEqual(governor.stats()["circuit_opens"], 1)
+
+    def test_rejected_requests_do_not_count(self):
+        governor = self.governor(circuit_failures=1)
+        with self.assertRaises(StatusError):
+            governor.call(failing(400, 1))
+        self.assertEqual(governor.breaker._failures, 0)
+
+class CircuitBreakerTest(unittest.TestCase):
+    def open_breaker(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_seconds=0.05)
+        breaker.record_failure()
+        self.assertRaises(CircuitOpenError, breaker.check)
+        time.sleep(0.06)
+        return breaker
+
+    def check_from_other_thread(self, breaker):
+        outcome = []
+
+        def check():
+            try:
+                breaker.check()
+                outcome.append("passed")
+            except CircuitOpenError:
+                outcome.append("open")
+
+        thread = threading.Thread(target=check)
+        thread.start()
+        thread.join()
+        return outcome[0]
+
+    def test_half_open_lets_a_single_trial_through(self):
+        breaker = self.open_breaker()
+        breaker.check()
+        # The trial's own retries pass, every other caller still fails fast
+        breaker.check()
+        self.assertEqual(self.check_from_other_thread(breaker), "open")
+
+        breaker.record_success()
+        self.assertEqual(self.check_from_other_thread(breaker), "passed")
+
+    def test_failed_trial_reopens(self):
+        breaker = self.open_breaker()
+        breaker.check()
+        breaker.record_failure()
+
+        self.assertRaises(CircuitOpenError, breaker.check)
+        self.assertEqual(breaker.opens, 2)
+
+    def test_released_trial_lets_another_through(self):
+        breaker = self.open_breaker()
+        breaker.check()
+        breaker.release_trial()
+
+        self.assertEqual(self.check_from_other_thread(breaker), "passed")
+        self.assertEqual(self.check_from_other_thread(breaker), "open")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,44 @@
+"""
+Tests of the short link store.
+
+Run from the repository root:
+    python -m pytest tests
+"""
+import time
+import unittest
+from short_links import ShortLinkService
+
+class ShortLinkServiceTest(unittest.TestCase):
+    def count(self, service):
+        return service._connection.execute("SELECT COUNT(*) FROM short_links").fetchone()[0]
+
+    def test_resolves_until_expired(self):
+        service = ShortLinkService(":memory:", "HTTP://EVENT:8503/")
+        live = service.shorten("https://example.com/live.png", time.time() + 60)
+        expired = service.shorten("https://example.com/old.png", time.time() - 1)
+
+        self.assertTrue(live.startswith("HTTP://EVENT:8503/"))
+        self.assertEqual(service.resolve(live.rsplit("/", 1)[-1].lower()), "https://example.com/live.png")
+        self.assertIsNone(service.resolve(expired.rsplit("/", 1)[-1]))
+
+    def test_expired_links_are_pruned_while_shortening(self):
+        service = ShortLinkService(":memory:", "HTTP://EVENT:8503", prune_every=3)
+        service.shorten("https://example.com/1.png", time.time() - 1)
+        service.shorten("https://example.com/2.png", time.time() - 1)
+        self.assertEqual(self.count(service), 2)
+
+        # The third insert prunes the two expired links
+        service.shorten("https://example.com/3.png", time.time() + 60)
+        self.assertEqual(self.count(service), 1)
+
+    def test_prune_expired(self):
+        service = ShortLinkService(":memory:", "HTTP://EVENT:8503", prune_every=0)
+        for index in range(5):
+            service.shorten(f"https://example.com/{index}.png", time.time() - 1)
+
+        self.assertEqual(self.count(service), 5)
+        self.assertEqual(service.prune_expired(), 5)
+        self.assertEqual(self.count(service), 0)
+
+if __name__ == "__main__":
+    unittest.main()
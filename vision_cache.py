@@ -0,0 +1,124 @@
+"""
+Cache of vision analyses keyed by a perceptual hash of the webcam capture.
+Guests often retake almost the same shot; a retake whose difference hash is within a few
+bits of a recent capture reuses that capture's feature list instead of calling the model.
+
+Captures only match within their scope (the guest's session), since two guests in front of
+the same kiosk background can hash only a few bits apart. Reuse across scopes is opt-in,
+with its own, much tighter threshold.
+"""
+import io
+import threading
+import time
+from collections import OrderedDict
+from PIL import Image, ImageOps
+from telemetry import increment
+
+def difference_hash(image_bytes, hash_size=16):
+    """
+    Return the dHash of an image: one bit per horizontally adjacent pixel pair of a
+    (hash_size + 1) x hash_size grayscale thumbnail, set where brightness increases.
+
+    Small changes (noise, recompression, exposure, a slight shift) flip few bits.
+    """
+    image = Image.open(io.BytesIO(image_bytes))
+    # Let the JPEG decoder downscale while decoding, the thumbnail is tiny anyway
+    image.draft("L", (hash_size * 8, hash_size * 8))
+    image = ImageOps.exif_transpose(image).convert("L").resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+
+    pixels = image.tobytes()
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for column in range(hash_size):
+            value = (value << 1) | (pixels[offset + column + 1] > pixels[offset + column])
+    return value
+
+def hamming_distance(first, second):
+    return bin(first ^ second).count("1")
+
+class VisionCache:
+    def __init__(self, max_entries=64, ttl_seconds=300, threshold=8, hash_size=16, shared_threshold=None):
+        """
+        Args:
+            max_entries (int): Captures kept, least recently used first out
+            ttl_seconds (float): Age after which a capture no longer matches
+            threshold (int): Largest Hamming distance treated as the same shot within a scope, out of hash_size ** 2 bits
+            hash_size (int): Side of the hash grid
+            shared_threshold (int): Largest distance matched across scopes, None to never reuse another scope's analysis
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.hash_size = hash_size
+        self.shared_threshold = shared_threshold
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def hash_image(self, image_bytes):
+        return difference_hash(image_bytes, self.hash_size)
+
+    def lookup(self, image_hash, model_id, scope):
+        """Return the features of the closest recent capture of the scope within threshold, or None.
+
+        With shared_threshold set, captures of other scopes within that distance match too.
+        """
+        with self._lock:
+            self._evict_expired()
+            best_key, best_distance = None, None
+            for key, entry in self._entries.items():
+                if entry["model_id"] != model_id:
+                    continue
+                threshold = self.threshold if entry["scope"] == scope else self.shared_threshold
+                if threshold is None:
+                    continue
+                distance = hamming_distance(image_hash, entry["hash"])
+                if distance <= threshold and (best_distance is None or distance < best_distance):
+                    best_key, best_distance = key, distance
+
+            if best_key is None:
+                self.misses += 1
+                increment("vision_cache_misses")
+                return None
+
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            increment("vision_cache_hits")
+            return self._entries[best_key]["features"]
+
+    def store(self, image_hash, model_id, scope, features):
+        with self._lock:
+            key = (image_hash, model_id, scope)
+            self._entries[key] = {
+                "hash": image_hash,
+                "model_id": model_id,
+                "scope": scope,
+                "features": features,
+                "created_at": time.time()
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        """Return hit/miss/eviction counters, the hit rate and the number of cached captures."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries)
+            }
+
+    def _evict_expired(self):
+        cutoff = time.time() - self.ttl_seconds
+        expired = [key for key, entry in self._entries.items() if entry["created_at"] < cutoff]
+        for key in expired:
+            del self._entries[key]
+            self.evictions += 1
@@ -0,0 +1,117 @@
+"""
+Warm pool of pre-generated characters for popular prompts.
+While the app is idle a background thread generates, frames and uploads characters for a
+configured list of prompts, so a matching request can be answered instantly.
+"""
+import threading
+import time
+from result_cache import FRESH, normalize_description
+
+class WarmPool:
+    def __init__(self, generator, prompts, target_per_prompt=1, rate_per_minute=2, is_idle=None, idle_poll_seconds=5, max_age_seconds=12 * 3600):
+        """
+        Args:
+            generator: Object with generate_minecraft_image() and build_link(), normally a DalleImageGenerator
+            prompts (list): Prompts to keep ready
+            target_per_prompt (int): Number of ready characters kept for each prompt
+            rate_per_minute (float): Maximum number of background generations per minute
+            is_idle (callable): Returns True when the pool may use the deployment, always idle if omitted
+            idle_poll_seconds (float): How often to check again when busy or full
+            max_age_seconds (float): Ready characters older than this are dropped, before their blobs are swept
+        """
+        self.generator = generator
+        self.prompts = {normalize_description(prompt): prompt for prompt in prompts}
+        self.target_per_prompt = target_per_prompt
+        self.min_interval = 60.0 / rate_per_minute
+        self.is_idle = is_idle or (lambda: True)
+        self.idle_poll_seconds = idle_poll_seconds
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.failures = 0
+        self._ready = {key: [] for key in self.prompts}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_generation = 0.0
+
+    def start(self):
+        """Start replenishing the pool in a background thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="warm-pool", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop the background thread after its current generation."""
+        self._stop.set()
+
+    def take(self, description):
+        """
+        Hand out a ready character for description, or None if the pool has none.
+
+        The blob URL and QR code are signed again so the guest gets a full SAS lifetime.
+        """
+        key = normalize_description(description)
+
+        with self._lock:
+            self._drop_stale()
+            ready = self._ready.get(key)
+            if not ready:
+                self.misses += 1
+                return None
+            _, result = ready.pop(0)
+            self.hits += 1
+
+        link = self.generator.build_link(result["filename"])
+        result["blob_url"] = link["blob_url"]
+        result["qr_bytes"] = link["qr_bytes"]
+        result["cached"] = True
+        return result
+
+    def stats(self):
+        """Return the pool size per prompt and the hit/miss counters."""
+        with self._lock:
+            return {
+                "ready": {self.prompts[key]: len(ready) for key, ready in self._ready.items()},
+                "hits": self.hits,
+                "misses": self.misses,
+                "generated": self.generated,
+                "failures": self.failures
+            }
+
+    def _drop_stale(self):
+        cutoff = time.time() - self.max_age_seconds
+        for key, ready in self._ready.items():
+            self._ready[key] = [entry for entry in ready if entry[0] >= cutoff]
+
+    def _next_prompt(self):
+        # Refill the prompt with the fewest ready characters first
+        with self._lock:
+            self._drop_stale()
+            key, ready = min(self._ready.items(), key=lambda item: len(item[1]))
+            if len(ready) >= self.target_per_prompt:
+                return None
+            return key
+
+    def _run(self):
+        while not self._stop.is_set():
+            key = self._next_prompt() if self.prompts else None
+            wait = self._last_generation + self.min_interval - time.monotonic()
+
+            if key is None or wait > 0 or not self.is_idle():
+                self._stop.wait(max(wait, self.idle_poll_seconds) if key is not None else self.idle_poll_seconds)
+                continue
+
+            self._last_generation = time.monotonic()
+            try:
+                result = self.generator.generate_minecraft_image(self.prompts[key], cache_policy=FRESH)
+            except Exception as e:
+                print(f"Warm pool generation failed for '{self.prompts[key]}': {e}")
+                self.failures += 1
+                continue
+
+            with self._lock:
+                self._ready[key].append((time.time(), result))
+                self.generated += 1
+            print(f"Warm pool ready for '{self.prompts[key]}' ({len(self._ready[key])}/{self.target_per_prompt})")
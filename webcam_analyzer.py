@@ -1,11 +1,34 @@
-import base64
-from azure.ai.inference import ChatCompletionsClient
-from azure.core.credentials import AzureKeyCredential
+import threading
+import time
 import os
-from models_config import get_env_variable_keys
+from models_config import get_env_variable_keys, get_rate_limit_config
+from service_registry import get_rate_governor, get_capture_preprocessor, get_vision_cache
+from telemetry import span, observe
+
+# Rough token cost of the prompt and image, used for the TPM budget
+PROMPT_TOKEN_ESTIMATE = 1000
+
+# Longest description the model may return
+MAX_TOKENS = 200
+
+SYSTEM_PROMPT = """Analyze the provided photo of a person and extract:
+
+- Gender (choose boy or girl only)
+- Approximate age
+- Facial features (e.g., eye color, shape of eyes, nose, mouth, etc.)
+- Hair (e.g., color, length, style, etc.)
+- Skin tone
+- Any distinguishing marks (e.g., scars, birthmarks, tattoos, etc.)
+- Accessories (e.g., glasses, earrings, etc.)
+
+Your answer must be ONLY a single and concise comma separated list of features without additional explanation.
+
+If you don't find some of the features omit them in the answer: Don't say something like 'no visible marks'.
+
+You may encounter more than one person. Output the features of all of them separated by 'and'."""
 
 class WebcamAnalyzer:
-    def __init__(self, model_id="mistral"):
+    def __init__(self, model_id="mistral", preprocessor=None):
         """Initialize the webcam analyzer with the LLM model."""
         self.model_id = model_id
         env_keys = get_env_variable_keys(self.model_id)
@@ -18,38 +41,139 @@ class WebcamAnalyzer:
             missing = [key for key, val in env_keys.items() if not os.getenv(val)]
             raise ValueError(f"Missing environment variables: {', '.join(missing)}")
         
-    def analyze_face(self, image_bytes):
+        self.governor = get_rate_governor(self.model_id)
+        self.preprocessor = preprocessor or get_capture_preprocessor()
+        self.cache = get_vision_cache()
+        self._client = None
+        self._lock = threading.Lock()
+    
+    def get_client(self):
+        """Return the inference client, creating it once so its connection pool is reused."""
+        if self._client is not None:
+            return self._client
+        
+        with self._lock:
+            if self._client is None:
+                # The SDK is imported on first use, it is slow to import
+                from azure.ai.inference import ChatCompletionsClient
+                from azure.core.credentials import AzureKeyCredential
+                
+                # Retries are handled by the deployment's RateGovernor, not by the SDK
+                self._client = ChatCompletionsClient(
+                    endpoint=self.endpoint,
+                    credential=AzureKeyCredential(self.api_key),
+                    retry_total=0,
+                    read_timeout=get_rate_limit_config(self.model_id)["timeout"]
+                )
+        
+        return self._client
+        
+    def analyze_face(self, image_bytes, session_id=None):
         """
         Analyze the facial features from a webcam image using Azure AI Inference API.
+
+        Args:
+            image_bytes (bytes): The webcam capture
+            session_id (str): The guest's session; a near-identical retake in the same session reuses
+                the earlier analysis. Without it the cache is not used.
         """
-        # Create client with endpoint and key
-        client = ChatCompletionsClient(
-            endpoint=self.endpoint,
-            credential=AzureKeyCredential(self.api_key)
-        )
+        # A near-identical retake reuses the features of the earlier shot
+        image_hash, features = self._cached_features(image_bytes, session_id)
+        if features is not None:
+            return features
+        
+        # Reuse the shared client
+        client = self.get_client()
         
-        # Convert image to base64 for inclusion in the prompt
-        image_b64 = base64.b64encode(image_bytes).decode('utf-8')
+        # Downscale and re-encode the capture, then convert it to base64 for inclusion in the prompt
+        with span("vision_prepare"):
+            image_b64, mime_type = self.preprocessor.prepare(image_bytes)
+        
+        try:
+            # Call the model
+            with span("vision_analyze", model=self.model_id, payload_bytes=len(image_b64)):
+                response = self.governor.call(
+                    client.complete,
+                    tokens=PROMPT_TOKEN_ESTIMATE + MAX_TOKENS,
+                    model=self.deployment_name,
+                    messages=self._build_messages(image_b64, mime_type),
+                    temperature=0.7,
+                    max_tokens=MAX_TOKENS,
+                    top_p=1.0
+                )
+            
+            # Return the description
+            content = response.choices[0].message.content.strip()
+            if image_hash is not None:
+                self.cache.store(image_hash, self.model_id, session_id, content)
+            return content
+        except Exception as e:
+            print(f"Error calling Azure AI model: {str(e)}")
+            raise Exception(f"Error analyzing image: {str(e)}")
+    
+    def analyze_face_stream(self, image_bytes, session_id=None):
+        """
+        Like analyze_face, but yield the description in pieces as the model produces them.
+        A cached analysis is yielded in one piece.
+        """
+        image_hash, features = self._cached_features(image_bytes, session_id)
+        if features is not None:
+            yield features
+            return
         
-        # Prepare message for the model
-        messages = [
+        client = self.get_client()
+        
+        with span("vision_prepare"):
+            image_b64, mime_type = self.preprocessor.prepare(image_bytes)
+        
+        try:
+            with span("vision_analyze", model=self.model_id, payload_bytes=len(image_b64), stream=True):
+                start = time.perf_counter()
+                # The governor paces and retries opening the stream, not reading it
+                response = self.governor.call(
+                    client.complete,
+                    tokens=PROMPT_TOKEN_ESTIMATE + MAX_TOKENS,
+                    stream=True,
+                    model=self.deployment_name,
+                    messages=self._build_messages(image_b64, mime_type),
+                    temperature=0.7,
+                    max_tokens=MAX_TOKENS,
+                    top_p=1.0
+                )
+                
+                pieces = []
+                with response:
+                    for update in response:
+                        if not update.choices or not update.choices[0].delta.content:
+                            continue
+                        if not pieces:
+                            observe("vision_first_token", time.perf_counter() - start)
+                        pieces.append(update.choices[0].delta.content)
+                        yield pieces[-1]
+            
+            content = "".join(pieces).strip()
+            if image_hash is not None and content:
+                self.cache.store(image_hash, self.model_id, session_id, content)
+        except Exception as e:
+            print(f"Error calling Azure AI model: {str(e)}")
+            raise Exception(f"Error analyzing image: {str(e)}")
+    
+    def _cached_features(self, image_bytes, session_id):
+        # Returns (perceptual hash or None, cached features or None)
+        if self.cache is None or session_id is None:
+            return None, None
+        image_hash = self.cache.hash_image(image_bytes)
+        features = self.cache.lookup(image_hash, self.model_id, session_id)
+        if features is not None:
+            print("Reusing the features of a near-identical capture")
+        return image_hash, features
+    
+    @staticmethod
+    def _build_messages(image_b64, mime_type):
+        return [
             {
                 "role": "system", 
-                "content": """Analyze the provided photo of a person and extract:
-
-- Gender (choose boy or girl only)
-- Approximate age
-- Facial features (e.g., eye color, shape of eyes, nose, mouth, etc.)
-- Hair (e.g., color, length, style, etc.)
-- Skin tone
-- Any distinguishing marks (e.g., scars, birthmarks, tattoos, etc.)
-- Accessories (e.g., glasses, earrings, etc.)
-
-Your answer must be ONLY a single and concise comma separated list of features without additional explanation.
-
-If you don't find some of the features omit them in the answer: Don't say something like 'no visible marks'.
-
-You may encounter more than one person. Output the features of all of them separated by 'and'."""
+                "content": SYSTEM_PROMPT
             },
             {
                 "role": "user", 
@@ -61,26 +185,21 @@ You may encounter more than one person. Output the features of all of them separ
                     {
                         "type": "image_url",
                         "image_url": {
-                            "url": f"data:image/jpeg;base64,{image_b64}"
+                            "url": f"data:{mime_type};base64,{image_b64}"
                         }
                     }
                 ]
             }
         ]
-        
-        try:
-            # Call the model
-            response = client.complete(
-                model=self.deployment_name,
-                messages=messages,
-                temperature=0.7,
-                max_tokens=200,
-                top_p=1.0
-            )
-            
-            # Return the description
-            content = response.choices[0].message.content.strip()
-            return content
-        except Exception as e:
-            print(f"Error calling Azure AI model: {str(e)}")
-            raise Exception(f"Error analyzing image: {str(e)}")
+
+def features_look_complete(text, pieces, token_budget):
+    """
+    Guess whether a streaming feature list is finished before the stream ends.
+
+    The list is judged complete once it ends a sentence or line, or once the
+    pieces received reach token_budget (roughly one token per piece).
+    """
+    stripped = text.rstrip(" ")
+    if not stripped.strip():
+        return False
+    return stripped[-1] in ".!\n" or pieces >= token_budget